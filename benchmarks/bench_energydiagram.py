@@ -0,0 +1,315 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks of the construction and of the rendering of energy diagrams.
+
+Synthetic diagrams with N levels, links, arrows and electron boxes are built
+for every size and the phases are timed separately: construction with
+add_level/add_link/add_arrow/add_electronbox, bulk construction with
+add_levels, ED.plot and savefig for every output format. Only the API of the
+first releases is used for the phases that can be compared with them: the
+bulk construction is skipped when add_levels is missing and the diagrams are
+plotted on an axes created here, without pyplot. The peak memory of every
+phase is measured in a second run with tracemalloc, which would slow down
+the timings.
+
+The results are written as JSON and can be compared with a baseline, e.g.
+run on a checkout of an older release:
+
+    python benchmarks/bench_energydiagram.py --output 1.0.json
+    python benchmarks/bench_energydiagram.py --compare 1.0.json
+
+@author: giacomo
+"""
+
+import argparse
+import gc
+import io
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import matplotlib  # noqa: E402
+
+matplotlib.use("Agg")
+
+from energydiagram import ED  # noqa: E402
+
+SIZES = (10, 100, 1000, 10000, 100000)
+FORMATS = ("png", "svg", "pdf")
+# add_levels and batch_rendering are missing in the first releases
+HAS_BULK = hasattr(ED, "add_levels")
+
+
+def make_data(n, seed=0):
+    """Random content of a diagram with n levels.
+
+    The columns hold 2.5 levels on average, every level is linked to a level
+    of the next column and there is an arrow every 100 levels and an electron
+    box every 50 levels.
+
+    Args:
+        n (int): Number of levels.
+        seed (int, optional): Seed of the random generator. Defaults to 0.
+
+    Returns:
+        dict: energies, positions, bottom_texts, links, arrows and boxes.
+    """
+    rng = np.random.default_rng(seed)
+    energies = np.round(rng.normal(0.0, 20.0, n), 1)
+    new_column = rng.random(n) < 0.4
+    new_column[0] = True
+    positions = np.cumsum(new_column) - 1
+    starts = np.flatnonzero(new_column)
+    # first level of the column following the one of every level
+    following = np.append(starts[1:], -1)[positions]
+    links = [
+        (int(i), int(j), int(rng.integers(1, 4)))
+        for i, j in enumerate(following)
+        if j >= 0
+    ]
+    arrows = [(i, (i + 1) % n) for i in range(0, n, 100) if n > 1]
+    boxes = [
+        (i, int(rng.integers(1, 4)), int(rng.integers(0, 7))) for i in range(0, n, 50)
+    ]
+    return {
+        "energies": energies,
+        "positions": positions,
+        "bottom_texts": ["L%d" % i for i in range(n)],
+        "links": links,
+        "arrows": arrows,
+        "boxes": boxes,
+    }
+
+
+def build(data):
+    """Build the diagram level by level, as most scripts do."""
+    diagram = ED()
+    previous = -1
+    for energy, position, text in zip(
+        data["energies"], data["positions"], data["bottom_texts"]
+    ):
+        diagram.add_level(float(energy), text, "last" if position == previous else None)
+        previous = position
+    _add_edges(diagram, data)
+    return diagram
+
+
+def build_bulk(data):
+    """Build the diagram with a single call to add_levels."""
+    diagram = ED()
+    diagram.add_levels(
+        data["energies"], positions=data["positions"], bottom_texts=data["bottom_texts"]
+    )
+    _add_edges(diagram, data)
+    return diagram
+
+
+def _add_edges(diagram, data):
+    for start, end, line_order in data["links"]:
+        diagram.add_link(start, end, line_order=line_order)
+    for start, end in data["arrows"]:
+        diagram.add_arrow(start, end)
+    for level_id, boxes, electrons in data["boxes"]:
+        diagram.add_electronbox(level_id, boxes, electrons, 3, 3)
+
+
+def new_axes(aspect):
+    """Return an axes of a figure that is not managed by pyplot."""
+    from matplotlib.figure import Figure
+
+    return Figure().add_subplot(111, aspect=aspect)
+
+
+def phases(n, formats, batch_rendering=True, bulk=HAS_BULK):
+    """Yield (name, function) for every phase of the benchmark.
+
+    The functions of a size must run in order, as the rendering phases use
+    the diagram built by the last construction phase.
+    """
+    data = make_data(n)
+    state = {}
+
+    def construct():
+        state["diagram"] = build(data)
+        if HAS_BULK:
+            state["diagram"].batch_rendering = batch_rendering
+
+    def construct_bulk():
+        state["diagram"] = build_bulk(data)
+        state["diagram"].batch_rendering = batch_rendering
+
+    def plot():
+        diagram = state["diagram"]
+        diagram.plot(ax=new_axes(diagram.aspect))
+
+    yield "construct", construct
+    if bulk:
+        yield "construct_bulk", construct_bulk
+    yield "plot", plot
+    for fmt in formats:
+
+        def save(fmt=fmt):
+            state["diagram"].fig.savefig(io.BytesIO(), format=fmt)
+
+        yield "savefig_" + fmt, save
+
+
+def run(sizes, formats, repeat=3, memory=True, batch_rendering=True, bulk=HAS_BULK):
+    """Run the benchmarks.
+
+    Args:
+        sizes (list): Numbers of levels.
+        formats (list): Output formats of savefig.
+        repeat (int, optional): Runs of every size, the fastest is kept.
+            Defaults to 3.
+        memory (bool, optional): Measure the peak memory of every phase.
+            Defaults to True.
+        batch_rendering (bool, optional): Value of ED.batch_rendering.
+            Defaults to True.
+        bulk (bool, optional): Time the construction with add_levels and
+            plot the diagram built by it. Defaults to True if add_levels
+            exists.
+
+    Returns:
+        dict: The results, keyed by "<phase>/<size>".
+    """
+    results = {}
+    for n in sizes:
+        for _ in range(repeat):
+            for name, function in phases(n, formats, batch_rendering, bulk):
+                gc.collect()
+                start = time.perf_counter()
+                function()
+                seconds = time.perf_counter() - start
+                key = "%s/%d" % (name, n)
+                best = results.setdefault(key, {"phase": name, "size": n})
+                best["seconds"] = min(seconds, best.get("seconds", seconds))
+            print("%8d levels  %s" % (n, _summary(results, n)), file=sys.stderr)
+        if memory:
+            for name, function in phases(n, formats, batch_rendering, bulk):
+                gc.collect()
+                tracemalloc.start()
+                function()
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                results["%s/%d" % (name, n)]["peak_bytes"] = peak
+    return results
+
+
+def _summary(results, n):
+    return "  ".join(
+        "%s %.3fs" % (item["phase"], item["seconds"])
+        for item in results.values()
+        if item["size"] == n
+    )
+
+
+def environment():
+    """Versions and machine the benchmarks ran on."""
+    try:
+        from importlib.metadata import version
+
+        package = version("energydiagram")
+    except Exception:
+        package = None
+    return {
+        "energydiagram": package,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "matplotlib": matplotlib.__version__,
+        "machine": platform.machine(),
+        "system": platform.system(),
+        "cpus": os.cpu_count(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def compare(results, baseline, tolerance=1.25):
+    """Print the ratios of the timings with the baseline.
+
+    Args:
+        results (dict): Results of run.
+        baseline (dict): Results of a previous run.
+        tolerance (float, optional): Ratio above which a phase is a
+            regression. Defaults to 1.25.
+
+    Returns:
+        list: The keys of the regressions.
+    """
+    regressions = []
+    print("%-24s %12s %12s %8s" % ("phase/size", "baseline", "current", "ratio"))
+    for key, item in results.items():
+        if key not in baseline:
+            continue
+        old = baseline[key]["seconds"]
+        new = item["seconds"]
+        ratio = new / old if old else float("inf")
+        flag = ""
+        if ratio > tolerance:
+            regressions.append(key)
+            flag = "  REGRESSION"
+        print("%-24s %11.4fs %11.4fs %8.2f%s" % (key, old, new, ratio, flag))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--sizes",
+        type=lambda text: [int(n) for n in text.split(",")],
+        default=list(SIZES),
+        help="comma separated numbers of levels (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--formats",
+        type=lambda text: text.split(","),
+        default=list(FORMATS),
+        help="comma separated savefig formats (default: %(default)s)",
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--no-memory", action="store_true")
+    parser.add_argument(
+        "--legacy", action="store_true", help="plot with batch_rendering off"
+    )
+    parser.add_argument(
+        "--no-bulk",
+        action="store_true",
+        help="build with add_level only, as the first releases",
+    )
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="JSON file of a baseline run")
+    parser.add_argument("--tolerance", type=float, default=1.25)
+    args = parser.parse_args(argv)
+
+    results = run(
+        args.sizes,
+        args.formats,
+        repeat=args.repeat,
+        memory=not args.no_memory,
+        batch_rendering=not args.legacy,
+        bulk=HAS_BULK and not args.no_bulk,
+    )
+    report = {"environment": environment(), "results": results}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+        if compare(results, baseline, args.tolerance):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,4 +5,8 @@ Created on Mon Nov 25 12:56:47 2019
 
 @author: giacomo
 """
-from .energydiagram import ED
\ No newline at end of file
+
+from .energydiagram import ED
+from .batch import render_many
+from .cache import RenderCache
+from .grid import EDGrid
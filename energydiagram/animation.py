@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming of animation frames to video and GIF files.
+
+The frames are the RGBA buffers of an Agg canvas and are written as soon as
+they are rendered, so an animation of thousands of frames never holds more
+than one frame in memory. Videos are encoded by an ffmpeg process reading
+raw frames from a pipe, GIFs by Pillow one frame at a time, with the palette
+of the first frame and only the region that changed since the previous
+frame.
+
+@author: giacomo
+"""
+
+import os
+import shutil
+import subprocess
+
+import numpy as np
+
+
+class GifStream:
+    """Write the frames of an animated GIF as they are rendered.
+
+    The frames are encoded one at a time with the getheader and getdata
+    functions of the GIF plugin of Pillow (9.1 or newer, the gif extra of
+    the package), Image.save would keep all the frames until the end.
+
+    Args:
+        filename (str): The GIF file.
+        fps (float): Frames per second.
+        loop (int, optional): Times the animation is repeated, 0 forever.
+            Defaults to 0.
+    """
+
+    def __init__(self, filename, fps, loop=0):
+        try:
+            from PIL import GifImagePlugin, Image
+        except ImportError as err:
+            raise ImportError("Writing GIF files requires Pillow") from err
+        if not hasattr(Image, "Dither"):
+            raise ImportError("Writing GIF files requires Pillow 9.1 or newer")
+        self._gif = GifImagePlugin
+        self._image = Image
+        self.filename = filename
+        self.duration = 1000.0 / fps
+        self.loop = loop
+        self._file = open(filename, "wb")
+        self._palette = None
+        self._previous = None
+
+    def write(self, rgba):
+        """Append a frame given as a (height, width, 4) uint8 array."""
+        GifImagePlugin, Image = self._gif, self._image
+        image = Image.fromarray(np.asarray(rgba)[..., :3], "RGB")
+        if self._palette is None:
+            # the colors of a diagram do not change between the frames
+            self._palette = image.quantize(dither=Image.Dither.NONE)
+            header, _ = GifImagePlugin.getheader(
+                self._palette, info={"loop": self.loop}
+            )
+            self._file.write(b"".join(header))
+            frame = self._palette
+        else:
+            frame = image.quantize(palette=self._palette, dither=Image.Dither.NONE)
+        indices = np.asarray(frame)
+        offset = (0, 0)
+        if self._previous is not None:
+            rows, columns = np.nonzero(indices != self._previous)
+            if len(rows):
+                box = (columns.min(), rows.min(), columns.max() + 1, rows.max() + 1)
+            else:
+                box = (0, 0, 1, 1)
+            offset = (int(box[0]), int(box[1]))
+            frame = frame.crop(tuple(map(int, box)))
+        self._previous = indices
+        data = GifImagePlugin.getdata(frame, offset, duration=self.duration)
+        self._file.write(b"".join(data))
+
+    def close(self):
+        """Write the trailer and close the file."""
+        if not self._file.closed:
+            self._file.write(b";")
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class FFmpegStream:
+    """Pipe the frames to an ffmpeg process encoding a video.
+
+    Args:
+        filename (str): The video file, ffmpeg chooses the format from its
+            extension.
+        fps (float): Frames per second.
+        size (tuple): The (width, height) of the frames in pixels.
+        codec (str, optional): The video codec, e.g. "h264". Defaults to the
+            one of ffmpeg for the format.
+        extra_args (list, optional): More output options of ffmpeg.
+
+    Raises:
+        RuntimeError: If ffmpeg is not installed. The executable is the
+            matplotlib rcParams["animation.ffmpeg_path"].
+    """
+
+    def __init__(self, filename, fps, size, codec=None, extra_args=None):
+        from matplotlib import rcParams
+
+        executable = shutil.which(rcParams["animation.ffmpeg_path"])
+        if executable is None:
+            raise RuntimeError(
+                "ffmpeg is needed to write %s, save a GIF or install it"
+                % os.path.basename(filename)
+            )
+        self.filename = filename
+        self.command = ffmpeg_command(
+            executable, filename, fps, size, codec, extra_args
+        )
+        self._process = subprocess.Popen(
+            self.command, stdin=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+
+    def write(self, rgba):
+        """Append a frame given as a (height, width, 4) uint8 array."""
+        self._process.stdin.write(memoryview(np.ascontiguousarray(rgba)).cast("B"))
+
+    def close(self):
+        """Wait for ffmpeg to encode the last frames.
+
+        Raises:
+            RuntimeError: If ffmpeg failed.
+        """
+        if self._process.stdin.closed:
+            return
+        self._process.stdin.close()
+        error = self._process.stderr.read()
+        if self._process.wait():
+            raise RuntimeError(
+                "ffmpeg failed writing %s: %s"
+                % (self.filename, error.decode(errors="replace").strip())
+            )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def ffmpeg_command(executable, filename, fps, size, codec=None, extra_args=None):
+    """Return the command line of ffmpeg reading raw RGBA frames of the
+    given (width, height) size from its standard input."""
+    command = [executable, "-y", "-loglevel", "error"]
+    command += ["-f", "rawvideo", "-pix_fmt", "rgba", "-s", "%dx%d" % tuple(size)]
+    command += ["-framerate", str(fps), "-i", "pipe:"]
+    if codec is not None:
+        command += ["-vcodec", codec]
+    if os.path.splitext(filename)[1].lower() != ".gif":
+        # most players need even sizes and yuv420p
+        command += ["-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2", "-pix_fmt", "yuv420p"]
+    command += list(extra_args or ())
+    command.append(filename)
+    return command
+
+
+def open_stream(filename, fps, size, **kwargs):
+    """Return the stream writing the frames to filename, a GifStream for
+    .gif files and an FFmpegStream otherwise.
+
+    Args:
+        filename (str): The output file.
+        fps (float): Frames per second.
+        size (tuple): The (width, height) of the frames in pixels.
+        **kwargs: loop for GIFs, codec and extra_args for ffmpeg.
+    """
+    if os.path.splitext(filename)[1].lower() == ".gif":
+        return GifStream(filename, fps, **kwargs)
+    return FFmpegStream(filename, fps, size, **kwargs)
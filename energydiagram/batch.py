@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""
+Headless rendering of many diagrams.
+
+The diagrams are pickled to a pool of processes, every process draws them
+on a pooled matplotlib Figure with an Agg canvas that is never registered in
+pyplot, so the renders do not share any global state.
+
+@author: giacomo
+"""
+
+import os
+
+# figures reused by the renders of this process
+_figure_pool = None
+
+
+def render_bytes(diagram, fmt="png", dpi=None, **plot_kwargs):
+    """Render a diagram without pyplot and return the file content.
+
+    Args:
+        diagram (ED): The diagram to render.
+        fmt (str, optional): The file format, any format supported by
+            savefig. Defaults to "png".
+        dpi (float, optional): The resolution of the figure. Defaults to the
+            matplotlib default.
+        **plot_kwargs: Arguments passed to ED.plot (e.g. show_IDs, ylabel).
+
+    Returns:
+        bytes: The rendered file.
+    """
+    global _figure_pool
+    if _figure_pool is None:
+        from .figures import FigurePool
+
+        _figure_pool = FigurePool()
+    return _figure_pool.render(diagram, fmt, dpi, **plot_kwargs)
+
+
+def _render_job(job):
+    diagram, path, fmt, dpi, plot_kwargs = job
+    content = render_bytes(diagram, fmt, dpi, **plot_kwargs)
+    if path is None:
+        return content
+    with open(path, "wb") as f:
+        f.write(content)
+    return path
+
+
+def render_many(
+    diagrams, out_dir=None, fmt="png", jobs=None, dpi=None, names=None, **plot_kwargs
+):
+    """Render many diagrams in parallel processes.
+
+    Args:
+        diagrams (iterable): The ED instances to render.
+        out_dir (str, optional): Directory where the files are written. If
+            None the content of the files is returned instead of the paths.
+            Defaults to None.
+        fmt (str, optional): The file format. Defaults to "png".
+        jobs (int, optional): Number of processes, 1 renders in the calling
+            process. Defaults to the number of CPUs.
+        dpi (float, optional): The resolution of the figures.
+        names (list, optional): File names without extension, by default
+            diagram_00000, diagram_00001, ...
+        **plot_kwargs: Arguments passed to ED.plot (e.g. show_IDs, ylabel).
+
+    Returns:
+        iterator: The path of every written file or its content (str or
+        bytes), in the same order as diagrams, rendered while it is
+        iterated.
+
+    Raises:
+        ValueError: If names and diagrams have different lengths, raised
+            when render_many is called.
+    """
+    diagrams = list(diagrams)
+    if names is None:
+        names = ["diagram_%05d" % i for i in range(len(diagrams))]
+    elif len(names) != len(diagrams):
+        raise ValueError("names must have one entry for every diagram")
+    if out_dir is None:
+        paths = [None] * len(diagrams)
+    else:
+        os.makedirs(out_dir, exist_ok=True)
+        paths = [os.path.join(out_dir, "%s.%s" % (name, fmt)) for name in names]
+    work = [
+        (diagram, path, fmt, dpi, plot_kwargs) for diagram, path in zip(diagrams, paths)
+    ]
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+    # the arguments are checked above, only the renders are lazy
+    return _render_all(work, min(jobs, len(work)))
+
+
+def _render_all(work, jobs):
+    if jobs <= 1:
+        for job in work:
+            yield _render_job(job)
+        return
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    chunksize = max(1, len(work) // (jobs * 4))
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        for result in executor.map(_render_job, work, chunksize=chunksize):
+            yield result
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""
+Blitted redraws of the artists of a diagram.
+
+The artists are marked as animated, so a full draw of the figure renders
+only the axes, the ticks and the labels, which are saved as the background.
+A redraw restores the background and draws the artists of the diagram on
+it, following the matplotlib blitting recipe.
+
+@author: giacomo
+"""
+
+
+class BlitManager:
+    """Redraw a set of animated artists over a cached background.
+
+    Args:
+        canvas (FigureCanvasBase): The canvas of the figure, it must support
+            blitting (canvas.supports_blit).
+        artists (list, optional): The artists redrawn by update.
+
+    Example:
+        >>> manager = BlitManager(fig.canvas, artists)
+        >>> line.set_ydata(y)
+        >>> manager.update()
+    """
+
+    def __init__(self, canvas, artists=()):
+        self.canvas = canvas
+        self._background = None
+        self._artists = []
+        self.set_artists(artists)
+        self._cid = canvas.mpl_connect("draw_event", self._on_draw)
+
+    def set_artists(self, artists):
+        """Replace the artists redrawn by update."""
+        for artist in self._artists:
+            artist.set_animated(False)
+        self._artists = list(artists)
+        for artist in self._artists:
+            artist.set_animated(True)
+
+    def invalidate(self):
+        """Discard the background, e.g. when the limits of the axes change.
+        The next update draws the whole figure."""
+        self._background = None
+
+    def disconnect(self):
+        """Stop following the draws of the canvas and make the artists
+        ordinary artists again."""
+        self.canvas.mpl_disconnect(self._cid)
+        self.set_artists([])
+        self._background = None
+
+    def _on_draw(self, event):
+        if event is not None and event.canvas is not self.canvas:
+            return
+        if self.canvas.is_saving():
+            # savefig draws at another resolution and the animated artists
+            self._background = None
+            return
+        self._background = self.canvas.copy_from_bbox(self.canvas.figure.bbox)
+        self._draw_artists()
+
+    def _draw_artists(self):
+        figure = self.canvas.figure
+        for artist in sorted(self._artists, key=lambda artist: artist.get_zorder()):
+            figure.draw_artist(artist)
+
+    def update(self):
+        """Redraw the artists, drawing the whole figure if there is no
+        background yet."""
+        if self._background is None:
+            # _on_draw saves the background and draws the artists
+            self.canvas.draw()
+        else:
+            self.canvas.restore_region(self._background)
+            self._draw_artists()
+        self.canvas.blit(self.canvas.figure.bbox)
+        self.canvas.flush_events()
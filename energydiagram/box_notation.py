@@ -5,9 +5,16 @@ Created on Sat Jan  6 21:01:16 2018
 @author: giacomo
 """
 
-import matplotlib.pyplot as plt
-import matplotlib.patches as patches
-from matplotlib.path import Path
+import numpy as np
+
+# matplotlib is imported by the plotting functions, the vertices of the boxes
+# can be computed without it
+
+# spin arrows as offsets from the center of the box, in units of 0.8 * side
+# the x offsets are added to the half spacing between the up and down spin
+_SPIN_X = np.array([0.0, 0.0, 1 / 5.0, 1 / 20.0, 1 / 20.0, 0.0])
+_SPIN_UP_Y = np.array([0.0, 1.0, 0.6, 0.6, 0.0, 0.0])
+_SPIN_DOWN_Y = np.array([1.0, 0.0, 0.4, 0.4, 1.0, 1.0])
 
 
 def plot_orbital_boxes(
@@ -27,6 +34,9 @@ def plot_orbital_boxes(
     Returns:
         None: The function does not return but affects ax object.
     """
+    import matplotlib.patches as patches
+    from matplotlib.path import Path
+
     Xi = x - boxes_number * box_side / 2.0
     Yi = y - box_side / 2.0
 
@@ -115,7 +125,106 @@ def plot_orbital_boxes(
                 )
 
 
+def _ranges(counts):
+    """Return the owner and the local index of every element when each
+    owner i has counts[i] consecutive elements."""
+    counts = np.asarray(counts, dtype=int)
+    owners = np.repeat(np.arange(len(counts)), counts)
+    starts = np.cumsum(counts) - counts
+    return owners, np.arange(counts.sum()) - starts[owners]
+
+
+def orbital_boxes_vertices(boxes):
+    """Compute the vertices of many electron boxes at once.
+
+    Args:
+        boxes (list): Tuples (x, y, boxes_number, electrons_number, box_side,
+            spacing_f) with the same meaning of the plot_orbital_boxes
+            arguments.
+
+    Returns:
+        tuple: The (N, 4, 2) array with the corners of the N boxes and the
+        (M, 6, 2) array with the vertices of the M spins, filled following
+        the Aufbau principle.
+    """
+    data = np.asarray(boxes, dtype=float).reshape(-1, 6)
+    x, y, number, electrons, side, spacing_f = data.T
+    number = number.astype(int)
+    electrons = electrons.astype(int)
+    Xi = x - number * side / 2.0
+    Yi = y - side / 2.0
+
+    # boxes
+    owner, i = _ranges(number)
+    x0 = Xi[owner] + side[owner] * i
+    x1 = x0 + side[owner]
+    y0 = Yi[owner]
+    y1 = y0 + side[owner]
+    corners = np.stack(
+        [
+            np.column_stack([x0, y0]),
+            np.column_stack([x1, y0]),
+            np.column_stack([x1, y1]),
+            np.column_stack([x0, y1]),
+        ],
+        axis=1,
+    )
+
+    # spins, up in the first boxes and then down pairing them
+    unit = side * 0.8
+    hspacing = unit / spacing_f / 2.0
+    spins = []
+    for counts, sign, spin_y in (
+        (np.minimum(electrons, number), -1.0, _SPIN_UP_Y),
+        (np.maximum(electrons - number, 0), 1.0, _SPIN_DOWN_Y),
+    ):
+        owner, e = _ranges(counts)
+        u = unit[owner][:, None]
+        h_pad = (side / 2.0 + Xi)[owner] + side[owner] * e
+        v_pad = (side * 0.1 + Yi)[owner]
+        sx = h_pad[:, None] + sign * (hspacing[owner][:, None] + _SPIN_X * u)
+        sy = v_pad[:, None] + spin_y * u
+        spins.append(np.stack([sx, sy], axis=-1))
+    return corners, np.concatenate(spins)
+
+
+def plot_orbital_boxes_batch(ax, boxes):
+    """Add many electron boxes with two artists: a PolyCollection for the
+    boxes and a PathPatch with a single compound path for all the spins.
+
+    Args:
+        ax (matplotlib ax): The matplotlib ax object used for adding the boxes.
+        boxes (list): Tuples (x, y, boxes_number, electrons_number, box_side,
+            spacing_f) with the same meaning of the plot_orbital_boxes
+            arguments.
+
+    Returns:
+        list: The artists added to ax.
+    """
+    import matplotlib.patches as patches
+    from matplotlib.collections import PolyCollection
+    from matplotlib.path import Path
+
+    if not len(boxes):
+        return []
+    corners, spins = orbital_boxes_vertices(boxes)
+    squares = PolyCollection(
+        corners, facecolors="w", edgecolors="k", linewidths=1, zorder=10
+    )
+    ax.add_collection(squares)
+    artists = [squares]
+    if len(spins):
+        spin_codes = [Path.MOVETO] + [Path.LINETO] * 4 + [Path.CLOSEPOLY]
+        codes = np.tile(np.asarray(spin_codes, dtype=Path.code_type), len(spins))
+        path = Path(spins.reshape(-1, 2), codes)
+        spin = patches.PathPatch(path, facecolor="k", lw=0.1, zorder=10)
+        artists.append(ax.add_patch(spin))
+    return artists
+
+
 if __name__ == "__main__":
+    import matplotlib.pyplot as plt
+
     fig = plt.figure()
     ax = fig.add_subplot(111, aspect="equal")
     ax.set_xlim(10, 14)
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""
+Cache of rendered diagrams.
+
+The renders are keyed by ED.content_hash, so a diagram that was already
+rendered with the same data, parameters, format and dpi is served without
+touching matplotlib. The cache keeps the most recently used files in memory
+and, optionally, on disk with a limit on the total size. Only the files
+named as the renders of the cache (<sha256>.<format>) are counted, evicted
+and cleared, so the directory can hold other files.
+
+@author: giacomo
+"""
+
+import os
+import re
+import threading
+from collections import OrderedDict
+
+from .batch import render_bytes
+
+# the name of a cached render, a content_hash and the format
+_NAME = re.compile(r"[0-9a-f]{64}\.[0-9A-Za-z]+\Z")
+
+
+class RenderCache:
+    """LRU cache of rendered diagrams.
+
+    Args:
+        maxsize (int, optional): Number of renders kept in memory.
+            Defaults to 128.
+        directory (str, optional): Directory used as a second level cache.
+            Defaults to None, no disk cache.
+        max_bytes (int, optional): Maximum total size of the files in
+            directory, the least recently used files are deleted when it is
+            exceeded. Defaults to None, no limit.
+
+    Example:
+        >>> cache = RenderCache(directory="renders", max_bytes=2**30)
+        >>> png = cache.render(diagram, fmt="png", dpi=150)
+        >>> cache.hits, cache.misses
+    """
+
+    def __init__(self, maxsize=128, directory=None, max_bytes=None):
+        self.maxsize = maxsize
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_bytes = 0
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+            self._disk_bytes = sum(size for _, size, _ in self._disk_files())
+
+    @property
+    def stats(self):
+        """Counters of the cache as a dictionary."""
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "entries": len(self._memory),
+            "disk_bytes": self._disk_bytes,
+        }
+
+    def key(self, diagram, fmt="png", dpi=None, **plot_kwargs):
+        """Return the cache key of a render."""
+        return diagram.content_hash(fmt, dpi, sorted(plot_kwargs.items()))
+
+    def render(self, diagram, fmt="png", dpi=None, **plot_kwargs):
+        """Return the rendered diagram, drawing it only on a cache miss.
+
+        Args:
+            diagram (ED): The diagram to render.
+            fmt (str, optional): The file format. Defaults to "png".
+            dpi (float, optional): The resolution of the figure.
+            **plot_kwargs: Arguments passed to ED.plot.
+
+        Returns:
+            bytes: The rendered file.
+        """
+        key = self.key(diagram, fmt, dpi, **plot_kwargs)
+        content = self.get(key, fmt)
+        if content is None:
+            with self._lock:
+                self.misses += 1
+            content = render_bytes(diagram, fmt, dpi, **plot_kwargs)
+            self.put(key, fmt, content)
+        return content
+
+    def get(self, key, fmt):
+        """Return the cached file or None."""
+        with self._lock:
+            content = self._memory.get(key)
+            if content is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return content
+        if self.directory is None:
+            return None
+        path = self._path(key, fmt)
+        try:
+            with open(path, "rb") as f:
+                content = f.read()
+            # the modification time orders the files for the eviction
+            os.utime(path)
+        except OSError:
+            return None
+        with self._lock:
+            self.hits += 1
+            self.disk_hits += 1
+        self._remember(key, content)
+        return content
+
+    def put(self, key, fmt, content):
+        """Store a rendered file."""
+        if self.directory is None:
+            self._remember(key, content)
+            return
+        path = self._path(key, fmt)
+        self._remember(key, content)
+        temporary = "%s.%d.tmp" % (path, threading.get_ident())
+        with open(temporary, "wb") as f:
+            f.write(content)
+        try:
+            # an overwritten file is counted once
+            old_size = os.path.getsize(path)
+        except OSError:
+            old_size = 0
+        os.replace(temporary, path)
+        with self._lock:
+            self._disk_bytes += len(content) - old_size
+        if self.max_bytes is not None and self._disk_bytes > self.max_bytes:
+            self._evict()
+
+    def clear(self):
+        """Remove all the renders from memory and disk."""
+        with self._lock:
+            self._memory.clear()
+        for path, _, _ in self._disk_files():
+            os.remove(path)
+        self._disk_bytes = 0
+
+    def _remember(self, key, content):
+        with self._lock:
+            self._memory[key] = content
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.maxsize:
+                self._memory.popitem(last=False)
+
+    def _path(self, key, fmt):
+        name = "%s.%s" % (key, fmt)
+        if not _NAME.match(name):
+            raise ValueError("%r is not a cache key and format" % name)
+        return os.path.join(self.directory, name)
+
+    def _disk_files(self):
+        # (path, size, mtime) of the cached files
+        if self.directory is None:
+            return []
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and _NAME.match(entry.name):
+                stat = entry.stat()
+                files.append((entry.path, stat.st_size, stat.st_mtime))
+        return files
+
+    def _evict(self):
+        files = sorted(self._disk_files(), key=lambda item: item[2])
+        total = sum(size for _, size, _ in files)
+        for path, size, _ in files:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+        with self._lock:
+            self._disk_bytes = total
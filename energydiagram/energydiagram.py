@@ -14,15 +14,41 @@ y|
 
 """
 
-import matplotlib.pyplot as plt
-from matplotlib.lines import Line2D
-from matplotlib.patches import PathPatch
-from matplotlib.path import Path
-from .box_notation import plot_orbital_boxes
+import hashlib
+from contextlib import nullcontext
+
+import numpy as np
+from .levels import LevelStore, _style_key
+from .profiling import RenderStats
+
+# matplotlib is imported only when plotting, so building, validating or
+# serializing a diagram does not pay for the pyplot and backend import
+
+
+def _layout_parameter(name):
+    # dimension, space and offset: a value set by the user, or "auto" until
+    # __auto_adjust computes it. The flag survives pickling and copying,
+    # unlike the identity of the computed float
+    def get(self):
+        return self._layout[name]
+
+    def set(self, value):
+        self._layout[name] = value
+        self._auto_layout[name] = isinstance(value, str) and value == "auto"
+
+    return property(get, set)
 
 
 class ED:
-    def __init__(self, aspect="equal"):
+    dimension = _layout_parameter("dimension")
+    space = _layout_parameter("space")
+    offset = _layout_parameter("offset")
+
+    def __init__(self, aspect="equal", unit="kcal/mol"):
+        # values of dimension, space and offset, computed by __auto_adjust
+        # when their flag in _auto_layout is True
+        self._layout = {}
+        self._auto_layout = {}
         # plot parameters
         self.ratio = 1.6181
         self.dimension = "auto"
@@ -33,26 +59,465 @@ class ED:
         self.color_top_text = "k"
         self.aspect = aspect
         self.round_energies_at_digit = "keep all digits"
+        # unit of the energies, see set_units
+        self.unit = unit
         self.top_text_fontsize = "medium"
         self.bottom_text_fontsize = "medium"
         self.right_text_fontsize = "medium"
         self.left_text_fontsize = "medium"
+        # draw the levels with a few collections instead of one artist each
+        self.batch_rendering = True
+        # move overlapping labels and connect them to the level with a line
+        self.avoid_label_overlap = False
+        # draw only what is inside the view, merging what is too small
+        self.level_of_detail = False
         # data
         self.pos_number = 0
-        self.energies = []
-        self.positions = []
-        self.top_texts = []
-        self.bottom_texts = []
-        self.left_texts = []
-        self.right_texts = []
+        self._levels = LevelStore()
         self.links = []
         self.arrows = []
         self.electons_boxes = []
-        self.level_kwargs = []
+        # label artists created by the last call of plot
+        self.label_artists = []
+        # ViewportCuller of the last call of plot with level_of_detail
+        self.culler = None
+        # time the phases of plot, draw and savefig: False, True or a
+        # callable receiving the RenderStats after each of them
+        self.profile = False
+        self.last_render_stats = None
+        # artists of the last call of plot and levels changed since then,
+        # used by refresh
+        self._rendered = None
+        self._changed_levels = set()
+        self._blit = None
         # matplotlib fiugre handlers
         self.fig = None
         self.ax = None
 
+    def __getstate__(self):
+        # the figure is not part of the diagram and it is expensive to pickle
+        state = self.__dict__.copy()
+        state["fig"] = None
+        state["ax"] = None
+        state["label_artists"] = []
+        state["culler"] = None
+        state["_rendered"] = None
+        state["_blit"] = None
+        # the layout is changed in place by __auto_adjust
+        state["_layout"] = dict(self._layout)
+        state["_auto_layout"] = dict(self._auto_layout)
+        # callbacks usually can not be pickled and run only in this process
+        state["profile"] = bool(self.profile)
+        return state
+
+    def content_hash(self, *extra):
+        """
+        Method of ED class
+        A stable hash of everything that changes the rendering of the
+        diagram: levels, texts, styles, links, arrows, electron boxes and
+        plot parameters.
+
+        Parameters
+        ----------
+        *extra
+            Other values changing the output, e.g. file format and dpi.
+
+        Returns
+        -------
+        The hexadecimal SHA-256 digest
+        """
+        digest = hashlib.sha256()
+        levels = self._levels
+        for column, dtype in (
+            (levels.energies, np.float64),
+            (levels.positions, np.float64),
+            (levels.style_ids, np.int64),
+        ):
+            digest.update(np.ascontiguousarray(column, dtype=dtype).tobytes())
+        parameters = list(self._plot_parameters().values())
+        for value in (
+            self.top_texts,
+            levels.bottom_texts,
+            levels.left_texts,
+            levels.right_texts,
+            # the properties in sorted order, whatever the order they were
+            # passed in
+            [_style_key(style) for style in levels.styles],
+            [
+                [(end, _style_key(kwargs)) for end, kwargs in links]
+                for links in self.links
+            ],
+            [
+                [
+                    (end, position, text, _style_key(kwargs))
+                    for end, position, text, kwargs in arrows
+                ]
+                for arrows in self.arrows
+            ],
+            # sides and spacings as saved by ED.save
+            [box[:3] + (float(box[3]), float(box[4])) for box in self.electons_boxes],
+            parameters,
+            extra,
+        ):
+            digest.update(repr(value).encode("utf-8"))
+        return digest.hexdigest()
+
+    @classmethod
+    def from_table(
+        cls, levels, links=None, arrows=None, columns=None, chunksize=100000, **kwargs
+    ):
+        """
+        Method of ED class
+        Create a diagram from tables of levels, links and arrows. The files
+        are read in chunks and every chunk of levels is added with a single
+        call to add_levels.
+
+        Parameters
+        ----------
+        levels : str, DataFrame or dict
+            A CSV or Parquet (.parquet, .pq, requires pyarrow) file, a
+            pandas DataFrame or a dictionary of columns. The columns energy,
+            position, bottom_text, top_text, left_text, right_text, color,
+            linewidth and key are used when present. An empty position
+            places the level on the right of the previous one, "last" in the
+            same position, and an empty top text prints the energy.
+        links, arrows : str, DataFrame or dict
+            Tables with the IDs, keys or bottom texts of the levels in the
+            start and end columns, the other columns are passed to add_link
+            or add_arrow (e.g. line_order, color, position, text).
+            (default None)
+        columns : dict
+            Column name of the fields of the levels with a different name,
+            e.g. {"energy": "E", "bottom_text": "name"}. (default None)
+        chunksize : int
+            Rows read at once from a file. (default 100000)
+        **kwargs
+            Other properties of the lines shared by all the levels,
+            e.g. linestyle.
+
+        Returns
+        -------
+        The diagram
+        """
+        from .tables import read_tables
+
+        return read_tables(cls(), levels, links, arrows, columns, chunksize, **kwargs)
+
+    @classmethod
+    def from_dataframe(cls, levels, links=None, arrows=None, columns=None, **kwargs):
+        """
+        Method of ED class
+        Create a diagram from pandas DataFrames of levels, links and arrows,
+        see from_table for the columns.
+
+        Returns
+        -------
+        The diagram
+        """
+        return cls.from_table(levels, links, arrows, columns, **kwargs)
+
+    @classmethod
+    def from_logs(
+        cls,
+        paths,
+        quantity="auto",
+        unit="kcal/mol",
+        reference="first",
+        jobs=None,
+        cache=None,
+        **kwargs,
+    ):
+        """
+        Method of ED class
+        Create a diagram with a level for every Gaussian, ORCA or xTB output
+        file. The files are read from the end in a pool of processes, see
+        energydiagram.qc.
+
+        Parameters
+        ----------
+        paths : list
+            The output files, one per level.
+        quantity : str
+            "scf" for the final SCF energy, "gibbs" for the Gibbs free
+            energy or "auto" for the Gibbs free energy when present, else
+            the SCF energy. (default "auto")
+        unit : str
+            Unit of the levels: "kcal/mol", "kJ/mol", "eV" or "hartree".
+            (default "kcal/mol")
+        reference : str, int, float or None
+            Zero of the energies: "first" or "min" file, the index of a
+            file, an energy in Hartree or None for absolute energies.
+            (default "first")
+        jobs : int
+            Number of processes, 1 parses in the calling process.
+            (default the number of CPUs)
+        cache : str
+            JSON file caching the energies of the files whose modification
+            time and size are unchanged. (default None)
+        **kwargs
+            Other arguments of add_levels, e.g. positions or bottom_texts
+            (default the file names without extension).
+
+        Returns
+        -------
+        The diagram
+        """
+        from .qc import read_logs
+
+        return read_logs(
+            cls(unit=unit),
+            paths,
+            quantity=quantity,
+            unit=unit,
+            reference=reference,
+            jobs=jobs,
+            cache=cache,
+            **kwargs,
+        )
+
+    def _plot_parameters(self):
+        # layout and plot parameters, "auto" for the automatic layout
+        parameters = {
+            name: "auto" if self.__is_auto(name) else getattr(self, name)
+            for name in ("dimension", "space", "offset")
+        }
+        parameters.update((name, getattr(self, name)) for name in _PLOT_PARAMETERS)
+        return parameters
+
+    def save(self, fname):
+        """
+        Method of ED class
+        Save the diagram in a compact binary file: the levels as typed
+        arrays, the texts and the styles as deduplicated tables and the
+        links, arrows and electron boxes as edge arrays. See
+        energydiagram.storage for the layout of the file.
+
+        Parameters
+        ----------
+        fname : str or file-like object
+            The file, opened in binary mode if it is a file object.
+        """
+        from .storage import write_diagram
+
+        parameters = self._plot_parameters()
+        parameters["batch_rendering"] = self.batch_rendering
+        parameters["pos_number"] = self.pos_number
+        write_diagram(self, fname, parameters)
+
+    @classmethod
+    def load(cls, fname, mmap=True):
+        """
+        Method of ED class
+        Load a diagram saved by ED.save.
+
+        Parameters
+        ----------
+        fname : str
+            The file.
+        mmap : bool
+            Map the file in memory: the arrays of the levels are views of
+            the file and the texts, links and arrows are decoded only when
+            they are accessed. (default True)
+
+        Returns
+        -------
+        The diagram
+        """
+        from .storage import read_diagram
+
+        return read_diagram(cls, fname, mmap)
+
+    # The columns of the levels. They are read-only, a level is changed with
+    # update_level and a whole column by assigning a sequence, e.g.
+    # diagram.energies = new_energies. A None top text prints the energy.
+
+    @property
+    def energies(self):
+        return _read_only(self._levels.energies)
+
+    @energies.setter
+    def energies(self, energies):
+        self._levels.set_energies(energies)
+        self._changed_levels.update(range(len(self._levels)))
+
+    @property
+    def positions(self):
+        return _read_only(self._levels.positions)
+
+    @positions.setter
+    def positions(self, positions):
+        self._levels.set_positions(positions)
+        self._changed_levels.update(range(len(self._levels)))
+
+    @property
+    def top_texts(self):
+        return self._levels.format_top_texts(self.round_energies_at_digit)
+
+    @top_texts.setter
+    def top_texts(self, texts):
+        self._set_texts("top_text", texts)
+
+    @property
+    def bottom_texts(self):
+        return self._levels.bottom_texts
+
+    @bottom_texts.setter
+    def bottom_texts(self, texts):
+        self._set_texts("bottom_text", texts)
+
+    @property
+    def left_texts(self):
+        return self._levels.left_texts
+
+    @left_texts.setter
+    def left_texts(self, texts):
+        self._set_texts("left_text", texts)
+
+    @property
+    def right_texts(self):
+        return self._levels.right_texts
+
+    @right_texts.setter
+    def right_texts(self, texts):
+        self._set_texts("right_text", texts)
+
+    def _set_texts(self, name, texts):
+        self._levels.set_texts(name, texts)
+        self._changed_levels.update(range(len(self._levels)))
+
+    @property
+    def level_kwargs(self):
+        return self._levels.level_kwargs
+
+    def level_id(self, name):
+        """
+        Method of ED class
+        Return the ID of a level from its key or its bottom text, without
+        plotting. The names are kept in a hash map, so the lookup takes
+        constant time.
+
+        Parameters
+        ----------
+        name : int or str
+                 The ID, the key or the bottom text of the level
+
+        Returns
+        -------
+        The ID of the level, a KeyError is raised if no level has the name
+        or if several levels have it as bottom text
+        """
+        return self._levels.level_id(name)
+
+    def column(self, position="last"):
+        """
+        Method of ED class
+        Return the IDs of the levels in a position.
+
+        Parameters
+        ----------
+        position : float or str
+                 The position, 'last' (abrv. 'l') for the last position used
+                 or the key or the bottom text of a level for its position
+                 (default  'last')
+
+        Returns
+        -------
+        The list of the IDs, in the order the levels were added
+        """
+        if position == "last" or position == "l":
+            position = self.pos_number
+        elif not isinstance(position, (int, float, np.number)):
+            position = self.positions[self._levels.level_id(position)]
+        return self._levels.column(position)
+
+    def set_units(self, unit, reference=None, reference_energy=None):
+        """
+        Method of ED class
+        Convert the energies of all the levels to another unit and
+        optionally make them relative to a reference level, in a single
+        vectorized operation. The top texts and the gap labels of the
+        arrows printing the energies, and the default label of the energy
+        axis, follow the new unit. Lengths set by hand (dimension, space,
+        offset and the sides of the electron boxes) are scaled too.
+
+        Parameters
+        ----------
+        unit : str
+            "kcal/mol", "kJ/mol", "eV", "hartree" or "cm-1", see
+            energydiagram.units
+        reference : int or str
+            The ID, the key or the bottom text of the level whose energy
+            becomes 0, "min" for the lowest level or None to keep the zero.
+            (default None)
+        reference_energy : float
+            The energy in the current unit that becomes 0, instead of the
+            one of a level. (default None)
+        """
+        from .units import convert
+
+        if reference is not None and reference_energy is not None:
+            raise ValueError("Give either reference or reference_energy")
+        if isinstance(reference, (float, np.floating)):
+            raise TypeError("reference is a level, use reference_energy for an energy")
+        scale = convert(1.0, self.unit, unit)
+        if reference_energy is not None:
+            shift = float(reference_energy)
+        elif reference is None:
+            shift = 0.0
+        elif isinstance(reference, str) and reference == "min":
+            shift = float(self.energies.min()) if len(self._levels) else 0.0
+        else:
+            shift = float(self.energies[self._levels.level_id(reference)])
+        self._levels.rescale(scale, shift)
+        for name in ("dimension", "space", "offset"):
+            if not self.__is_auto(name):
+                setattr(self, name, getattr(self, name) * scale)
+        self.electons_boxes = [
+            box[:3] + (box[3] * scale,) + tuple(box[4:]) for box in self.electons_boxes
+        ]
+        self.unit = unit
+        self._changed_levels.update(range(len(self._levels)))
+
+    def auto_layout(self, gap="auto", sweeps=4):
+        """
+        Method of ED class
+        Place the levels in columns following the links and the arrows,
+        instead of their positions: every level goes on the right of the
+        levels linked to it (longest-path layering), and the levels of the
+        same layer are ordered by the mean position of their neighbours to
+        reduce the crossings and split in more columns when they are too
+        close in energy. Cycles are broken at the level with the lowest ID.
+        It takes near-linear time, so it can place networks of tens of
+        thousands of levels and links. See energydiagram.layout.
+
+        Parameters
+        ----------
+        gap : float or str
+            The minimum energy difference between the levels of a column,
+            'auto' for five times the offset of the texts, so that the
+            texts of the levels do not overlap, or 0 for a single column
+            per layer. (default 'auto')
+        sweeps : int
+            Passes of barycenter ordering. (default 4)
+        """
+        from .layout import layered_positions
+
+        if gap == "auto":
+            # the top and the bottom texts take about twice the offset
+            if isinstance(self.offset, str) or self.__is_auto("offset"):
+                offset = self._levels.stats.energy_range * self.offset_ratio
+            else:
+                offset = self.offset
+            gap = 5 * offset
+        edges = [edge[:2] for edge in _edges(self.links) + _edges(self.arrows)]
+        edges = np.array(edges, dtype=np.intp).reshape(-1, 2)
+        positions = layered_positions(
+            self.energies, edges[:, 0], edges[:, 1], gap=gap, sweeps=sweeps
+        )
+        self._levels.set_positions(positions)
+        self.pos_number = int(positions.max()) if len(positions) else 0
+        self._changed_levels.update(range(len(positions)))
+
     def add_level(
         self,
         energy,
@@ -63,6 +528,8 @@ class ED:
         left_text="",
         color="k",
         linewidth=2,
+        key=None,
+        unit=None,
         **kwargs,
     ):
         """
@@ -72,7 +539,8 @@ class ED:
         Parameters
         ----------
         energy : int
-                 The energy of the level in Kcal mol-1
+                 The energy of the level, in the unit of the diagram
+                 (self.unit, kcal/mol by default) unless unit is given
         bottom_text  : str
                 The text on the bottom of the level (label of the level)
                 (default '')
@@ -82,7 +550,8 @@ class ED:
                 argument for adding the level to the last position used
                 for the level before.
                 An integer can be used for adding the level to an arbitrary
-                position.
+                position and the key or the bottom text of a level for
+                adding it to the position of that level.
                 (default  None)
         color  : str
                 Color of the level  (default  'k')
@@ -96,9 +565,13 @@ class ED:
         linestyle  : str
                 The linestyle of the level, one of the following values:
                 'solid', 'dashed', 'dashdot', 'dotted' (default  'solid')
-
-
-
+        key  : str
+                A unique name of the level, used instead of its ID by
+                add_link, add_arrow and add_electronbox. The bottom text
+                can be used too when no other level has it. (default  None)
+        unit  : str
+                The unit of energy, converted to the unit of the diagram.
+                (default  None, the unit of the diagram)
 
         Returns
         -------
@@ -108,54 +581,191 @@ class ED:
         if position is None:
             position = self.pos_number + 1
             self.pos_number += 1
-        elif isinstance(position, (int, float)):
+        elif isinstance(position, (int, float, np.number)):
             pass
         elif position == "last" or position == "l":
             position = self.pos_number
         else:
-            raise ValueError(
-                "Position must be None or 'last' (abrv. 'l') or in case an integer or float specifing the position. It was: %s"
-                % position
-            )
-        if top_text is None:
-            if self.round_energies_at_digit == "keep all digits":
-                top_text = energy
-            else:
-                top_text = round(energy, self.round_energies_at_digit)
-
-        self.energies.append(energy)
-        self.positions.append(position)
-        self.top_texts.append(top_text)
-        self.bottom_texts.append(bottom_text)
-        self.left_texts.append(left_text)
-        self.right_texts.append(right_text)
-        kwargs["color"] = color
-        kwargs["linewidth"] = linewidth
-        self.level_kwargs.append(kwargs)
+            try:
+                position = self.positions[self._levels.level_id(position)]
+            except (KeyError, TypeError):
+                raise ValueError(
+                    "Position must be None or 'last' (abrv. 'l') or in case an integer or float specifing the position or the key of a level. It was: %s"
+                    % position
+                ) from None
+        integral = isinstance(energy, (int, np.integer))
+        if unit is not None:
+            from .units import convert, normalize_unit
 
+            if normalize_unit(unit) != normalize_unit(self.unit):
+                energy = convert(energy, unit, self.unit)
+                integral = False
+        # a single style and no arrays, add_level is called in loops
+        if kwargs:
+            style_id = self._levels.intern_style(
+                dict(kwargs, color=color, linewidth=linewidth)
+            )
+        else:
+            style_id = self._levels.intern_line_style(color, linewidth)
+        self._levels.append(
+            energy,
+            position,
+            style_id,
+            top_text,
+            bottom_text,
+            left_text,
+            right_text,
+            integral=integral,
+            key=key,
+        )
         self.links.append([])
         self.arrows.append([])
 
+    def add_levels(
+        self,
+        energies,
+        positions=None,
+        bottom_texts=None,
+        top_texts=None,
+        right_texts=None,
+        left_texts=None,
+        colors="k",
+        linewidths=2,
+        integral=None,
+        keys=None,
+        unit=None,
+        **kwargs,
+    ):
+        """
+        Method of ED class
+        This method add many energy levels to the plot in a single call.
+
+        Parameters
+        ----------
+        energies : array-like
+                The energies of the levels, in the unit of the diagram
+                unless unit is given
+        positions : array-like
+                The positions of the levels. By default every level is added
+                on the right of the previous one. (default  None)
+        bottom_texts, top_texts, right_texts, left_texts : list
+                The texts of the levels, see add_level. A None top text
+                prints the energy of the level. (default  None)
+        colors : str, tuple or list
+                Color of the levels, a string or a tuple is used for all the
+                levels, a list gives a color to every level. (default  'k')
+        linewidths : float or array-like
+                Width of the levels. (default  2)
+        integral : bool or array-like
+                Print the energies in the top texts without decimals, for
+                all the levels or for every level. By default True if the
+                energies are integers. (default  None)
+        keys : list
+                Unique names of the levels, None for a level without a
+                name, see add_level. (default  None)
+        unit : str
+                The unit of the energies, converted all at once to the unit
+                of the diagram, see set_units. (default  None, the unit of
+                the diagram)
+        **kwargs
+                Other properties of the lines shared by all the levels,
+                e.g. linestyle.
+
+        Returns
+        -------
+        Append to the class data all the information regarding the levels
+        added
+        """
+        energies = np.asarray(energies)
+        n = len(energies)
+        if unit is not None:
+            from .units import convert, normalize_unit
+
+            if normalize_unit(unit) != normalize_unit(self.unit):
+                energies = convert(energies, unit, self.unit)
+        if positions is None:
+            positions = np.arange(self.pos_number + 1, self.pos_number + n + 1)
+            self.pos_number += n
+
+        def column(texts, default):
+            if texts is None:
+                return [default] * n
+            texts = list(texts)
+            if len(texts) != n:
+                raise ValueError("Expected %d texts, got %d" % (n, len(texts)))
+            return texts
+
+        single_color = isinstance(colors, (str, tuple))
+        if single_color and np.ndim(linewidths) == 0:
+            style = dict(kwargs, color=colors, linewidth=linewidths)
+            style_ids = np.full(n, self._levels.intern_style(style), dtype=np.intp)
+        else:
+            style_ids = self._intern_level_styles(n, colors, linewidths, kwargs)
+
+        self._levels.extend(
+            energies.astype(float),
+            positions,
+            style_ids,
+            column(top_texts, None),
+            column(bottom_texts, ""),
+            column(left_texts, ""),
+            column(right_texts, ""),
+            integral=(
+                np.issubdtype(energies.dtype, np.integer)
+                if integral is None
+                else integral
+            ),
+            keys=None if keys is None else column(keys, None),
+        )
+        self.links.extend([[] for _ in range(n)])
+        self.arrows.extend([[] for _ in range(n)])
+
+    def _intern_level_styles(self, n, colors, linewidths, kwargs):
+        # style index of every level when color or linewidth vary
+        if isinstance(colors, (str, tuple)):
+            colors = [colors] * n
+        if np.ndim(linewidths) == 0:
+            linewidths = [linewidths] * n
+        keys = zip(colors, linewidths)
+        unique = {}
+        try:
+            codes = [unique.setdefault(key, len(unique)) for key in keys]
+        except TypeError:
+            # unhashable color, e.g. a list of RGB values
+            unique = list(zip(colors, linewidths))
+            codes = np.arange(n)
+        style_ids = np.array(
+            [
+                self._levels.intern_style(dict(kwargs, color=color, linewidth=lw))
+                for color, lw in unique
+            ],
+            dtype=np.intp,
+        )
+        return style_ids[np.asarray(codes, dtype=np.intp)]
+
     def add_arrow(
         self, start_level_id, end_level_id, position="center", text=None, **kwargs
     ):
         """
         Method of ED class
-        Add a arrow between two energy levels using IDs of the level. Use
-        self.plot(show_index=True) to show the IDs of the levels.
+        Add a arrow between two energy levels using IDs, keys or bottom
+        texts of the levels. Use self.plot(show_IDs=True) to show the IDs
+        of the levels.
 
         Parameters
         ----------
-        start_level_id : int
-                 Starting level ID
-        end_level_id : int
-                 Ending level ID
+        start_level_id : int or str
+                 Starting level ID, key or bottom text
+        end_level_id : int or str
+                 Ending level ID, key or bottom text
 
         Returns
         -------
         Append arrow to self.arrows
 
         """
+        start_level_id = self._levels.level_id(start_level_id)
+        end_level_id = self._levels.level_id(end_level_id)
         self.arrows[start_level_id].append((end_level_id, position, text, kwargs))
 
     def add_link(
@@ -170,15 +780,16 @@ class ED:
     ):
         """
         Method of ED class
-        Add a link between two energy levels using IDs of the level. Use
-        self.plot(show_index=True) to show the IDs of the levels.
+        Add a link between two energy levels using IDs, keys or bottom
+        texts of the levels. Use self.plot(show_IDs=True) to show the IDs
+        of the levels.
 
         Parameters
         ----------
-        start_level_id : int
-                 Starting level ID
-        end_level_id : int
-                 Ending level ID
+        start_level_id : int or str
+                 Starting level ID, key or bottom text
+        end_level_id : int or str
+                 Ending level ID, key or bottom text
         color : str
                 color of the line
         ls : str
@@ -195,191 +806,812 @@ class ED:
         kwargs["color"] = color
         kwargs["ls"] = ls
         kwargs["lw"] = lw
+        start_level_id = self._levels.level_id(start_level_id)
+        end_level_id = self._levels.level_id(end_level_id)
         self.links[start_level_id].append((end_level_id, kwargs))
 
     def add_electronbox(self, level_id, boxes, electrons, side=0.5, spacing_f=5):
         """
         Method of ED class
-        Add a link between two energy levels using IDs of the level. Use
-        self.plot(show_index=True) to show the IDs of the levels.
+        Add electron boxes to an energy level using the ID, the key or the
+        bottom text of the level. Use self.plot(show_IDs=True) to show the
+        IDs of the levels.
 
         Parameters
         ----------
-        start_level_id : int
-                 Starting level ID
-        end_level_id : int
-                 Ending level ID
+        level_id : int or str
+                 Level ID, key or bottom text
+        boxes : int
+                 Number of boxes
+        electrons : int
+                 Number of electrons, placed following the Aufbau principle
+        side : float
+                 The side of a box (default 0.5)
+        spacing_f : float
+                 The spacing between the spins (default 5)
 
         Returns
         -------
-        Append link to self.links
+        Append box to self.electons_boxes, the box is placed on the level
+        when plotting
 
         """
+        # keep offset, dimension and space available for fine-tuning
         self.__auto_adjust()
+        level_id = self._levels.level_id(level_id)
+        self.electons_boxes.append((level_id, boxes, electrons, side, spacing_f))
+
+    def _electron_boxes_xy(self, live=None, want=False):
+        # (x, y, boxes, electrons, side, spacing_f) of every electron box, or
+        # of the boxes whose level is in live (want) or not, see refresh
+        boxes = self.electons_boxes
+        if live is not None:
+            boxes = [box for box in boxes if live[box[0]] == want]
+        if not boxes:
+            return []
+        level_ids = [box[0] for box in boxes]
         x = (
-            self.positions[level_id] * (self.dimension + self.space)
+            self.positions[level_ids] * (self.dimension + self.space)
             + self.dimension * 0.5
         )
-        y = self.energies[level_id]
-        self.electons_boxes.append((x, y, boxes, electrons, side, spacing_f))
+        y = self.energies[level_ids]
+        return [
+            (bx, by) + box[1:] for bx, by, box in zip(x.tolist(), y.tolist(), boxes)
+        ]
+
+    def to_svg(self, fname=None, show_IDs=False, ylabel=None, width=460.0):
+        """
+        Method of ED class
+        Write the diagram as SVG without using matplotlib. This is much
+        faster than plot and savefig for diagrams made of levels, links,
+        arrows, electron boxes and plain text (math text is not rendered).
+
+        Parameters
+        ----------
+        fname : str
+            The file where the SVG is saved. If None the SVG is only returned.
+        show_IDs : bool
+            show the IDs of the energy levels
+        ylabel : str
+            The label to use on the left-side axis. By default the energy
+            in the unit of the diagram, e.g. "Energy / kcal mol-1".
+        width : float
+            The maximum width of the axes in points.
+
+        Returns
+        -------
+        The SVG document as a string
+        """
+        from .svg import diagram_svg
+
+        self.__auto_adjust()
+        if ylabel is None:
+            from .units import axis_label
+
+            ylabel = axis_label(self.unit, math=False)
+        document = diagram_svg(self, show_IDs, ylabel, width)
+        if fname is not None:
+            with open(fname, "w", encoding="utf-8") as f:
+                f.write(document)
+        return document
 
     def plot_level(self, energy, pos, btext, ttext, rtext, ltext, **kwargs):
         start = pos * (self.dimension + self.space)
         self.ax.hlines(energy, start, start + self.dimension, **kwargs)
-        # top text
-        self.ax.text(
-            start + 0.5 * self.dimension,  # X
-            energy + self.offset,  # Y
-            ttext,  # self.top_texts
-            horizontalalignment="center",
-            verticalalignment="bottom",
-            color=self.color_top_text,
-            fontsize=self.top_text_fontsize,
-        )
-        # bottom text
-        self.ax.text(
-            start + self.dimension,  # X
-            energy,  # Y
-            rtext,  # self.right_text
-            horizontalalignment="left",
-            verticalalignment="center",
-            color=self.color_bottom_text,
-            fontsize=self.left_text_fontsize,
+        self.plot_level_texts(energy, pos, btext, ttext, rtext, ltext)
+
+    def plot_levels(self, culler=None):
+        """
+        Method of ED class
+        Draw all the energy levels at once. The levels are grouped by the
+        properties that must be shared inside a collection (e.g. zorder or
+        alpha) and every group is drawn as a single LineCollection with
+        per-segment colors, linewidths and linestyles.
+
+        Parameters
+        ----------
+        culler : energydiagram.lod.ViewportCuller
+            register the collections, with their per-segment properties, for
+            the level of detail rendering
+
+        Returns
+        -------
+        The list of LineCollection added to self.ax
+        """
+        records = self._draw_levels(self._level_groups(), culler)
+        self.ax.autoscale_view()
+        return [artist for _, artists, _ in records for artist in artists]
+
+    def _level_groups(self, live=None, want=False):
+        """
+        Method of ED class
+        Split the levels in the groups drawn by a single LineCollection.
+
+        Parameters
+        ----------
+        live, want : array of bool, bool
+            keep only the levels whose value in live is want, see refresh
+            (default None, all the levels)
+
+        Returns
+        -------
+        list of (key, extra, ids, segments, colors, linewidths, linestyles)
+            key identifies the properties shared by the group (extra), ids
+            are the IDs of its levels and the other values have one entry
+            per level, linestyles is a single value if they are all equal
+        """
+        import matplotlib as mpl
+        from matplotlib.colors import to_rgba
+
+        # split the unique styles, grouping the ones that can share a collection
+        groups = {}
+        for style_id, kwargs in enumerate(self._levels.styles):
+            color, linewidth, linestyle, extra = _split_level_style(kwargs)
+            if color is None:
+                color = mpl.rcParams["lines.color"]
+            if linewidth is None:
+                linewidth = mpl.rcParams["lines.linewidth"]
+            key = _style_key(extra)
+            if key not in groups:
+                groups[key] = (extra, [], [], [], [])
+            group = groups[key]
+            group[1].append(style_id)
+            group[2].append(to_rgba(color))
+            group[3].append(linewidth)
+            group[4].append(linestyle)
+
+        style_ids = self._levels.style_ids
+        energies = self.energies
+        starts = self.positions * (self.dimension + self.space)
+        result = []
+        for key, (extra, group_ids, colors, linewidths, linestyles) in groups.items():
+            # local index of the style of every level of the group
+            lookup = np.full(len(self._levels.styles), -1, dtype=np.intp)
+            lookup[group_ids] = np.arange(len(group_ids))
+            local = lookup[style_ids]
+            ids = np.nonzero(local >= 0)[0]
+            if live is not None:
+                ids = ids[live[ids] == want]
+            if not len(ids):
+                continue
+            local = local[ids]
+            y = energies[ids]
+            x = starts[ids]
+            segments = np.stack(
+                [np.column_stack([x, y]), np.column_stack([x + self.dimension, y])],
+                axis=1,
+            )
+            if any(ls != linestyles[0] for ls in linestyles):
+                linestyles = [linestyles[i] for i in local]
+            else:
+                linestyles = linestyles[0]
+            colors = np.asarray(colors)[local]
+            linewidths = np.asarray(linewidths, dtype=float)[local]
+            result.append((key, extra, ids, segments, colors, linewidths, linestyles))
+        return result
+
+    def _draw_levels(self, groups, culler=None):
+        # a LineCollection for every group of _level_groups, returns the
+        # (key, artists, level IDs) records used by refresh
+        from matplotlib.collections import LineCollection
+
+        records = []
+        for key, extra, ids, segments, colors, linewidths, linestyles in groups:
+            collection = LineCollection(
+                segments,
+                colors=colors,
+                linewidths=linewidths,
+                linestyles=linestyles,
+                **extra,
+            )
+            self.ax.add_collection(collection)
+            records.append((key, [collection], ids))
+            if culler is not None:
+                properties = {"color": colors, "linewidth": linewidths}
+                if isinstance(linestyles, list):
+                    properties["linestyle"] = linestyles
+                culler.add_lines(collection, merge=True, **properties)
+        return records
+
+    def plot_level_texts(self, energy, pos, btext, ttext, rtext, ltext):
+        start = pos * (self.dimension + self.space)
+        labels = zip(
+            self._level_label_positions(start, energy),
+            (ttext, rtext, ltext, btext),
+            self._level_label_styles(),
         )
-        # right text
-        self.ax.text(
-            start,  # X
-            energy,  # Y
-            ltext,  # self.left_text
-            horizontalalignment="right",
-            verticalalignment="center",
-            color=self.color_bottom_text,
-            fontsize=self.right_text_fontsize,
+        return [
+            self.ax.text(x, y, text, **style)
+            for (x, y), text, style in labels
+            if not _is_empty(text)
+        ]
+
+    def _level_label_positions(self, start, energy):
+        # top, right, left and bottom text
+        return (
+            (start + 0.5 * self.dimension, energy + self.offset),
+            (start + self.dimension, energy),
+            (start, energy),
+            (start + 0.5 * self.dimension, energy - 2 * self.offset),
         )
-        # left text
-        self.ax.text(
-            start + 0.5 * self.dimension,  # X
-            energy - 2 * self.offset,  # Y
-            btext,  # self.bottom_text
-            horizontalalignment="center",
-            verticalalignment="top",
-            color=self.color_bottom_text,
-            fontsize=self.bottom_text_fontsize,
+
+    def _level_label_styles(self):
+        # top, right, left and bottom text
+        return (
+            {
+                "horizontalalignment": "center",
+                "verticalalignment": "bottom",
+                "color": self.color_top_text,
+                "fontsize": self.top_text_fontsize,
+            },
+            {
+                "horizontalalignment": "left",
+                "verticalalignment": "center",
+                "color": self.color_bottom_text,
+                "fontsize": self.left_text_fontsize,
+            },
+            {
+                "horizontalalignment": "right",
+                "verticalalignment": "center",
+                "color": self.color_bottom_text,
+                "fontsize": self.right_text_fontsize,
+            },
+            {
+                "horizontalalignment": "center",
+                "verticalalignment": "top",
+                "color": self.color_bottom_text,
+                "fontsize": self.bottom_text_fontsize,
+            },
         )
 
-    def plot_link(self, idx, idy, **kwargs):
-        # i is a tuple: (end_level_id,ls,linewidth,color)
+    def _label_groups(self, show_IDs=False):
+        """
+        Method of ED class
+        Collect the non-empty labels of all the levels grouped by style.
+
+        Returns
+        -------
+        list of (style, x, y, texts) with x and y arrays
+        """
+        return [group[1:5] for group in self._label_groups_ids(show_IDs)]
+
+    def _label_groups_ids(self, show_IDs=False, live=None, want=False):
+        # (key, style, x, y, texts, level IDs) of every group of labels, live
+        # and want select the levels as in _level_groups
+        id_style = {"horizontalalignment": "right", "color": "red"}
+        groups = {}
+
+        def add(style, x, y, texts, ids):
+            key = _style_key(style)
+            if key in groups:
+                old = groups[key]
+                x = np.concatenate([old[2], x])
+                y = np.concatenate([old[3], y])
+                texts = old[4] + texts
+                ids = np.concatenate([old[5], ids])
+            groups[key] = (key, style, x, y, texts, ids)
+
+        starts = self.positions * (self.dimension + self.space)
+        energies = self.energies
+        if live is None:
+            selected = np.arange(len(energies))
+            columns = (
+                self.top_texts,
+                self.right_texts,
+                self.left_texts,
+                self.bottom_texts,
+            )
+        else:
+            selected = np.flatnonzero(live == want)
+            picked = selected.tolist()
+            columns = (
+                self._levels.format_top_texts(self.round_energies_at_digit, picked),
+                [self.right_texts[i] for i in picked],
+                [self.left_texts[i] for i in picked],
+                [self.bottom_texts[i] for i in picked],
+            )
+        positions = self._level_label_positions(starts, energies)
+        for (x, y), texts, style in zip(positions, columns, self._level_label_styles()):
+            keep = [i for i, text in enumerate(texts) if not _is_empty(text)]
+            if keep:
+                ids = selected[keep]
+                add(style, x[ids], y[ids], [texts[i] for i in keep], ids)
+        if show_IDs:
+            # for showing the ID allowing the user to identify the level
+            ids = selected
+            if len(ids):
+                add(
+                    id_style,
+                    starts[ids],
+                    energies[ids] + self.offset,
+                    [str(i) for i in ids],
+                    ids,
+                )
+        return list(groups.values())
+
+    def _place_labels(self, groups):
+        """
+        Method of ED class
+        Move the labels overlapping inside a column (labels with the same x
+        and horizontal alignment). Every distinct text is measured once and
+        the labels are spread with energydiagram.placement.spread_labels.
+
+        Returns
+        -------
+        The label groups with the new positions and the (N, 2, 2) array of
+        the leader lines connecting the moved labels to their place
+        """
+        from matplotlib.cbook import is_math_text
+        from matplotlib.font_manager import FontProperties
+        from .placement import spread_labels
+
+        canvas = self.fig.canvas
+        if hasattr(canvas, "get_renderer"):
+            renderer = canvas.get_renderer()
+        else:
+            renderer = self.fig._get_renderer()
+        self.ax.autoscale_view()
+        self.ax.apply_aspect()
+        y0, y1 = self.ax.transData.transform([(0, 0), (0, 1)])[:, 1]
+        # data units per pixel along the energy axis
+        scale = 1.0 / abs(y1 - y0)
+
+        columns = {}
+        keys, centers, heights, shifts = [], [], [], []
+        for style, xs, ys, texts in groups:
+            prop = FontProperties(size=style.get("fontsize"))
+            measured = {}
+            for text in texts:
+                text = str(text)
+                if text not in measured:
+                    lines = text.split("\n")
+                    line_height = max(
+                        renderer.get_text_width_height_descent(
+                            line, prop, ismath=is_math_text(line)
+                        )[1]
+                        for line in lines
+                    )
+                    measured[text] = 1.2 * line_height * len(lines) * scale
+                heights.append(measured[text])
+            h = np.asarray(heights[len(heights) - len(texts) :])
+            valign = style.get("verticalalignment", "baseline")
+            shift = {"top": -0.5, "center": 0.0}.get(valign, 0.5) * h
+            align = style.get("horizontalalignment", "left")
+            for x in np.round(xs, 9):
+                keys.append(columns.setdefault((x, align), len(columns)))
+            centers.append(ys + shift)
+            shifts.append(shift)
+        if not keys:
+            return groups, np.empty((0, 2, 2))
+        heights = np.asarray(heights)
+        centers = np.concatenate(centers)
+        new = spread_labels(keys, centers, heights, pad=2 * scale)
+
+        placed = []
+        leaders = []
+        start = 0
+        for (style, xs, ys, texts), shift in zip(groups, shifts):
+            end = start + len(texts)
+            new_ys = new[start:end] - shift
+            moved = np.abs(new_ys - ys) > 0.5 * heights[start:end]
+            leaders.append(
+                np.stack(
+                    [
+                        np.column_stack([xs[moved], ys[moved]]),
+                        np.column_stack([xs[moved], new_ys[moved]]),
+                    ],
+                    axis=1,
+                )
+            )
+            placed.append((style, xs, new_ys, texts))
+            start = end
+        return placed, np.concatenate(leaders)
+
+    def plot_labels(self, show_IDs=False):
+        """
+        Method of ED class
+        Draw the texts of all the levels. Empty labels are skipped and, when
+        self.batch_rendering is True, the remaining labels are grouped by
+        style and every group is drawn by a single LabelCollection.
+
+        Parameters
+        ----------
+        show_IDs : bool
+            add the IDs of the energy levels
+
+        Returns
+        -------
+        The list of the label artists added to self.ax
+        """
+        return _label_artists(self._draw_labels(self._label_groups_ids(show_IDs)))
+
+    def _draw_labels(self, groups):
+        # the artists of the groups of _label_groups_ids, returns the
+        # (key, artists, level IDs) records used by refresh
+        records = []
+        if self.avoid_label_overlap:
+            placed, leaders = self._place_labels([group[1:5] for group in groups])
+            groups = [
+                group[:1] + placed_group + group[5:]
+                for group, placed_group in zip(groups, placed)
+            ]
+            if len(leaders):
+                from matplotlib.collections import LineCollection
+
+                leader_lines = LineCollection(
+                    leaders, colors="0.5", linewidths=0.5, zorder=1
+                )
+                self.ax.add_collection(leader_lines, autolim=False)
+                records.append((None, [leader_lines], np.empty(0, dtype=np.intp)))
+
+        for key, style, xs, ys, texts, ids in groups:
+            if self.batch_rendering:
+                from .labels import LabelCollection
+
+                labels = LabelCollection(xs, ys, texts, **style)
+                artists = [self.ax.add_artist(labels)]
+            else:
+                artists = [
+                    self.ax.text(x, y, text, **style)
+                    for x, y, text in zip(xs, ys, texts)
+                ]
+            records.append((key, artists, ids))
+        return records
+
+    def _link_vertices(self, idx, idy, line_order):
+        """Vertices of a link: the two ends of a straight line (line_order
+        1) or the points of a quadratic (2) or cubic (3) Bezier curve."""
         start = self.positions[idx] * (self.dimension + self.space)
         x1 = start + self.dimension
         x2 = self.positions[idy] * (self.dimension + self.space)
         y1 = self.energies[idx]
         y2 = self.energies[idy]
-        # draw line
-        line_order = kwargs.pop("line_order")
         if line_order == 1:
             # straight line
-            line = Line2D([x1, x2], [y1, y2], **kwargs)
-            self.ax.add_line(line)
+            return [(x1, y1), (x2, y2)]
         elif line_order == 2:
             # tapered at the top
-            curve = PathPatch(
-                Path(
-                    [(x1, y1), ((x1 + x2) / 2, max(y1, y2)), (x2, y2)],
-                    [Path.MOVETO, Path.CURVE3, Path.CURVE3],
-                ),
-                fc="none",
-                **kwargs,
-            )
-            self.ax.add_patch(curve)
+            return [(x1, y1), ((x1 + x2) / 2, max(y1, y2)), (x2, y2)]
         elif line_order == 3:
             # tapered at bottom and top
-            curve = PathPatch(
-                Path(
-                    [(x1, y1), ((x1 + x2) / 2, y1), ((x1 + x2) / 2, y2), (x2, y2)],
-                    [Path.MOVETO, Path.CURVE4, Path.CURVE4, Path.CURVE4],
-                ),
-                fc="none",
-                **kwargs,
-            )
-            self.ax.add_patch(curve)
+            return [(x1, y1), ((x1 + x2) / 2, y1), ((x1 + x2) / 2, y2), (x2, y2)]
         else:
             raise NotImplementedError
 
-    def plot_arrow(self, idx, idy, position, text, **kwargs):
+    def plot_link(self, idx, idy, **kwargs):
+        from matplotlib.lines import Line2D
+        from matplotlib.patches import PathPatch
+        from matplotlib.path import Path
+
+        # i is a tuple: (end_level_id,ls,linewidth,color)
+        line_order = kwargs.pop("line_order")
+        vertices = self._link_vertices(idx, idy, line_order)
+        # draw line
+        if line_order == 1:
+            (x1, y1), (x2, y2) = vertices
+            line = Line2D([x1, x2], [y1, y2], **kwargs)
+            self.ax.add_line(line)
+        else:
+            curve_code = Path.CURVE3 if line_order == 2 else Path.CURVE4
+            codes = [Path.MOVETO] + [curve_code] * (len(vertices) - 1)
+            curve = PathPatch(Path(vertices, codes), fc="none", **kwargs)
+            self.ax.add_patch(curve)
+
+    def plot_links(self):
+        """
+        Method of ED class
+        Draw all the links grouped by style: the straight links of a style
+        are a single LineCollection and its curved links a single PathPatch
+        whose compound path mixes quadratic and cubic Bezier curves.
+
+        Returns
+        -------
+        The list of artists added to self.ax
+        """
+        return self._draw_links()
+
+    def _draw_links(self, links=None):
+        # the links, or the given (start ID, end ID, kwargs)
+        import matplotlib as mpl
+        from matplotlib.collections import LineCollection
+        from matplotlib.patches import PathPatch
+        from matplotlib.path import Path
+
+        if links is None:
+            links = _edges(self.links)
+        groups = {}
+        for idx, idy, kwargs in links:
+            style = dict(kwargs)
+            line_order = style.pop("line_order")
+            key = _style_key(style)
+            if key not in groups:
+                groups[key] = (style, [], [], [])
+            groups[key][1].append(idx)
+            groups[key][2].append(idy)
+            groups[key][3].append(line_order)
+
+        step = self.dimension + self.space
+        positions = self.positions
+        energies = self.energies
+        artists = []
+        for style, start_ids, end_ids, orders in groups.values():
+            orders = np.asarray(orders)
+            if np.any((orders < 1) | (orders > 3)):
+                raise NotImplementedError
+            x1 = positions[start_ids] * step + self.dimension
+            x2 = positions[end_ids] * step
+            y1 = energies[start_ids]
+            y2 = energies[end_ids]
+            xm = 0.5 * (x1 + x2)
+
+            straight = orders == 1
+            if straight.any():
+                segments = np.stack(
+                    [
+                        np.column_stack([x1[straight], y1[straight]]),
+                        np.column_stack([x2[straight], y2[straight]]),
+                    ],
+                    axis=1,
+                )
+                _, _, linestyle, _ = _split_level_style(style)
+                if linestyle in ("solid", "-"):
+                    capstyle = mpl.rcParams["lines.solid_capstyle"]
+                else:
+                    capstyle = mpl.rcParams["lines.dash_capstyle"]
+                try:
+                    lines = LineCollection(segments, capstyle=capstyle, **style)
+                except (AttributeError, TypeError):
+                    # properties of Line2D not supported by a collection
+                    for idx, idy in zip(
+                        np.asarray(start_ids)[straight], np.asarray(end_ids)[straight]
+                    ):
+                        self.plot_link(idx, idy, line_order=1, **style)
+                else:
+                    artists.append(self.ax.add_collection(lines))
+
+            vertices = []
+            codes = []
+            for order, code in ((2, Path.CURVE3), (3, Path.CURVE4)):
+                curved = orders == order
+                n = np.count_nonzero(curved)
+                if not n:
+                    continue
+                a, b, c, d = x1[curved], y1[curved], x2[curved], y2[curved]
+                m = xm[curved]
+                if order == 2:
+                    # tapered at the top
+                    points = [(a, b), (m, np.maximum(b, d)), (c, d)]
+                else:
+                    # tapered at bottom and top
+                    points = [(a, b), (m, b), (m, d), (c, d)]
+                vertices.append(
+                    np.stack([np.column_stack(p) for p in points], axis=1).reshape(
+                        -1, 2
+                    )
+                )
+                curve_codes = [Path.MOVETO] + [code] * (len(points) - 1)
+                codes.append(np.tile(np.asarray(curve_codes, Path.code_type), n))
+            if vertices:
+                path = Path(np.concatenate(vertices), np.concatenate(codes))
+                curves = PathPatch(path, fc="none", **style)
+                artists.append(self.ax.add_patch(curves))
+        return artists
+
+    def _arrow_geometry(self, idx, idy, position, text):
+        """
+        Method of ED class
+        Compute the position of an arrow between two levels.
+
+        Returns
+        -------
+        x_arrow, x_text, y1, y2, text, ha, bar, support
+            bar is True for the '|-|' arrows drawn on the side of the level
+            and support is (x1, x2) of the supporting line at y2, or None if
+            the levels are in the same position.
+        """
         start = self.positions[idx] * (self.dimension + self.space)
         x_arrow = start + 0.5 * self.dimension
         x_text = x_arrow
         y1 = self.energies[idx]
         y2 = self.energies[idy]
-        gap = y1 - y2
 
         if text is None:
-            if self.round_energies_at_digit == "keep all digits":
-                text = gap
-            else:
-                text = round(gap, self.round_energies_at_digit)
-
-        middle = y1 - 0.5 * gap
-        arrow_width = 20.0
-        arrowprops = {
-            "arrowstyle": "<->",
-            "shrinkA": 0,
-            "shrinkB": 0,
-            "linestyle": "--",
-            "mutation_scale": arrow_width,
-            "color": "green",
-        }
-        bbox = {
-            "boxstyle": "round",
-            "fc": "white",
-            "color": "green",
-        }
-        arrowprops.update({key: kwargs[key] for key in kwargs if key in arrowprops})
-        bbox.update({key: kwargs[key] for key in kwargs if key in bbox})
+            text = self._levels.format_differences(
+                [idx], [idy], self.round_energies_at_digit
+            )[0]
 
         # determine arrow position
         if position == "center":
             ha = "center"
         elif position == "right":
-            arrowprops["arrowstyle"] = "|-|"
-            arrowprops["mutation_scale"] *= 0.2
             x_arrow += 0.5 * self.dimension + 0.2 * self.space
             x_text += 0.5 * self.dimension + 0.5 * self.space
             ha = "left"
         elif position == "left":
-            arrowprops["arrowstyle"] = "|-|"
-            arrowprops["mutation_scale"] *= 0.2
             x_arrow -= 0.5 * self.dimension + 0.2 * self.space
             x_text -= 0.5 * self.dimension + 0.5 * self.space
             ha = "right"
         else:
             raise ValueError
 
-        # double arrow
-        self.ax.annotate(
-            "", xy=(x_arrow, y1), xytext=(x_arrow, y2), arrowprops=arrowprops
-        )
-        # text
-        self.ax.text(x_text, middle, text, bbox=bbox, va="center", ha=ha)
-
-        # draw supporting line if levels are offset
-        line_kwargs = {"color": "green", "linestyle": "--"}
-        line_kwargs.update({key: kwargs[key] for key in kwargs if key in line_kwargs})
+        # supporting line if levels are offset
+        support = None
         p1 = self.positions[idx]
         p2 = self.positions[idy]
         if p1 > p2:
             x2 = p2 * (self.dimension + self.space) + self.dimension
             x1 = p1 * (self.dimension + self.space) + self.dimension
-            line = Line2D([x1, x2], [y2, y2], **line_kwargs)
-            self.ax.add_line(line)
+            support = (x1, x2)
         elif p2 > p1:
             x2 = p2 * (self.dimension + self.space)
             x1 = p1 * (self.dimension + self.space)
-            line = Line2D([x1, x2], [y2, y2], **line_kwargs)
-            self.ax.add_line(line)
+            support = (x1, x2)
+        return x_arrow, x_text, y1, y2, text, ha, position != "center", support
+
+    def plot_arrow(self, idx, idy, position, text, **kwargs):
+        from matplotlib.lines import Line2D
+
+        x_arrow, x_text, y1, y2, text, ha, bar, support = self._arrow_geometry(
+            idx, idy, position, text
+        )
+        middle = y1 - 0.5 * (y1 - y2)
+        arrowprops, bbox, line_kwargs = _arrow_styles(kwargs, bar)
+
+        # double arrow
+        artists = [
+            self.ax.annotate(
+                "", xy=(x_arrow, y1), xytext=(x_arrow, y2), arrowprops=arrowprops
+            )
+        ]
+        # text
+        artists.append(
+            self.ax.text(x_text, middle, text, bbox=bbox, va="center", ha=ha)
+        )
+
+        # draw supporting line if levels are offset
+        if support is not None:
+            line = Line2D(support, [y2, y2], **line_kwargs)
+            artists.append(self.ax.add_line(line))
+        return artists
+
+    def plot_arrows(self):
+        """
+        Method of ED class
+        Draw all the arrows with a few artists: the shafts and the supporting
+        lines are LineCollections, the heads are markers and the gap labels
+        LabelCollections, grouped by style. Unlike plot_arrow the geometry
+        is computed once and not recomputed by matplotlib at every draw.
+
+        Returns
+        -------
+        The list of artists added to self.ax
+        """
+        return self._draw_arrows()
+
+    def _draw_arrows(self, arrows=None):
+        # the arrows, or the given (start ID, end ID, position, text, kwargs)
+        import matplotlib as mpl
+        from matplotlib.collections import LineCollection
+        from matplotlib.lines import Line2D
+        from matplotlib.path import Path
+        from .labels import LabelCollection
+
+        shafts = {}
+        heads = {}
+        labels = {}
+        supports = {}
+
+        def add(groups, style, *values):
+            key = _style_key(style)
+            if key not in groups:
+                groups[key] = (style,) + tuple([] for _ in values)
+            for column, value in zip(groups[key][1:], values):
+                column.append(value)
+
+        if arrows is None:
+            arrows = _edges(self.arrows)
+        # the gap labels printing the energy difference, formatted at once
+        auto = [i for i, arrow in enumerate(arrows) if arrow[3] is None]
+        if auto:
+            gaps = self._levels.format_differences(
+                [arrows[i][0] for i in auto],
+                [arrows[i][1] for i in auto],
+                self.round_energies_at_digit,
+            )
+            arrows = list(arrows)
+            for i, gap in zip(auto, gaps):
+                arrows[i] = arrows[i][:3] + (gap,) + arrows[i][4:]
+        artists = []
+        for idx, idy, position, text, kwargs in arrows:
+            x_arrow, x_text, y1, y2, text, ha, bar, support = self._arrow_geometry(
+                idx, idy, position, text
+            )
+            arrowprops, bbox, line_kwargs = _arrow_styles(kwargs, bar)
+            ends = _ARROW_HEADS.get(arrowprops["arrowstyle"])
+            if ends is None or arrowprops["shrinkA"] or arrowprops["shrinkB"]:
+                # not expressed by the markers, drawn as by annotate
+                artists.extend(self.plot_arrow(idx, idy, position, text, **kwargs))
+                continue
+            shaft_style = {
+                "color": arrowprops["color"],
+                "linestyle": arrowprops["linestyle"],
+            }
+            add(shafts, shaft_style, ((x_arrow, y1), (x_arrow, y2)))
+            # as in annotate the arrow goes from y2 (A) to y1 (B)
+            for head, y, other in zip(ends, (y2, y1), (y1, y2)):
+                if head is None:
+                    continue
+                head_style = {
+                    "color": arrowprops["color"],
+                    "head": head,
+                    # the bars have no direction and share their markers
+                    "up": head == "bar" or y >= other,
+                    "size": arrowprops["mutation_scale"],
+                }
+                add(heads, head_style, x_arrow, y)
+            label_style = {"bbox": bbox, "ha": ha, "va": "center"}
+            add(labels, label_style, x_text, y1 - 0.5 * (y1 - y2), text)
+            if support is not None:
+                segment = ((support[0], y2), (support[1], y2))
+                add(supports, line_kwargs, segment)
+
+        for style, segments in shafts.values():
+            lines = LineCollection(
+                segments,
+                colors=style["color"],
+                linestyles=style["linestyle"],
+                linewidths=mpl.rcParams["patch.linewidth"],
+                clip_on=False,
+            )
+            # like annotate, the arrows do not change the data limits
+            artists.append(self.ax.add_collection(lines, autolim=False))
+        for style, xs, ys in heads.values():
+            size = style["size"]
+            if style["head"] == "bar":
+                marker = "_"
+                markersize = size
+            else:
+                # heads as in the '->' and '-|>' arrowstyles
+                sign = 1 if style["up"] else -1
+                vertices = [(-0.2, -0.4 * sign), (0, 0), (0.2, -0.4 * sign)]
+                if style["head"] == "filled":
+                    marker = Path(vertices + [vertices[0]], closed=True)
+                else:
+                    marker = Path(vertices)
+                markersize = 0.8 * size
+            filled = style["head"] == "filled"
+            tips = Line2D(
+                xs,
+                ys,
+                linestyle="None",
+                marker=marker,
+                markersize=markersize,
+                fillstyle="full" if filled else "none",
+                markerfacecolor=style["color"] if filled else "none",
+                markeredgecolor=style["color"],
+                markeredgewidth=mpl.rcParams["patch.linewidth"],
+                clip_on=False,
+            )
+            artists.append(self.ax.add_artist(tips))
+        for style, xs, ys, texts in labels.values():
+            gaps = LabelCollection(xs, ys, texts, **style)
+            artists.append(self.ax.add_artist(gaps))
+        for style, segments in supports.values():
+            _, _, linestyle, _ = _split_level_style(style)
+            if linestyle in ("solid", "-"):
+                capstyle = mpl.rcParams["lines.solid_capstyle"]
+            else:
+                capstyle = mpl.rcParams["lines.dash_capstyle"]
+            lines = LineCollection(segments, capstyle=capstyle, **style)
+            artists.append(self.ax.add_collection(lines))
+        return artists
 
     def plot(
-        self, show_IDs=False, ylabel="Energy / $kcal$ $mol^{-1}$", ax: plt.Axes = None
+        self,
+        show_IDs=False,
+        ylabel=None,
+        ax: "matplotlib.axes.Axes" = None,
+        pyplot=True,
     ):
         r"""
         Method of ED class
@@ -397,11 +1629,16 @@ class ED:
         show_IDs : bool
             show the IDs of the energy levels
         ylabel : str
-            The label to use on the left-side axis. "Energy / $kcal$
-            $mol^{-1}$" by default.
+            The label to use on the left-side axis. By default the energy
+            in the unit of the diagram, e.g. "Energy / $kcal$ $mol^{-1}$".
         ax : plt.Axes
             The axes to plot onto. If not specified, a Figure and Axes will be
             created for you.
+        pyplot : bool
+            Create the Figure with pyplot. Use False for a standalone Figure
+            that pyplot does not keep alive, e.g. in long-running services
+            (see also energydiagram.figures.FigurePool). Ignored if ax is
+            specified.
 
         Returns
         -------
@@ -409,70 +1646,586 @@ class ED:
 
         """
 
-        # Create a figure and axis if the user didn't specify them.
-        if not ax:
-            self.fig = plt.figure()
-            self.ax = self.fig.add_subplot(111, aspect=self.aspect)
-        # Otherwise register the axes and figure the user passed.
-        # This is useful if you want to add the diagram to an existing ax.di
-        else:
-            self.ax = ax
-            self.fig = ax.figure
+        stats = RenderStats() if self.profile else None
+        if stats is not None:
+            self.last_render_stats = stats
+
+        with self.__phase(stats, "setup", None):
+            # Create a figure and axis if the user didn't specify them.
+            if not ax:
+                if pyplot:
+                    import matplotlib.pyplot as plt
+
+                    self.fig = plt.figure()
+                else:
+                    from .figures import new_figure
+
+                    self.fig = new_figure()
+                self.ax = self.fig.add_subplot(111, aspect=self.aspect)
+            # Otherwise register the axes and figure the user passed.
+            # This is useful if you want to add the diagram to an existing ax.di
+            else:
+                self.ax = ax
+                self.fig = ax.figure
+
+                # Constrain the target axis to have the proper aspect ratio
+                self.ax.set_aspect(self.aspect)
+
+            if ylabel is None:
+                from .units import axis_label
 
-            # Constrain the target axis to have the proper aspect ratio
-            self.ax.set_aspect(self.aspect)
+                self.ax.set_ylabel(axis_label(self.unit))
+            else:
+                self.ax.set_ylabel(ylabel)
+            self.ax.axes.get_xaxis().set_visible(False)
+            self.ax.spines["top"].set_visible(False)
+            self.ax.spines["right"].set_visible(False)
+            self.ax.spines["bottom"].set_visible(False)
+
+        with self.__phase(stats, "auto_adjust"):
+            self.__auto_adjust()
+
+        culler = None
+        if self.level_of_detail and self.batch_rendering:
+            from .lod import ViewportCuller
+
+            culler = ViewportCuller(self.ax, feature_size=self.dimension)
+        self.culler = culler
+        # artists of every level, label, arrow, link and box, see refresh
+        rendered = {}
+
+        with self.__phase(stats, "levels"):
+            if self.batch_rendering:
+                rendered["levels"] = self._draw_levels(self._level_groups(), culler)
+                self.ax.autoscale_view()
+            else:
+                for energy, pos, kwargs in zip(
+                    self.energies, self.positions, self.level_kwargs
+                ):
+                    start = pos * (self.dimension + self.space)
+                    self.ax.hlines(energy, start, start + self.dimension, **kwargs)
+
+        with self.__phase(stats, "labels"):
+            rendered["labels"] = self._draw_labels(self._label_groups_ids(show_IDs))
+            self.label_artists = _label_artists(rendered["labels"])
+            if culler is not None:
+                for artist in self.label_artists:
+                    culler.add(artist, merge=True)
+
+        with self.__phase(stats, "arrows"):
+            if self.batch_rendering:
+                rendered["arrows"] = [(None, self.plot_arrows(), None)]
+            else:
+                for idx, arrow in enumerate(self.arrows):
+                    # x1, x2   y1, y2
+                    for idy, position, text, kwargs in arrow:
+                        self.plot_arrow(idx, idy, position, text, **kwargs)
+
+        with self.__phase(stats, "links"):
+            if self.batch_rendering:
+                rendered["links"] = [(None, self.plot_links(), None)]
+            else:
+                for idx, link in enumerate(self.links):
+                    # here we connect the levels with the links
+                    # x1, x2   y1, y2
+                    for idy, kwargs in link:
+                        self.plot_link(idx, idy, **kwargs)
+
+        from .box_notation import plot_orbital_boxes, plot_orbital_boxes_batch
+
+        with self.__phase(stats, "electron_boxes"):
+            if self.batch_rendering:
+                boxes = plot_orbital_boxes_batch(self.ax, self._electron_boxes_xy())
+                rendered["boxes"] = [(None, boxes, None)]
+            else:
+                for box in self._electron_boxes_xy():
+                    # here we add the boxes
+                    # x,y,boxes,electrons,side,spacing_f
+                    x, y, boxes, electrons, side, spacing_f = box
+                    plot_orbital_boxes(self.ax, x, y, boxes, electrons, side, spacing_f)
+
+        if culler is not None:
+            for kind in ("links", "boxes"):
+                for artist in rendered[kind][0][1]:
+                    culler.add(artist)
+
+        rendered["plot"] = (show_IDs, ylabel)
+        rendered["structure"] = self._structure()
+        # levels changed by update_level and drawn by separate artists
+        rendered["live"] = None
+        rendered["live_levels"] = []
+        rendered["live_labels"] = []
+        rendered["live_records"] = []
+        rendered["live_artists"] = []
+        self._rendered = rendered
+        self._changed_levels = set()
+        if self._blit is not None:
+            self._blit.disconnect()
+            self._blit = None
+
+        if culler is not None:
+            with self.__phase(stats, "culling"):
+                culler.connect()
+
+        if callable(self.profile):
+            self.profile(stats)
+
+    def draw(self):
+        """
+        Method of ED class
+        Draw the figure of the last call of plot with fig.canvas.draw. The
+        time is added to self.last_render_stats when self.profile is set.
+        """
+        with self.__phase(self.__current_stats(), "draw", None):
+            self.fig.canvas.draw()
+        self.__report()
+
+    def savefig(self, fname, **kwargs):
+        """
+        Method of ED class
+        Save the figure of the last call of plot with fig.savefig. The time
+        is added to self.last_render_stats when self.profile is set.
+
+        Parameters
+        ----------
+        fname : str or file-like object
+            the file name or object
+        **kwargs
+            passed to fig.savefig (e.g. format, dpi)
+        """
+        with self.__phase(self.__current_stats(), "savefig", None):
+            self.fig.savefig(fname, **kwargs)
+        self.__report()
+
+    def update_level(self, level, **changes):
+        """
+        Method of ED class
+        Change a level of a plotted diagram, call refresh to update the
+        figure. Changes of the levels between the calls of refresh are
+        collected, so several levels can be updated at once.
+
+        Parameters
+        ----------
+        level : int or str
+                The ID, the key or the bottom text of the level
+        **changes
+                The new energy, position, bottom_text, top_text (None prints
+                the energy), right_text or left_text of the level, and the
+                properties of its line, e.g. color, linewidth or linestyle.
+        """
+        level_id = self._levels.level_id(level)
+        texts = {
+            name: changes.pop(name)
+            for name in ("top_text", "bottom_text", "left_text", "right_text")
+            if name in changes
+        }
+        energy = changes.pop("energy", None)
+        position = changes.pop("position", None)
+        if position is not None and not isinstance(position, (int, float, np.number)):
+            position = self.positions[self._levels.level_id(position)]
+        style_id = None
+        if changes:
+            style = dict(self._levels.styles[self._levels.style_ids[level_id]])
+            style.update(changes)
+            style_id = self._levels.intern_style(style)
+        self._levels.update(level_id, energy, position, style_id, **texts)
+        self._changed_levels.add(level_id)
+
+    def refresh(self, blit=True):
+        """
+        Method of ED class
+        Update the figure of the last call of plot after update_level,
+        without creating a new figure. The changed levels become live: their
+        lines and labels, and the arrows, links and electron boxes touching
+        them, move to separate artists, and the other artists are drawn once
+        as a static background. Later changes of live levels redraw only
+        the live artists over the background, which takes milliseconds.
+        Changes of the automatic layout, level_of_detail or
+        avoid_label_overlap update all the artists, and adding levels,
+        links, arrows or boxes, changing the plot parameters or turning off
+        batch_rendering plots the diagram again on the same axes.
+
+        Parameters
+        ----------
+        blit : bool
+            Draw the live artists over the cached background when the
+            canvas supports it (see energydiagram.blit), else request a full
+            draw with draw_idle. The limits of the axes follow the new data,
+            except with level_of_detail. (default True)
+        """
+        if self.ax is None or self._rendered is None:
+            raise RuntimeError("The diagram must be plotted before refreshing it")
+        stats = self.__current_stats()
+        with self.__phase(stats, "refresh", None):
+            limits = (self.ax.get_xlim(), self.ax.get_ylim())
+            static = self.__refresh_artists()
+            moved = limits != (self.ax.get_xlim(), self.ax.get_ylim())
+        with self.__phase(stats, "redraw", None):
+            canvas = self.fig.canvas
+            if not blit or not getattr(canvas, "supports_blit", False):
+                if self._blit is not None:
+                    self._blit.disconnect()
+                    self._blit = None
+                canvas.draw_idle()
+            else:
+                from .blit import BlitManager
+
+                live = self._rendered["live_artists"]
+                if self._blit is None or self._blit.canvas is not canvas:
+                    self._blit = BlitManager(canvas, live)
+                else:
+                    self._blit.set_artists(live)
+                if static or moved:
+                    self._blit.invalidate()
+                self._blit.update()
+        self.__report()
+
+    def animate(
+        self,
+        energy_frames,
+        filename=None,
+        fps=30,
+        dpi=None,
+        show_IDs=False,
+        ylabel=None,
+        **kwargs,
+    ):
+        """
+        Method of ED class
+        Animate the energies of the levels, e.g. along a scan of the
+        temperature or the frames of a trajectory. The diagram is plotted
+        once with the layout and the limits of the axes fitting all the
+        frames, then every frame changes only the levels, their labels and
+        the links and arrows between them, which are blitted over the
+        static background as in refresh. The energies of the diagram are
+        not changed, only its figure shows the frames.
+
+        Parameters
+        ----------
+        energy_frames : 2D array
+            The energies of all the levels (columns) in every frame (rows).
+        filename : str
+            Stream the frames to this file without keeping them in memory:
+            a GIF, or a video written by ffmpeg (e.g. mp4 or webm). If None
+            (default) return a matplotlib FuncAnimation to show the
+            animation.
+        fps : float
+            Frames per second. (default 30)
+        dpi : float
+            The resolution of the frames, by default the one of the figure.
+        show_IDs, ylabel
+            As in plot.
+        **kwargs
+            Passed to FuncAnimation (e.g. repeat) when filename is None,
+            else to energydiagram.animation.open_stream (loop of a GIF,
+            codec or extra_args of ffmpeg).
+
+        Returns
+        -------
+        matplotlib.animation.FuncAnimation or filename
+        """
+        frames = np.asarray(energy_frames, dtype=float)
+        if frames.ndim != 2 or not len(frames) or frames.shape[1] != len(self._levels):
+            raise ValueError(
+                "energy_frames must have a row of %d energies for every frame"
+                % len(self._levels)
+            )
+        extent = (frames.min(), frames.max())
+        levels = self._levels
+        # the frames are drawn with the layout of all of them and the levels
+        # get back their energies and statistics after every frame
+        saved = levels.energy_state()
+        levels.set_energies(frames[0], extent)
+        try:
+            if self._rendered is not None:
+                if self.culler is not None:
+                    self.culler.disconnect()
+                if self._blit is not None:
+                    self._blit.disconnect()
+                self.ax.cla()
+                self.plot(show_IDs, ylabel, ax=self.ax)
+            else:
+                self.plot(show_IDs, ylabel, pyplot=filename is None)
+        finally:
+            levels.restore_energy_state(saved)
+        # the limits stay the ones of all the frames
+        x = self.ax.dataLim.intervalx
+        self.ax.update_datalim([(x[0], extent[0]), (x[0], extent[1])])
+        self.ax.autoscale_view()
+        self.ax.set_autoscale_on(False)
+        # all the levels are live and the background has only the axes
+        self._changed_levels = set(range(len(self._levels)))
+
+        def update(i):
+            levels.set_energies(frames[i], extent)
+            try:
+                return self.__refresh_artists()
+            finally:
+                levels.restore_energy_state(saved)
+
+        if filename is None:
+            from matplotlib.animation import FuncAnimation
+
+            def draw_frame(i):
+                update(i)
+                return self._rendered["live_artists"]
+
+            kwargs.setdefault("interval", 1000.0 / fps)
+            # without live artists every frame changes the background
+            blit = self.batch_rendering and self.culler is None
+            blit = blit and not self.avoid_label_overlap
+            return FuncAnimation(
+                self.fig, draw_frame, frames=len(frames), blit=blit, **kwargs
+            )
+
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+        from .animation import open_stream
+        from .blit import BlitManager
+
+        original_canvas, original_dpi = self.fig.canvas, self.fig.dpi
+        canvas = FigureCanvasAgg(self.fig)
+        if dpi is not None:
+            self.fig.dpi = dpi
+        manager = BlitManager(canvas)
+        stream = None
+        try:
+            for i in range(len(frames)):
+                static = update(i)
+                manager.set_artists(self._rendered["live_artists"])
+                if static:
+                    manager.invalidate()
+                manager.update()
+                rgba = np.asarray(canvas.buffer_rgba())
+                if stream is None:
+                    size = (rgba.shape[1], rgba.shape[0])
+                    stream = open_stream(filename, fps, size, **kwargs)
+                stream.write(rgba)
+            stream.close()
+        except BaseException:
+            if stream is not None:
+                # the error of the frames is reported, not the one of the
+                # incomplete file
+                try:
+                    stream.close()
+                except Exception:
+                    pass
+            raise
+        finally:
+            manager.disconnect()
+            self.fig.dpi = original_dpi
+            self.fig.set_canvas(original_canvas)
+        return filename
+
+    def _structure(self):
+        # what refresh can not update in place
+        return (
+            len(self._levels),
+            sum(map(len, self.links)),
+            sum(map(len, self.arrows)),
+            len(self.electons_boxes),
+            self.batch_rendering,
+            repr(self._plot_parameters()),
+        )
 
-        self.ax.set_ylabel(ylabel)
-        self.ax.axes.get_xaxis().set_visible(False)
-        self.ax.spines["top"].set_visible(False)
-        self.ax.spines["right"].set_visible(False)
-        self.ax.spines["bottom"].set_visible(False)
+    def __refresh_artists(self):
+        # update the artists after update_level, True if the static artists
+        # changed
+        rendered = self._rendered
+        changed = list(self._changed_levels)
+        self._changed_levels = set()
+        if rendered["structure"] != self._structure() or not self.batch_rendering:
+            # the artists of every item are only kept by batch rendering
+            if self.culler is not None:
+                self.culler.disconnect()
+            if self._blit is not None:
+                self._blit.disconnect()
+            self.ax.cla()
+            show_IDs, ylabel = rendered["plot"]
+            self.plot(show_IDs, ylabel, ax=self.ax)
+            return True
 
+        layout = (self.dimension, self.space, self.offset)
         self.__auto_adjust()
+        old = rendered["live"]
+        if (
+            layout != (self.dimension, self.space, self.offset)
+            or self.culler is not None
+            or self.avoid_label_overlap
+        ):
+            # every artist moved, shows only the items culled for the view
+            # or depends on the placement of all the labels
+            live = None
+        else:
+            live = np.zeros(len(self._levels), dtype=bool)
+            if old is not None:
+                live |= old
+            live[changed] = True
 
-        data = list(
-            zip(
-                self.energies,  # 0
-                self.positions,  # 1
-                self.bottom_texts,  # 2
-                self.top_texts,  # 3
-                self.right_texts,  # 5
-                self.left_texts,  # 6
-                self.level_kwargs,
+        _remove_artists(rendered["live_records"])
+        static = live is None or old is None or not np.array_equal(live, old)
+        if static:
+            _remove_artists(rendered["live_levels"] + rendered["live_labels"])
+            rendered["live_levels"] = []
+            rendered["live_labels"] = []
+            self.__update_static(live)
+        rendered["live"] = live
+        records = []
+        if live is not None:
+            # the lines and the labels of the live levels are updated in
+            # place, the arrows, the links and the boxes drawn again
+            show_IDs = rendered["plot"][0]
+            rendered["live_levels"] = self._redraw_levels(
+                rendered["live_levels"], self._level_groups(live, True)
+            )
+            rendered["live_labels"] = self._redraw_labels(
+                rendered["live_labels"], self._label_groups_ids(show_IDs, live, True)
             )
-        )  # 7
+            arrows, links = rendered["live_edges"]
+            records.append((None, self._draw_arrows(arrows), None))
+            records.append((None, self._draw_links(links), None))
+            boxes = self._electron_boxes_xy(live, True)
+            if boxes:
+                from .box_notation import plot_orbital_boxes_batch
 
-        for energy, pos, btext, ttext, rtext, ltext, kwargs in data:
-            self.plot_level(energy, pos, btext, ttext, rtext, ltext, **kwargs)
+                records.append((None, plot_orbital_boxes_batch(self.ax, boxes), None))
+        for labels in _label_artists(rendered["live_labels"]):
+            # drawn again at every refresh
+            labels.set_raster_cache()
+        rendered["live_records"] = records
+        records = rendered["live_levels"] + rendered["live_labels"] + records
+        rendered["live_artists"] = [
+            artist for _, artists, _ in records for artist in artists
+        ]
+        self.label_artists = _label_artists(rendered["labels"]) + _label_artists(
+            rendered["live_labels"]
+        )
 
-        if show_IDs:
-            # for showing the ID allowing the user to identify the level
-            for ind, level in enumerate(data):
-                start = level[1] * (self.dimension + self.space)
-                self.ax.text(
-                    start,
-                    level[0] + self.offset,
-                    str(ind),
-                    horizontalalignment="right",
-                    color="red",
-                )
+        if self.culler is None:
+            # the limits of the static artists and of the live levels, the
+            # links and the arrows lie between the levels
+            self.ax.dataLim.set_points(rendered["static_limits"])
+            if live is not None and live.any():
+                self.ax.update_datalim(self.__level_corners(live))
+            self.ax.autoscale_view()
+        return static
+
+    def _redraw_levels(self, records, groups):
+        # update the records of _draw_levels with new groups, in place when
+        # they have the same keys
+        if [group[0] for group in groups] != [record[0] for record in records]:
+            _remove_artists(records)
+            return self._draw_levels(groups)
+        updated = []
+        for (_, artists, _), group in zip(records, groups):
+            key, extra, ids, segments, colors, linewidths, linestyles = group
+            collection = artists[0]
+            collection.set_segments(segments)
+            collection.set_color(colors)
+            collection.set_linestyle(linestyles)
+            collection.set_linewidth(linewidths)
+            updated.append((key, artists, ids))
+        return updated
 
-        for idx, arrow in enumerate(self.arrows):
-            # x1, x2   y1, y2
-            for idy, position, text, kwargs in arrow:
-                self.plot_arrow(idx, idy, position, text, **kwargs)
+    def _redraw_labels(self, records, groups):
+        # as _redraw_levels for the records of _draw_labels
+        if self.avoid_label_overlap or [group[0] for group in groups] != [
+            record[0] for record in records
+        ]:
+            _remove_artists(records)
+            return self._draw_labels(groups)
+        updated = []
+        for (_, artists, _), (key, style, xs, ys, texts, ids) in zip(records, groups):
+            artists[0].set_data(xs, ys, texts)
+            updated.append((key, artists, ids))
+        return updated
 
-        for idx, link in enumerate(self.links):
-            # here we connect the levels with the links
-            # x1, x2   y1, y2
-            for idy, kwargs in link:
-                self.plot_link(idx, idy, **kwargs)
+    def __level_corners(self, live):
+        # ends of the live levels and corners of their electron boxes
+        from .box_notation import orbital_boxes_vertices
 
-        for box in self.electons_boxes:
-            # here we add the boxes
-            # x,y,boxes,electrons,side,spacing_f
-            x, y, boxes, electrons, side, spacing_f = box
-            plot_orbital_boxes(self.ax, x, y, boxes, electrons, side, spacing_f)
+        ids = np.flatnonzero(live)
+        x = self.positions[ids] * (self.dimension + self.space)
+        y = self.energies[ids]
+        corners = [np.column_stack([x, y]), np.column_stack([x + self.dimension, y])]
+        boxes = self._electron_boxes_xy(live, True)
+        if boxes:
+            corners.append(orbital_boxes_vertices(boxes)[0].reshape(-1, 2))
+        return np.concatenate(corners)
+
+    def __update_static(self, live):
+        # the artists of the levels that are not live, updated in place when
+        # the groups are the same
+        rendered = self._rendered
+        show_IDs = rendered["plot"][0]
+        level_groups = self._level_groups(live, False)
+        rendered["levels"] = self._redraw_levels(rendered["levels"], level_groups)
+        rendered["labels"] = self._redraw_labels(
+            rendered["labels"], self._label_groups_ids(show_IDs, live, False)
+        )
+
+        # the arrows and the links touching a live level are live too
+        live_edges = []
+        for kind, edges, draw in (
+            ("arrows", _edges(self.arrows), self._draw_arrows),
+            ("links", _edges(self.links), self._draw_links),
+        ):
+            if live is None:
+                moving = []
+            else:
+                moving = [edge for edge in edges if live[edge[0]] or live[edge[1]]]
+                edges = [edge for edge in edges if not (live[edge[0]] or live[edge[1]])]
+            live_edges.append(moving)
+            _remove_artists(rendered[kind])
+            rendered[kind] = [(None, draw(edges), None)]
+        rendered["live_edges"] = live_edges
+        _remove_artists(rendered["boxes"])
+        boxes = self._electron_boxes_xy(live, False)
+        if boxes:
+            from .box_notation import plot_orbital_boxes_batch
+
+            rendered["boxes"] = [(None, plot_orbital_boxes_batch(self.ax, boxes), None)]
+        else:
+            rendered["boxes"] = [(None, [], None)]
+
+        if self.culler is None:
+            self.ax.relim()
+            rendered["static_limits"] = self.ax.dataLim.get_points().copy()
+        else:
+            from .lod import ViewportCuller
+
+            self.culler.disconnect()
+            culler = ViewportCuller(self.ax, feature_size=self.dimension)
+            for group, (_, artists, _) in zip(level_groups, rendered["levels"]):
+                _, _, _, _, colors, linewidths, linestyles = group
+                properties = {"color": colors, "linewidth": linewidths}
+                if isinstance(linestyles, list):
+                    properties["linestyle"] = linestyles
+                culler.add_lines(artists[0], merge=True, **properties)
+            for artist in _label_artists(rendered["labels"]):
+                culler.add(artist, merge=True)
+            for kind in ("links", "boxes"):
+                for artist in rendered[kind][0][1]:
+                    culler.add(artist)
+            culler.connect()
+            self.culler = culler
+
+    def __phase(self, stats, name, ax=False):
+        # time a phase of the render, a shared no-op when not profiling
+        if stats is None:
+            return _NO_PHASE
+        return stats.phase(name, self.ax if ax is False else ax)
+
+    def __current_stats(self):
+        if not self.profile:
+            return None
+        if self.last_render_stats is None:
+            self.last_render_stats = RenderStats()
+        return self.last_render_stats
+
+    def __report(self):
+        if callable(self.profile):
+            self.profile(self.last_render_stats)
 
     def __auto_adjust(self):
         """
@@ -487,14 +2240,141 @@ class ED:
         self.offset
 
         """
+        stats = self._levels.stats
         # Max range between the energy
-        Energy_variation = abs(max(self.energies) - min(self.energies))
-        if self.dimension == "auto" or self.space == "auto":
+        Energy_variation = stats.energy_range
+        if self.__is_auto("dimension") or self.__is_auto("space"):
             # Unique positions of the levels
-            unique_positions = float(len(set(self.positions)))
+            unique_positions = float(max(stats.unique_positions, 1))
             space_for_level = Energy_variation * self.ratio / unique_positions
-            self.dimension = space_for_level * 0.5
-            self.space = space_for_level * 0.5
+            for name in ("dimension", "space"):
+                if self.__is_auto(name):
+                    self._layout[name] = space_for_level * 0.5
+
+        if self.__is_auto("offset"):
+            self._layout["offset"] = Energy_variation * self.offset_ratio
+
+    def __is_auto(self, name):
+        # True if the parameter is "auto" or still holds the value computed
+        # by __auto_adjust, in this case it follows the levels added later
+        return self._auto_layout[name]
+
+
+# context of the phases of a render when profiling is off
+_NO_PHASE = nullcontext()
+
+
+def _read_only(array):
+    # a view of a column that can not change the levels behind their
+    # statistics
+    view = array.view()
+    view.flags.writeable = False
+    return view
+
+
+def _label_artists(records):
+    # the label artists of the records of _draw_labels, without the leaders
+    return [
+        artist for key, artists, _ in records if key is not None for artist in artists
+    ]
+
+
+def _remove_artists(records):
+    for _, artists, _ in records:
+        for artist in artists:
+            artist.remove()
+
+
+def _edges(edge_lists):
+    """Flatten the links or the arrows to (start ID, end ID, ...) tuples."""
+    return [
+        (idx,) + tuple(edge) for idx, edges in enumerate(edge_lists) for edge in edges
+    ]
+
+
+# attributes of ED changing the rendering, besides the data and the layout
+_PLOT_PARAMETERS = (
+    "ratio",
+    "offset_ratio",
+    "color_bottom_text",
+    "color_top_text",
+    "aspect",
+    "round_energies_at_digit",
+    "unit",
+    "top_text_fontsize",
+    "bottom_text_fontsize",
+    "right_text_fontsize",
+    "left_text_fontsize",
+    "avoid_label_overlap",
+    "level_of_detail",
+)
+
+
+# the heads at the start (A, the end level) and at the end (B, the start
+# level) of the arrowstyles drawn by markers in _draw_arrows
+_ARROW_HEADS = {
+    "-": (None, None),
+    "->": (None, "open"),
+    "<-": ("open", None),
+    "<->": ("open", "open"),
+    "-|>": (None, "filled"),
+    "<|-": ("filled", None),
+    "<|-|>": ("filled", "filled"),
+    "|-|": ("bar", "bar"),
+}
+
+
+def _arrow_styles(kwargs, bar):
+    """Properties of the arrow, of the box of the gap label and of the
+    supporting line, overridden by the kwargs of add_arrow."""
+    arrow_width = 20.0
+    arrowprops = {
+        "arrowstyle": "<->",
+        "shrinkA": 0,
+        "shrinkB": 0,
+        "linestyle": "--",
+        "mutation_scale": arrow_width,
+        "color": "green",
+    }
+    bbox = {
+        "boxstyle": "round",
+        "fc": "white",
+        "color": "green",
+    }
+    line_kwargs = {"color": "green", "linestyle": "--"}
+    arrowprops.update({key: kwargs[key] for key in kwargs if key in arrowprops})
+    bbox.update({key: kwargs[key] for key in kwargs if key in bbox})
+    line_kwargs.update({key: kwargs[key] for key in kwargs if key in line_kwargs})
+    if bar:
+        arrowprops["arrowstyle"] = "|-|"
+        arrowprops["mutation_scale"] *= 0.2
+    return arrowprops, bbox, line_kwargs
+
+
+# aliases accepted by hlines/Line2D for the per-segment properties of a level
+_LEVEL_STYLE_ALIASES = {
+    "color": ("color", "colors", "c"),
+    "linewidth": ("linewidth", "linewidths", "lw"),
+    "linestyle": ("linestyle", "linestyles", "ls"),
+}
+
+
+def _split_level_style(kwargs):
+    """Split the kwargs of a level in color, linewidth, linestyle and the
+    remaining properties that must be shared by a whole LineCollection."""
+    extra = dict(kwargs)
+    values = {}
+    for name, aliases in _LEVEL_STYLE_ALIASES.items():
+        values[name] = None
+        for alias in aliases:
+            if alias in extra:
+                values[name] = extra.pop(alias)
+    linestyle = values["linestyle"]
+    if linestyle is None:
+        linestyle = "solid"
+    return values["color"], values["linewidth"], linestyle, extra
+
 
-        if self.offset == "auto":
-            self.offset = Energy_variation * self.offset_ratio
+def _is_empty(text):
+    """True if a label would not draw anything."""
+    return text is None or (isinstance(text, str) and text == "")
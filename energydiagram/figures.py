@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+Figures that are not managed by pyplot.
+
+plt.figure registers every figure in the pyplot figure manager, which keeps
+it alive until plt.close is called. The figures created here have their own
+Agg canvas and are released as soon as they are no longer referenced, and
+FigurePool reuses them between renders.
+
+@author: giacomo
+"""
+
+import copy
+import io
+import threading
+from contextlib import contextmanager
+
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+
+def new_figure(**kwargs):
+    """Create a Figure with an Agg canvas not registered in pyplot.
+
+    Args:
+        **kwargs: Arguments passed to matplotlib.figure.Figure.
+
+    Returns:
+        matplotlib.figure.Figure: The figure.
+    """
+    fig = Figure(**kwargs)
+    FigureCanvasAgg(fig)
+    return fig
+
+
+class FigurePool:
+    """A pool of reusable standalone figures with a single axes each.
+
+    Args:
+        size (int, optional): Maximum number of idle figures kept in the
+            pool. Defaults to 1.
+        **figure_kwargs: Arguments passed to matplotlib.figure.Figure.
+
+    Example:
+        >>> pool = FigurePool()
+        >>> with pool.axes() as ax:
+        ...     diagram.plot(ax=ax)
+        ...     diagram.fig.savefig(buffer, format="png")
+    """
+
+    def __init__(self, size=1, **figure_kwargs):
+        self.size = size
+        self.figure_kwargs = figure_kwargs
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Return a cleared axes, creating a new figure if none is idle."""
+        with self._lock:
+            ax = self._idle.pop() if self._idle else None
+        if ax is None:
+            ax = new_figure(**self.figure_kwargs).add_subplot(111)
+        return ax
+
+    def release(self, ax):
+        """Clear the axes and give it back to the pool."""
+        ax.cla()
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append(ax)
+
+    @contextmanager
+    def axes(self):
+        """Context manager acquiring an axes and releasing it at the end."""
+        ax = self.acquire()
+        try:
+            yield ax
+        finally:
+            self.release(ax)
+
+    def render(self, diagram, fmt="png", dpi=None, **plot_kwargs):
+        """Plot the diagram on a pooled figure and return the file content.
+
+        Args:
+            diagram (ED): The diagram to render.
+            fmt (str, optional): The file format. Defaults to "png".
+            dpi (float, optional): The resolution of the figure.
+            **plot_kwargs: Arguments passed to ED.plot.
+
+        Returns:
+            bytes: The rendered file.
+        """
+        buffer = io.BytesIO()
+        # a copy without the figure of the diagram, which keeps its own
+        # figure, axes and refresh state, and is not attached to the pool
+        diagram = copy.copy(diagram)
+        with self.axes() as ax:
+            diagram.plot(ax=ax, **plot_kwargs)
+            diagram.savefig(buffer, format=fmt, dpi=dpi)
+        return buffer.getvalue()
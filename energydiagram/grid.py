@@ -0,0 +1,296 @@
+# -*- coding: utf-8 -*-
+"""
+Many diagrams on one figure with a shared layout.
+
+Diagrams compared side by side, e.g. the same mechanism computed in many
+solvents or with many functionals, must use the same energy scale and the
+same columns. EDGrid computes the layout once from the running statistics of
+all the diagrams and draws them in the panels of a GridSpec, with the limits
+set once for every panel instead of sharing the axes, or merges them in a
+single diagram overlaid on one axes, so all the levels with the same style
+are a single collection whatever the number of diagrams.
+
+@author: giacomo
+"""
+
+import copy
+import math
+
+import numpy as np
+
+from .energydiagram import ED, _LEVEL_STYLE_ALIASES, _PLOT_PARAMETERS
+from .units import normalize_unit
+
+
+def _override(style, changes):
+    """Return style updated with changes, dropping the aliases of the
+    changed properties (e.g. lw when linewidth is changed)."""
+    style = dict(style)
+    for name in changes:
+        for aliases in _LEVEL_STYLE_ALIASES.values():
+            if name in aliases:
+                for alias in aliases:
+                    style.pop(alias, None)
+    style.update(changes)
+    return style
+
+
+class EDGrid:
+    """A collection of diagrams drawn with the same layout.
+
+    The dimension, the space and the offset of the levels are computed from
+    the energy range and the positions of all the diagrams, with the ratio
+    and offset_ratio of the first one, unless they are set on the first
+    diagram. The diagrams are not changed: the panels draw copies of them
+    with the shared layout.
+
+    Args:
+        diagrams (iterable): The ED instances.
+        titles (list, optional): A title for every diagram, shown above its
+            panel or in the legend of an overlay.
+        styles (list, optional): Properties of the levels of every diagram
+            in an overlay, e.g. {"color": "C1", "linestyle": ":"}. Their
+            color and alpha are given to the links and arrows too. Defaults
+            to the colors of the matplotlib color cycle.
+
+    Example:
+        >>> grid = EDGrid(diagrams, titles=solvents)
+        >>> grid.plot(ncols=5)
+        >>> grid.plot(overlay=True)
+    """
+
+    def __init__(self, diagrams, titles=None, styles=None):
+        self.diagrams = list(diagrams)
+        if not self.diagrams:
+            raise ValueError("EDGrid needs at least one diagram")
+        n = len(self.diagrams)
+        if titles is not None and len(titles) != n:
+            raise ValueError("Expected %d titles, got %d" % (n, len(titles)))
+        if styles is not None and len(styles) != n:
+            raise ValueError("Expected %d styles, got %d" % (n, len(styles)))
+        self.titles = titles
+        if styles is None:
+            styles = [{"color": "C%d" % (i % 10)} for i in range(n)]
+        self.styles = styles
+        # figure and axes of the last call of plot
+        self.fig = None
+        self.axes = []
+        # the merged diagram of the last overlay
+        self.overlay = None
+        # the copies of the diagrams drawn in the panels of the last grid
+        self.panels = []
+
+    def __len__(self):
+        return len(self.diagrams)
+
+    def shared_layout(self):
+        """Compute the layout of the levels shared by all the diagrams.
+
+        Only the statistics kept by the diagrams are read, so the cost does
+        not depend on the number of levels.
+
+        Returns:
+            dict: The dimension, space and offset of the levels.
+
+        Raises:
+            ValueError: If the diagrams have different units.
+        """
+        first = self.diagrams[0]
+        units = {normalize_unit(d.unit) for d in self.diagrams}
+        if len(units) > 1:
+            raise ValueError(
+                "The diagrams have different units (%s), convert them with "
+                "ED.set_units" % ", ".join(sorted(units))
+            )
+        min_energy = min(d._levels.stats.min_energy for d in self.diagrams)
+        max_energy = max(d._levels.stats.max_energy for d in self.diagrams)
+        energy_range = max(max_energy - min_energy, 0.0)
+        columns = set()
+        for diagram in self.diagrams:
+            columns.update(diagram._levels.stats.columns)
+        space_for_level = energy_range * first.ratio / float(max(len(columns), 1))
+        layout = {
+            "dimension": space_for_level * 0.5,
+            "space": space_for_level * 0.5,
+            "offset": energy_range * first.offset_ratio,
+        }
+        parameters = first._plot_parameters()
+        for name in layout:
+            if parameters[name] != "auto":
+                layout[name] = parameters[name]
+        return layout
+
+    def _with_layout(self, layout):
+        # copies without the figures, the levels are shared and not changed
+        diagrams = []
+        for diagram in self.diagrams:
+            diagram = copy.copy(diagram)
+            for name, value in layout.items():
+                setattr(diagram, name, value)
+            diagrams.append(diagram)
+        return diagrams
+
+    def merged(self, labels="first"):
+        """Merge the diagrams in a single diagram with the shared layout, the
+        styles applied to the levels of every diagram and its links, arrows
+        and electron boxes.
+
+        Args:
+            labels (str, optional): "first" for the texts of the first
+                diagram only, "all" for the texts of all of them. Defaults
+                to "first".
+
+        Returns:
+            ED: The merged diagram.
+        """
+        if labels not in ("first", "all"):
+            raise ValueError("labels must be 'first' or 'all'")
+        layout = self.shared_layout()
+        first = self.diagrams[0]
+        merged = ED(first.aspect, first.unit)
+        for name in _PLOT_PARAMETERS:
+            setattr(merged, name, getattr(first, name))
+        merged.batch_rendering = first.batch_rendering
+        for name, value in layout.items():
+            setattr(merged, name, value)
+
+        start = 0
+        for i, (diagram, style) in enumerate(zip(self.diagrams, self.styles)):
+            levels = diagram._levels
+            n = len(levels)
+            edge_style = {key: style[key] for key in ("color", "alpha") if key in style}
+            style_ids = np.array(
+                [
+                    merged._levels.intern_style(_override(kwargs, style))
+                    for kwargs in levels.styles
+                ],
+                dtype=np.intp,
+            )
+            if labels == "all" or i == 0:
+                texts = (
+                    levels.top_texts,
+                    levels.bottom_texts,
+                    levels.left_texts,
+                    levels.right_texts,
+                )
+            else:
+                texts = ([""] * n,) * 4
+            merged._levels.extend(
+                levels.energies,
+                levels.positions,
+                style_ids[levels.style_ids],
+                *texts,
+                integral=levels.integral,
+            )
+            merged.links.extend(
+                [(end + start, _override(kwargs, edge_style)) for end, kwargs in links]
+                for links in diagram.links
+            )
+            merged.arrows.extend(
+                [
+                    (end + start, position, text, dict(kwargs, **edge_style))
+                    for end, position, text, kwargs in arrows
+                ]
+                for arrows in diagram.arrows
+            )
+            merged.electons_boxes.extend(
+                (box[0] + start,) + tuple(box[1:]) for box in diagram.electons_boxes
+            )
+            merged.pos_number = max(merged.pos_number, diagram.pos_number)
+            start += n
+        return merged
+
+    def plot(
+        self,
+        overlay=False,
+        ncols=None,
+        show_IDs=False,
+        ylabel=None,
+        fig=None,
+        labels="first",
+        pyplot=True,
+        **gridspec_kwargs,
+    ):
+        """Plot all the diagrams with the same layout and energy scale.
+
+        Args:
+            overlay (bool, optional): Draw all the diagrams on one axes
+                with their styles, see merged. Defaults to False, a panel
+                for every diagram.
+            ncols (int, optional): Columns of the grid of panels. Defaults
+                to about the square root of the number of diagrams.
+            show_IDs (bool, optional): Show the IDs of the levels.
+            ylabel (str, optional): The label of the energy axis, shown on
+                the first column of panels. Defaults to the energy in the
+                unit of the diagrams.
+            fig (matplotlib.figure.Figure, optional): The figure to draw
+                on. If None a new figure is created.
+            labels (str, optional): The texts drawn in an overlay, see
+                merged. Defaults to "first".
+            pyplot (bool, optional): Create the figure with pyplot, see
+                ED.plot. Ignored if fig is given. Defaults to True.
+            **gridspec_kwargs: Arguments of Figure.add_gridspec, e.g.
+                hspace. The panels have no horizontal space by default.
+        """
+        if fig is None:
+            if pyplot:
+                import matplotlib.pyplot as plt
+
+                fig = plt.figure()
+            else:
+                from .figures import new_figure
+
+                fig = new_figure()
+        self.fig = fig
+
+        if overlay:
+            self.overlay = self.merged(labels)
+            self.panels = []
+            ax = fig.add_subplot(111)
+            self.overlay.plot(show_IDs=show_IDs, ylabel=ylabel, ax=ax)
+            self.axes = [ax]
+            if self.titles is not None:
+                from matplotlib.lines import Line2D
+
+                handles = [
+                    Line2D([], [], **_override({"color": "k", "linewidth": 2}, style))
+                    for style in self.styles
+                ]
+                ax.legend(handles, self.titles)
+            return
+
+        self.overlay = None
+        self.panels = self._with_layout(self.shared_layout())
+        n = len(self.diagrams)
+        if ncols is None:
+            ncols = int(math.ceil(math.sqrt(n)))
+        nrows = int(math.ceil(n / float(ncols)))
+        gridspec_kwargs.setdefault("wspace", 0)
+        grid = fig.add_gridspec(nrows, ncols, **gridspec_kwargs)
+        self.axes = []
+        for i, diagram in enumerate(self.panels):
+            ax = fig.add_subplot(grid[i // ncols, i % ncols])
+            # the limits are shared below, sharing the axes would update
+            # all the panels at every artist added
+            ax.set_autoscale_on(False)
+            first_column = i % ncols == 0
+            diagram.plot(
+                show_IDs=show_IDs, ylabel=ylabel if first_column else "", ax=ax
+            )
+            if not first_column:
+                ax.tick_params(labelleft=False)
+            if self.titles is not None:
+                ax.set_title(self.titles[i])
+            self.axes.append(ax)
+
+        from matplotlib.transforms import Bbox
+
+        limits = Bbox.union([ax.dataLim for ax in self.axes])
+        xmargin, ymargin = self.axes[0].margins()
+        dx = xmargin * limits.width
+        dy = ymargin * limits.height
+        xlim = (limits.x0 - dx, limits.x1 + dx)
+        ylim = (limits.y0 - dy, limits.y1 + dy)
+        for ax in self.axes:
+            ax.set_xlim(xlim)
+            ax.set_ylim(ylim)
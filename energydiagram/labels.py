@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""
+Batched text labels.
+
+Matplotlib creates a Text artist for every call to ax.text, and text is the
+most expensive element to lay out and draw. A LabelCollection draws many
+labels sharing the same style with a single artist, reusing one Text
+instance as a stamp. Collections drawn many times, as in refresh and
+animate, can also keep the rasters of their labels and copy them instead of
+drawing the text again.
+
+@author: giacomo
+"""
+
+import math
+
+import numpy as np
+from matplotlib.artist import Artist
+from matplotlib.text import Text
+from matplotlib.transforms import Bbox, IdentityTransform
+
+
+class LabelCollection(Artist):
+    """Many text labels sharing the same style drawn by a single artist.
+
+    Args:
+        x (array-like): x coordinates of the labels.
+        y (array-like): y coordinates of the labels.
+        texts (list): The labels, they are converted with str().
+        **kwargs: Properties of the text (e.g. color, fontsize,
+            horizontalalignment) shared by all the labels.
+    """
+
+    zorder = Text.zorder
+
+    def __init__(self, x, y, texts, **kwargs):
+        super().__init__()
+        # labels are not clipped to the axes, as for ax.text
+        self.set_clip_on(False)
+        self._stamp = Text(0, 0, "", **kwargs)
+        self._rasters = None
+        self._raster_cache_size = 0
+        self.set_data(x, y, texts)
+
+    def set_data(self, x, y, texts):
+        """Replace the positions and the texts of the labels."""
+        self._x = np.asarray(x, dtype=float)
+        self._y = np.asarray(y, dtype=float)
+        self._texts = [str(text) for text in texts]
+        self.stale = True
+
+    def get_texts(self):
+        """Return the list of labels drawn by the collection."""
+        return list(self._texts)
+
+    def get_offsets(self):
+        """Return the (N, 2) array with the positions of the labels."""
+        return np.column_stack([self._x, self._y])
+
+    def get_fontsize(self):
+        """Return the font size of the labels in points."""
+        return self._stamp.get_fontsize()
+
+    def __len__(self):
+        return len(self._texts)
+
+    def _prepare_stamp(self):
+        stamp = self._stamp
+        stamp.set_figure(self.figure)
+        stamp.axes = self.axes
+        stamp.set_transform(self.get_transform())
+        stamp.set_clip_on(self.get_clip_on())
+        stamp.set_clip_box(self.get_clip_box())
+        stamp.set_clip_path(self.get_clip_path())
+        stamp.set_alpha(self.get_alpha())
+        return stamp
+
+    def _iter_stamps(self):
+        stamp = self._prepare_stamp()
+        for x, y, text in zip(self._x, self._y, self._texts):
+            stamp.set_position((x, y))
+            stamp.set_text(text)
+            yield stamp
+
+    def set_raster_cache(self, size=4096):
+        """Keep the rasters of up to size labels drawn by the Agg renderer
+        and copy them when the same text is drawn again, which is much
+        faster than drawing the text. A text is rasterized the second time
+        it is drawn and the rasters are placed at the nearest pixel. Labels
+        with a bbox are always drawn as text. Use size=0 to turn the cache
+        off."""
+        if size != self._raster_cache_size:
+            self._raster_cache_size = size
+            self._rasters = {} if size else None
+
+    def draw(self, renderer):
+        if not self.get_visible():
+            return
+        from matplotlib.backends.backend_agg import RendererAgg
+
+        renderer.open_group("labelcollection", self.get_gid())
+        if (
+            self._rasters is not None
+            and isinstance(renderer, RendererAgg)
+            and self._stamp.get_bbox_patch() is None
+        ):
+            self._draw_rasters(renderer)
+        else:
+            for stamp in self._iter_stamps():
+                stamp.draw(renderer)
+        renderer.close_group("labelcollection")
+        self.stale = False
+
+    def _draw_rasters(self, renderer):
+        stamp = self._prepare_stamp()
+        points = stamp.get_transform().transform(self.get_offsets())
+        # the stamp draws in pixels, without clipping
+        stamp.set_transform(IdentityTransform())
+        stamp.set_clip_on(False)
+        rasters = self._rasters
+        gc = renderer.new_gc()
+        self._set_gc_clip(gc)
+        for (x, y), text in zip(points.tolist(), self._texts):
+            if not (math.isfinite(x) and math.isfinite(y)):
+                continue
+            x, y = round(x), round(y)
+            key = (text, renderer.dpi)
+            raster = rasters.get(key, False)
+            if raster is False:
+                # None until the text is drawn again
+                if len(rasters) >= self._raster_cache_size:
+                    rasters.clear()
+                rasters[key] = None
+                stamp.set_position((x, y))
+                stamp.set_text(text)
+                stamp.draw(renderer)
+                continue
+            if raster is None:
+                raster = rasters[key] = self._rasterize(stamp, text, renderer)
+            image, left, bottom = raster
+            if image is not None:
+                renderer.draw_image(gc, x + left, y + bottom, image)
+        gc.restore()
+
+    @staticmethod
+    def _rasterize(stamp, text, renderer):
+        # the label at the origin drawn on a small canvas, returns the image
+        # and the position of its lower left corner
+        from matplotlib.backends.backend_agg import RendererAgg
+
+        stamp.set_text(text)
+        stamp.set_position((0, 0))
+        bbox = stamp.get_window_extent(renderer)
+        if not (bbox.width and bbox.height):
+            return None, 0, 0
+        left, bottom = math.floor(bbox.x0) - 1, math.floor(bbox.y0) - 1
+        width = math.ceil(bbox.x1) - left + 1
+        height = math.ceil(bbox.y1) - bottom + 1
+        canvas = RendererAgg(width, height, renderer.dpi)
+        stamp.set_position((-left, -bottom))
+        stamp.draw(canvas)
+        # the rows of the canvas start from the top
+        image = np.asarray(canvas.buffer_rgba())[::-1].copy()
+        return image, left, bottom
+
+    def get_window_extent(self, renderer=None):
+        extents = [stamp.get_window_extent(renderer) for stamp in self._iter_stamps()]
+        extents = [bbox for bbox in extents if bbox.width or bbox.height]
+        if not extents:
+            return Bbox.null()
+        return Bbox.union(extents)
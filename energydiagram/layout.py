@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""
+Automatic placement of the levels in columns.
+
+The links and the arrows are read as a directed graph. Every level is
+assigned to a layer by longest-path layering, so each step of a mechanism
+moves to the right. The levels of a layer are split in the fewest columns
+keeping the levels of a column apart in energy, and every level goes to the
+free column closest to the barycenter of the positions of its neighbours,
+which reduces the crossings of the links. All the steps take linear time in
+the number of levels and links, besides the sorting of every layer.
+
+@author: giacomo
+"""
+
+import bisect
+import heapq
+from collections import deque
+
+import numpy as np
+
+
+def _adjacency(n, starts, ends):
+    # CSR adjacency: the targets of node i are targets[indptr[i]:indptr[i+1]]
+    order = np.argsort(starts, kind="stable")
+    indptr = np.searchsorted(starts[order], np.arange(n + 1))
+    return indptr, ends[order]
+
+
+def longest_path_layers(n, starts, ends):
+    """Return the layer of every node of a directed graph.
+
+    Every node is one layer after the furthest of its predecessors, found
+    with Kahn's algorithm. The graph can have cycles: when no node is left
+    without unvisited predecessors the one with the lowest index is visited
+    anyway, so the edges closing the cycle point backwards.
+
+    Args:
+        n (int): The number of nodes.
+        starts (array-like): The start node of every edge.
+        ends (array-like): The end node of every edge.
+
+    Returns:
+        numpy.ndarray: The layer of every node, starting from 0.
+    """
+    starts = np.asarray(starts, dtype=np.intp)
+    ends = np.asarray(ends, dtype=np.intp)
+    loops = starts == ends
+    if loops.any():
+        starts, ends = starts[~loops], ends[~loops]
+    indptr, targets = _adjacency(n, starts, ends)
+    indptr = indptr.tolist()
+    targets = targets.tolist()
+    indegree = np.bincount(ends, minlength=n).tolist()
+    layers = [0] * n
+    visited = [False] * n
+    queue = deque(i for i in range(n) if not indegree[i])
+    # the next candidate for breaking a cycle
+    forced = 0
+    remaining = n
+    while remaining:
+        if not queue:
+            while visited[forced]:
+                forced += 1
+            queue.append(forced)
+        node = queue.popleft()
+        if visited[node]:
+            continue
+        visited[node] = True
+        remaining -= 1
+        layer = layers[node] + 1
+        for target in targets[indptr[node] : indptr[node + 1]]:
+            if visited[target]:
+                continue
+            if layers[target] < layer:
+                layers[target] = layer
+            indegree[target] -= 1
+            if not indegree[target]:
+                queue.append(target)
+    return np.array(layers, dtype=np.intp)
+
+
+def _fill_columns(energies, gap, ranks):
+    # the column of the levels of a layer: the fewest columns keeping the
+    # levels of each one gap apart, found by visiting the levels by energy
+    # (greedy coloring of intervals), and among the columns free for a
+    # level the one nearest to the place of its rank
+    n = len(energies)
+    order = np.argsort(energies, kind="stable")
+    sorted_energies = energies[order]
+    # the largest number of levels closer than gap
+    overlaps = np.searchsorted(sorted_energies, sorted_energies + gap) - np.arange(n)
+    width = max(int(overlaps.max()), 1) if n else 1
+    if width == 1:
+        return np.zeros(n, dtype=np.intp), 1
+    places = np.empty(n, dtype=np.intp)
+    places[np.argsort(ranks, kind="stable")] = np.arange(n) * width // n
+    columns = np.empty(n, dtype=np.intp)
+    free = list(range(width))
+    # (energy from which a column is free again, column)
+    busy = []
+    for i, energy in zip(order.tolist(), sorted_energies.tolist()):
+        while busy and busy[0][0] <= energy:
+            bisect.insort(free, heapq.heappop(busy)[1])
+        place = places[i]
+        j = bisect.bisect_left(free, place)
+        if j == len(free) or (j and place - free[j - 1] < free[j] - place):
+            j -= 1
+        column = free.pop(j)
+        columns[i] = column
+        heapq.heappush(busy, (energy + gap, column))
+    return columns, width
+
+
+def layered_positions(energies, starts, ends, gap=0.0, sweeps=4):
+    """Return the position of every level from the links between them.
+
+    Args:
+        energies (array-like): The energy of every level.
+        starts (array-like): The start level of every link.
+        ends (array-like): The end level of every link.
+        gap (float, optional): The minimum energy difference between the
+            levels of the same column. Defaults to 0, one column per layer.
+        sweeps (int, optional): The passes of barycenter ordering, going
+            alternately forwards and backwards. Defaults to 4.
+
+    Returns:
+        numpy.ndarray: The positions, starting from 1.
+    """
+    energies = np.asarray(energies, dtype=float)
+    starts = np.asarray(starts, dtype=np.intp)
+    ends = np.asarray(ends, dtype=np.intp)
+    n = len(energies)
+    if not n:
+        return np.empty(0)
+    layers = longest_path_layers(n, starts, ends)
+    n_layers = int(layers.max()) + 1
+    order = np.argsort(layers, kind="stable")
+    bounds = np.searchsorted(layers[order], np.arange(n_layers + 1)).tolist()
+    members = [order[bounds[i] : bounds[i + 1]] for i in range(n_layers)]
+    # the edges grouped by the layer of their end and of their start
+    by_end = np.argsort(layers[ends], kind="stable")
+    end_bounds = np.searchsorted(layers[ends][by_end], np.arange(n_layers + 1))
+    by_start = np.argsort(layers[starts], kind="stable")
+    start_bounds = np.searchsorted(layers[starts][by_start], np.arange(n_layers + 1))
+
+    columns = np.zeros(n, dtype=np.intp)
+    widths = np.ones(n_layers, dtype=np.intp)
+    for layer, ids in enumerate(members):
+        columns[ids], widths[layer] = _fill_columns(energies[ids], gap, ids)
+    # the number of columns of a layer does not depend on their order
+    bases = 1 + np.concatenate([[0], np.cumsum(widths)[:-1]])
+    positions = (bases[layers] + columns).astype(float)
+    if widths.max() == 1:
+        return positions
+
+    local = np.zeros(n, dtype=np.intp)
+    for sweep in range(sweeps):
+        # the neighbours in the layers before, or after, placed in this sweep
+        if sweep % 2 == 0:
+            edges, edge_bounds, sequence = by_end, end_bounds, range(n_layers)
+            nodes_of, neighbours_of = ends, starts
+        else:
+            edges, edge_bounds = by_start, start_bounds
+            sequence = range(n_layers - 1, -1, -1)
+            nodes_of, neighbours_of = starts, ends
+        for layer in sequence:
+            ids = members[layer]
+            if widths[layer] == 1:
+                continue
+            layer_edges = edges[edge_bounds[layer] : edge_bounds[layer + 1]]
+            nodes = nodes_of[layer_edges]
+            neighbours = neighbours_of[layer_edges]
+            local[ids] = np.arange(len(ids))
+            total = np.bincount(
+                local[nodes], weights=positions[neighbours], minlength=len(ids)
+            )
+            count = np.bincount(local[nodes], minlength=len(ids))
+            # the levels without neighbours keep their place
+            barycenters = positions[ids]
+            linked = count > 0
+            barycenters[linked] = total[linked] / count[linked]
+            columns[ids], _ = _fill_columns(energies[ids], gap, barycenters)
+            positions[ids] = bases[layer] + columns[ids]
+    return positions
@@ -0,0 +1,486 @@
+# -*- coding: utf-8 -*-
+"""
+Columnar storage of the energy levels.
+
+Energies and positions are kept in NumPy arrays that grow geometrically,
+the texts in plain lists and the matplotlib properties of the levels in a
+table of unique styles referenced by index.
+
+@author: giacomo
+"""
+
+import bisect
+
+import numpy as np
+
+
+def _style_key(kwargs):
+    """Hashable key of a kwargs dictionary used for grouping artists."""
+    key = []
+    for name in sorted(kwargs):
+        value = kwargs[name]
+        try:
+            hash(value)
+        except TypeError:
+            value = repr(value)
+        key.append((name, value))
+    return tuple(key)
+
+
+class LayoutStats:
+    """Running statistics of the levels used for the automatic layout.
+
+    The energy range and the number of columns are updated when levels are
+    added, so the layout never rescans all the levels.
+    """
+
+    def __init__(self):
+        self.min_energy = np.inf
+        self.max_energy = -np.inf
+        # number of levels in every position
+        self.columns = {}
+
+    @property
+    def energy_range(self):
+        if self.max_energy < self.min_energy:
+            return 0.0
+        return self.max_energy - self.min_energy
+
+    @property
+    def unique_positions(self):
+        return len(self.columns)
+
+    def add(self, energies, positions):
+        """Update the statistics with new levels."""
+        if len(energies) == 1:
+            energy = float(energies[0])
+            self.min_energy = min(self.min_energy, energy)
+            self.max_energy = max(self.max_energy, energy)
+            position = float(positions[0])
+            self.columns[position] = self.columns.get(position, 0) + 1
+            return
+        if not len(energies):
+            return
+        self.min_energy = min(self.min_energy, float(np.min(energies)))
+        self.max_energy = max(self.max_energy, float(np.max(energies)))
+        unique, counts = np.unique(positions, return_counts=True)
+        for position, count in zip(unique.tolist(), counts.tolist()):
+            self.columns[position] = self.columns.get(position, 0) + count
+
+
+class LevelStore:
+    """Columnar storage of the energy levels of a diagram.
+
+    The top text of a level is None when it must be generated from the
+    energy of the level, see format_top_texts.
+    """
+
+    def __init__(self):
+        self._size = 0
+        self._energies = np.empty(0)
+        self._positions = np.empty(0)
+        self._style_ids = np.empty(0, dtype=np.intp)
+        # energies given as integers are printed without decimals
+        self._integral = np.empty(0, dtype=bool)
+        self.top_texts = []
+        self.bottom_texts = []
+        self.left_texts = []
+        self.right_texts = []
+        self.styles = []
+        self._style_index = {}
+        self._line_styles = {}
+        self.stats = LayoutStats()
+        # level ID of every user key and, built on the first lookup and then
+        # kept up to date, of every bottom text and of every position
+        self.keys = {}
+        self._names = None
+        self._columns = None
+
+    @classmethod
+    def from_arrays(
+        cls,
+        energies,
+        positions,
+        style_ids,
+        integral,
+        top_texts,
+        bottom_texts,
+        left_texts,
+        right_texts,
+        styles,
+    ):
+        """Create a store using the given arrays and lists without copying
+        them. The statistics are left empty for the caller to fill."""
+        store = cls()
+        store._size = len(energies)
+        store._energies = energies
+        store._positions = positions
+        store._style_ids = style_ids
+        store._integral = integral
+        store.top_texts = top_texts
+        store.bottom_texts = bottom_texts
+        store.left_texts = left_texts
+        store.right_texts = right_texts
+        for style in styles:
+            store.intern_style(style)
+        return store
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def energies(self):
+        return self._energies[: self._size]
+
+    @property
+    def positions(self):
+        return self._positions[: self._size]
+
+    @property
+    def style_ids(self):
+        return self._style_ids[: self._size]
+
+    @property
+    def integral(self):
+        return self._integral[: self._size]
+
+    @property
+    def level_kwargs(self):
+        return [self.styles[i] for i in self.style_ids]
+
+    def intern_style(self, kwargs):
+        """Return the index of kwargs in the style table, adding it if it is
+        not there yet."""
+        key = _style_key(kwargs)
+        style_id = self._style_index.get(key)
+        if style_id is None:
+            style_id = len(self.styles)
+            self.styles.append(dict(kwargs))
+            self._style_index[key] = style_id
+        return style_id
+
+    def intern_line_style(self, color, linewidth):
+        """intern_style of {"color": color, "linewidth": linewidth}, cached
+        by the pair of values for add_level."""
+        key = (color, linewidth)
+        try:
+            return self._line_styles[key]
+        except KeyError:
+            style_id = self._line_styles[key] = self.intern_style(
+                {"color": color, "linewidth": linewidth}
+            )
+            return style_id
+        except TypeError:
+            # unhashable color, e.g. a list of RGB values
+            return self.intern_style({"color": color, "linewidth": linewidth})
+
+    def _reserve(self, n):
+        needed = self._size + n
+        capacity = len(self._energies)
+        if needed <= capacity:
+            return
+        capacity = max(needed, 2 * capacity, 16)
+        for name in ("_energies", "_positions", "_style_ids", "_integral"):
+            old = getattr(self, name)
+            new = np.empty(capacity, dtype=old.dtype)
+            new[: self._size] = old[: self._size]
+            setattr(self, name, new)
+
+    def extend(
+        self,
+        energies,
+        positions,
+        style_ids,
+        top_texts,
+        bottom_texts,
+        left_texts,
+        right_texts,
+        integral=False,
+        keys=None,
+    ):
+        """Append n levels. The first three arguments are arrays of length
+        n, the texts and the keys (None for no key) are lists of length
+        n."""
+        n = len(energies)
+        if keys is not None:
+            self._add_keys(keys)
+        self._reserve(n)
+        new = slice(self._size, self._size + n)
+        self._energies[new] = energies
+        self._positions[new] = positions
+        self._style_ids[new] = style_ids
+        self._integral[new] = integral
+        self.top_texts.extend(top_texts)
+        self.bottom_texts.extend(bottom_texts)
+        self.left_texts.extend(left_texts)
+        self.right_texts.extend(right_texts)
+        self._size += n
+        self.stats.add(self._energies[new], self._positions[new])
+        if self._names is not None:
+            self._index_names(bottom_texts, new.start)
+        if self._columns is not None:
+            self._index_columns(self._positions[new], new.start)
+
+    def append(
+        self,
+        energy,
+        position,
+        style_id,
+        top_text,
+        bottom_text,
+        left_text,
+        right_text,
+        integral=False,
+        key=None,
+    ):
+        """Append a single level, the scalar version of extend."""
+        if key is not None:
+            self._add_keys([key])
+        level_id = self._size
+        if level_id == len(self._energies):
+            self._reserve(1)
+        self._energies[level_id] = energy
+        self._positions[level_id] = position
+        self._style_ids[level_id] = style_id
+        self._integral[level_id] = integral
+        self.top_texts.append(top_text)
+        self.bottom_texts.append(bottom_text)
+        self.left_texts.append(left_text)
+        self.right_texts.append(right_text)
+        self._size += 1
+        stats = self.stats
+        energy = float(energy)
+        if energy < stats.min_energy:
+            stats.min_energy = energy
+        if energy > stats.max_energy:
+            stats.max_energy = energy
+        position = float(position)
+        stats.columns[position] = stats.columns.get(position, 0) + 1
+        if self._names is not None:
+            self._index_names([bottom_text], level_id)
+        if self._columns is not None:
+            self._columns.setdefault(position, []).append(level_id)
+
+    def update(self, level_id, energy=None, position=None, style_id=None, **texts):
+        """Change a level in place.
+
+        Args:
+            level_id (int): The ID of the level.
+            energy (float, optional): The new energy.
+            position (float, optional): The new position.
+            style_id (int, optional): The index of the new style.
+            **texts: New top_text, bottom_text, left_text or right_text.
+        """
+        if not 0 <= level_id < self._size:
+            raise IndexError("No level with ID %d" % level_id)
+        for name in ("_energies", "_positions", "_style_ids", "_integral"):
+            array = getattr(self, name)
+            if not array.flags.writeable:
+                # memory mapped by ED.load
+                setattr(self, name, array.copy())
+        if energy is not None:
+            self._energies[level_id] = energy
+            self._integral[level_id] = isinstance(energy, (int, np.integer))
+            energies = self.energies
+            self.stats.min_energy = float(energies.min())
+            self.stats.max_energy = float(energies.max())
+        if position is not None:
+            old = float(self._positions[level_id])
+            self._positions[level_id] = position
+            columns = self.stats.columns
+            columns[old] -= 1
+            if not columns[old]:
+                del columns[old]
+            position = float(position)
+            columns[position] = columns.get(position, 0) + 1
+            if self._columns is not None:
+                self._columns[old].remove(level_id)
+                bisect.insort(self._columns.setdefault(position, []), level_id)
+        if style_id is not None:
+            self._style_ids[level_id] = style_id
+        for name, text in texts.items():
+            getattr(self, name + "s")[level_id] = text
+            if name == "bottom_text":
+                # rebuilt on the next lookup
+                self._names = None
+
+    def set_energies(self, energies, extent=None):
+        """Replace the energies of all the levels.
+
+        Args:
+            energies (array-like): The new energies, one for every level.
+            extent (tuple, optional): The (min, max) energy range used by the
+                layout statistics, by default the range of energies.
+        """
+        energies = np.asarray(energies, dtype=float)
+        if energies.shape != (self._size,):
+            raise ValueError(
+                "Expected %d energies, got shape %s" % (self._size, energies.shape)
+            )
+        if not self._energies.flags.writeable:
+            self._energies = self._energies.copy()
+        if not self._integral.flags.writeable:
+            self._integral = self._integral.copy()
+        self._energies[: self._size] = energies
+        # the integers stay printed without decimals
+        self._integral[: self._size] &= energies == np.round(energies)
+        if extent is None and self._size:
+            extent = (energies.min(), energies.max())
+        if extent is not None:
+            self.stats.min_energy = float(extent[0])
+            self.stats.max_energy = float(extent[1])
+
+    def set_texts(self, name, texts):
+        """Replace a column of texts, name is "top_text", "bottom_text",
+        "left_text" or "right_text"."""
+        texts = list(texts)
+        if len(texts) != self._size:
+            raise ValueError("Expected %d texts, got %d" % (self._size, len(texts)))
+        setattr(self, name + "s", texts)
+        if name == "bottom_text":
+            self._names = None
+
+    def energy_state(self):
+        """Return a copy of the energies, of their integral flags and of the
+        energy range of the statistics, see restore_energy_state."""
+        return (
+            self._energies[: self._size].copy(),
+            self._integral[: self._size].copy(),
+            self.stats.min_energy,
+            self.stats.max_energy,
+        )
+
+    def restore_energy_state(self, state):
+        """Restore the energies saved by energy_state."""
+        energies, integral, min_energy, max_energy = state
+        if not self._energies.flags.writeable:
+            self._energies = self._energies.copy()
+        if not self._integral.flags.writeable:
+            self._integral = self._integral.copy()
+        self._energies[: self._size] = energies
+        self._integral[: self._size] = integral
+        self.stats.min_energy = min_energy
+        self.stats.max_energy = max_energy
+
+    def rescale(self, scale, shift=0.0):
+        """Replace the energy E of every level with (E - shift) * scale,
+        e.g. to change unit and reference. scale must be positive."""
+        if not self._energies.flags.writeable:
+            self._energies = self._energies.copy()
+        energies = self._energies[: self._size]
+        energies -= shift
+        energies *= scale
+        if not self._integral.flags.writeable:
+            self._integral = self._integral.copy()
+        self._integral[: self._size] &= energies == np.round(energies)
+        stats = self.stats
+        if self._size:
+            stats.min_energy = (stats.min_energy - shift) * scale
+            stats.max_energy = (stats.max_energy - shift) * scale
+
+    def set_positions(self, positions):
+        """Replace the positions of all the levels."""
+        positions = np.asarray(positions, dtype=float)
+        if positions.shape != (self._size,):
+            raise ValueError(
+                "Expected %d positions, got shape %s" % (self._size, positions.shape)
+            )
+        if not self._positions.flags.writeable:
+            self._positions = self._positions.copy()
+        self._positions[: self._size] = positions
+        unique, counts = np.unique(positions, return_counts=True)
+        self.stats.columns = dict(zip(unique.tolist(), counts.tolist()))
+        # rebuilt on the next lookup
+        self._columns = None
+
+    def _add_keys(self, keys):
+        added = {}
+        for level_id, key in enumerate(keys, self._size):
+            if key is None:
+                continue
+            if isinstance(key, (int, np.integer)):
+                raise ValueError("The key of a level can not be an integer ID")
+            if key in self.keys or key in added:
+                raise ValueError("Duplicate level key %r" % (key,))
+            added[key] = level_id
+        self.keys.update(added)
+
+    def _index_names(self, texts, start):
+        # -1 marks a bottom text shared by several levels
+        names = self._names
+        for level_id, text in enumerate(texts, start):
+            if isinstance(text, str) and text:
+                names[text] = -1 if text in names else level_id
+
+    def _index_columns(self, positions, start):
+        order = np.argsort(positions, kind="stable")
+        bounds = np.flatnonzero(np.diff(positions[order])) + 1
+        for group in np.split(order, bounds):
+            if len(group):
+                column = self._columns.setdefault(float(positions[group[0]]), [])
+                column.extend((group + start).tolist())
+
+    def level_id(self, name):
+        """Return the ID of a level given its ID, its key or its bottom
+        text.
+
+        Raises:
+            KeyError: If no level or several levels have the bottom text.
+        """
+        if isinstance(name, (int, np.integer)):
+            return int(name)
+        level_id = self.keys.get(name)
+        if level_id is not None:
+            return level_id
+        if self._names is None:
+            self._names = {}
+            self._index_names(self.bottom_texts, 0)
+        level_id = self._names.get(name)
+        if level_id is None:
+            raise KeyError("No level with key or bottom text %r" % (name,))
+        if level_id < 0:
+            raise KeyError(
+                "Several levels have the bottom text %r, give them a key" % (name,)
+            )
+        return level_id
+
+    def column(self, position):
+        """Return the IDs of the levels in a position, in insertion order."""
+        if self._columns is None:
+            self._columns = {}
+            self._index_columns(self.positions, 0)
+        return list(self._columns.get(float(position), ()))
+
+    def format_top_texts(self, digits="keep all digits", ids=None):
+        """Return the top texts, or the ones of the levels ids, generating
+        the missing ones from the energies rounded at digits."""
+        if ids is None:
+            texts = list(self.top_texts)
+        else:
+            texts = [self.top_texts[i] for i in ids]
+        auto = [i for i, text in enumerate(texts) if text is None]
+        if not auto:
+            return texts
+        levels = auto if ids is None else np.asarray(ids, dtype=np.intp)[auto]
+        values = self.energies[levels]
+        if digits != "keep all digits":
+            values = np.round(values, digits)
+        integral = self._integral[levels].tolist()
+        for i, value, is_int in zip(auto, values.tolist(), integral):
+            texts[i] = int(value) if is_int else value
+        return texts
+
+    def format_differences(self, starts, ends, digits="keep all digits"):
+        """Return the energy differences between the levels starts and the
+        levels ends, rounded at digits as the top texts."""
+        starts = np.asarray(starts, dtype=np.intp)
+        ends = np.asarray(ends, dtype=np.intp)
+        energies = self.energies
+        values = energies[starts] - energies[ends]
+        if digits != "keep all digits":
+            values = np.round(values, digits)
+        integral = (self._integral[starts] & self._integral[ends]).tolist()
+        return [
+            int(value) if is_int else value
+            for value, is_int in zip(values.tolist(), integral)
+        ]
@@ -0,0 +1,303 @@
+# -*- coding: utf-8 -*-
+"""
+Level of detail rendering of large diagrams.
+
+A ViewportCuller keeps the complete content of the batched artists drawn by
+ED.plot and, whenever the limits of the axes change, gives every artist only
+the items inside the view. The items are indexed by their extent along x and
+along the energy axis, so a query costs O(log n) plus the number of items
+found. When zoomed out, the levels and the labels falling on the same pixels
+are merged and the labels are hidden once the levels are too short to read
+them, so the cost of a redraw depends on the size of the figure and not on
+the size of the diagram.
+
+@author: giacomo
+"""
+
+import numpy as np
+from matplotlib.collections import LineCollection, PolyCollection
+from matplotlib.patches import PathPatch
+from matplotlib.path import Path
+
+from .labels import LabelCollection
+
+
+class _Index:
+    """Extents of the items sorted along x and along y."""
+
+    def __init__(self, xmin, xmax, ymin, ymax):
+        self.xmin, self.xmax = xmin, xmax
+        self.ymin, self.ymax = ymin, ymax
+        self._x_order = np.argsort(xmin, kind="stable")
+        self._y_order = np.argsort(ymin, kind="stable")
+        self._x_sorted = xmin[self._x_order]
+        self._y_sorted = ymin[self._y_order]
+        self._width = np.max(xmax - xmin) if len(xmin) else 0.0
+        self._height = np.max(ymax - ymin) if len(ymin) else 0.0
+
+    def query(self, x0, x1, y0, y1):
+        """Return the sorted ids of the items overlapping the rectangle."""
+        xlo = np.searchsorted(self._x_sorted, x0 - self._width, "left")
+        xhi = np.searchsorted(self._x_sorted, x1, "right")
+        ylo = np.searchsorted(self._y_sorted, y0 - self._height, "left")
+        yhi = np.searchsorted(self._y_sorted, y1, "right")
+        # scan the shorter of the two candidate ranges
+        if xhi - xlo <= yhi - ylo:
+            ids = self._x_order[xlo:xhi]
+        else:
+            ids = self._y_order[ylo:yhi]
+        inside = (
+            (self.xmin[ids] <= x1)
+            & (self.xmax[ids] >= x0)
+            & (self.ymin[ids] <= y1)
+            & (self.ymax[ids] >= y0)
+        )
+        # keep the drawing order of the items
+        return np.sort(ids[inside])
+
+
+def _blocks_bounds(vertices, starts):
+    # extent of the blocks of vertices beginning at starts
+    return (
+        np.minimum.reduceat(vertices[:, 0], starts),
+        np.maximum.reduceat(vertices[:, 0], starts),
+        np.minimum.reduceat(vertices[:, 1], starts),
+        np.maximum.reduceat(vertices[:, 1], starts),
+    )
+
+
+def _segments_bounds(segments):
+    if not len(segments):
+        empty = np.empty(0)
+        return empty, empty, empty, empty
+    lengths = np.array([len(segment) for segment in segments])
+    starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+    return _blocks_bounds(np.concatenate(segments), starts)
+
+
+class _Lines:
+    """The segments of a LineCollection and their per-item properties."""
+
+    def __init__(self, collection, properties):
+        self.artist = collection
+        self.segments = collection.get_segments()
+        self.properties = properties
+        self.bounds = _segments_bounds(self.segments)
+
+    def show(self, ids):
+        self.artist.set_segments([self.segments[i] for i in ids])
+        for name, values in self.properties.items():
+            if isinstance(values, np.ndarray):
+                values = values[ids]
+            else:
+                values = [values[i] for i in ids]
+            getattr(self.artist, "set_" + name)(values)
+
+
+class _Polygons:
+    """The polygons of a PolyCollection sharing the same style."""
+
+    def __init__(self, collection):
+        self.artist = collection
+        # the paths of the collection repeat the first vertex to close
+        self.verts = [path.vertices[:-1] for path in collection.get_paths()]
+        self.bounds = _segments_bounds(self.verts)
+
+    def show(self, ids):
+        self.artist.set_verts([self.verts[i] for i in ids])
+
+
+class _SubPaths:
+    """The sub-paths of the compound path of a PathPatch."""
+
+    def __init__(self, patch):
+        self.artist = patch
+        path = patch.get_path()
+        self.vertices = path.vertices
+        self.codes = path.codes
+        if self.codes is None:
+            starts = np.array([0])
+        else:
+            starts = np.flatnonzero(self.codes == Path.MOVETO)
+        self.starts = starts
+        self.ends = np.append(starts[1:], len(self.vertices))
+        if len(self.vertices):
+            self.bounds = _blocks_bounds(self.vertices, starts)
+        else:
+            self.bounds = _segments_bounds([])
+
+    def show(self, ids):
+        lengths = self.ends[ids] - self.starts[ids]
+        # indices of the vertices of the selected sub-paths
+        offsets = np.repeat(self.starts[ids] - np.cumsum(lengths) + lengths, lengths)
+        vertex_ids = np.arange(lengths.sum()) + offsets
+        codes = None if self.codes is None else self.codes[vertex_ids]
+        self.artist.set_path(Path(self.vertices[vertex_ids], codes))
+
+
+class _Labels:
+    """The labels of a LabelCollection."""
+
+    def __init__(self, labels):
+        self.artist = labels
+        offsets = labels.get_offsets()
+        self.x = offsets[:, 0]
+        self.y = offsets[:, 1]
+        self.texts = labels.get_texts()
+        self.bounds = (self.x, self.x, self.y, self.y)
+
+    def show(self, ids):
+        self.artist.set_data(self.x[ids], self.y[ids], [self.texts[i] for i in ids])
+
+
+class ViewportCuller:
+    """Draw only the items of the batched artists that are inside the view.
+
+    Args:
+        ax (matplotlib.axes.Axes): The axes holding the artists.
+        feature_size (float, optional): Length along x of a level in data
+            units. The labels are hidden when it is shorter than min_pixels on
+            screen. Defaults to None, the labels are never hidden.
+        min_pixels (float, optional): Minimum length in pixels of a level for
+            showing the labels. Defaults to 24.
+        margin (float, optional): Pixels added around the view, so that the
+            labels anchored just outside the axes are still drawn. Defaults to
+            50.
+
+    Example:
+        >>> culler = ViewportCuller(ax, feature_size=diagram.dimension)
+        >>> for artist in artists:
+        ...     culler.add(artist)
+        >>> culler.connect()
+    """
+
+    def __init__(self, ax, feature_size=None, min_pixels=24.0, margin=50.0):
+        self.ax = ax
+        self.feature_size = feature_size
+        self.min_pixels = min_pixels
+        self.margin = margin
+        # (items, index, merge) for every artist
+        self._entries = []
+        # ids shown by every artist and the view they were computed for
+        self._shown = []
+        self._view = None
+        self._updating = False
+        self._cids = []
+        self._canvas_cids = []
+
+    def add(self, artist, merge=False):
+        """Register an artist drawn by ED.plot.
+
+        Args:
+            artist: A LineCollection, PolyCollection, PathPatch or
+                LabelCollection, other artists are ignored and always drawn.
+                The style of the collections must be the same for all their
+                items, see add_lines for per-item properties.
+            merge (bool, optional): Merge the items drawn on the same pixel
+                row (levels) or the same line of text (labels) of a column.
+                Defaults to False.
+
+        Returns:
+            bool: True if the artist was registered.
+        """
+        if isinstance(artist, LineCollection):
+            items = _Lines(artist, {})
+        elif isinstance(artist, PolyCollection):
+            items = _Polygons(artist)
+        elif isinstance(artist, PathPatch):
+            items = _SubPaths(artist)
+        elif isinstance(artist, LabelCollection):
+            items = _Labels(artist)
+        else:
+            return False
+        self._register(items, merge)
+        return True
+
+    def add_lines(self, collection, merge=False, **properties):
+        """Register a LineCollection with per-item properties.
+
+        Args:
+            collection (LineCollection): The collection.
+            merge (bool, optional): See add. Defaults to False.
+            **properties: Arrays or lists with one value for every segment
+                (e.g. color, linewidth, linestyle), passed to the setters
+                of the collection with the values of the visible segments.
+        """
+        self._register(_Lines(collection, properties), merge)
+
+    def _register(self, items, merge):
+        self._entries.append((items, _Index(*items.bounds), merge))
+        self._shown.append(None)
+        self._view = None
+
+    def connect(self):
+        """Follow the limits of the axes and the size of the figure, and
+        cull the registered artists for the current view."""
+        if not self._cids:
+            callbacks = self.ax.callbacks
+            canvas = self.ax.figure.canvas
+            self._cids = [
+                callbacks.connect("xlim_changed", self.update),
+                callbacks.connect("ylim_changed", self.update),
+            ]
+            self._canvas_cids = [canvas.mpl_connect("resize_event", self.update)]
+        self.update()
+
+    def disconnect(self):
+        """Stop following the limits of the axes."""
+        for cid in self._cids:
+            self.ax.callbacks.disconnect(cid)
+        for cid in self._canvas_cids:
+            self.ax.figure.canvas.mpl_disconnect(cid)
+        self._cids = []
+        self._canvas_cids = []
+
+    def update(self, *args):
+        """Give every artist the items inside the current view."""
+        if self._updating:
+            return
+        self._updating = True
+        try:
+            self._update()
+        finally:
+            self._updating = False
+
+    def _update(self):
+        ax = self.ax
+        x0, x1 = sorted(ax.get_xlim())
+        y0, y1 = sorted(ax.get_ylim())
+        width, height = ax.bbox.width, ax.bbox.height
+        view = (x0, x1, y0, y1, width, height, ax.figure.dpi)
+        if not width or not height or view == self._view:
+            return
+        self._view = view
+        # pixels per data unit
+        sx = width / (x1 - x0) if x1 > x0 else 1.0
+        sy = height / (y1 - y0) if y1 > y0 else 1.0
+        mx = self.margin / sx
+        my = self.margin / sy
+        hide_labels = (
+            self.feature_size is not None and self.feature_size * sx < self.min_pixels
+        )
+        for k, (items, index, merge) in enumerate(self._entries):
+            labels = isinstance(items, _Labels)
+            if labels and hide_labels:
+                ids = np.empty(0, dtype=np.intp)
+            else:
+                ids = index.query(x0 - mx, x1 + mx, y0 - my, y1 + my)
+            if merge and len(ids):
+                if labels:
+                    fontsize = items.artist.get_fontsize()
+                    cell = fontsize * ax.figure.dpi / 72.0
+                else:
+                    cell = 1.0
+                column = np.round(index.xmin[ids] * sx)
+                row = np.floor(index.ymin[ids] * sy / cell)
+                _, first = np.unique(
+                    np.column_stack([column, row]), axis=0, return_index=True
+                )
+                ids = ids[np.sort(first)]
+            shown = self._shown[k]
+            if shown is None or not np.array_equal(ids, shown):
+                items.show(ids)
+                self._shown[k] = ids
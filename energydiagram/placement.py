@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""
+Placement of overlapping labels.
+
+Every label is an interval along the energy axis inside a column (labels
+sharing the same x and horizontal alignment). The intervals of a column are
+swept in order of energy and overlapping ones are merged in clusters that
+are placed as close as possible to the wanted positions, so the placement
+costs O(n log n) for n labels instead of checking every pair.
+
+@author: giacomo
+"""
+
+import numpy as np
+
+
+def spread_labels(columns, centers, heights, pad=0.0):
+    """Move the labels of every column so that they do not overlap.
+
+    Args:
+        columns (array-like): Column of every label, any sortable key.
+        centers (array-like): Wanted center of every label.
+        heights (array-like): Height of every label.
+        pad (float, optional): Minimum space between two labels.
+            Defaults to 0.
+
+    Returns:
+        numpy.ndarray: The new centers. A group of overlapping labels is
+        stacked around the mean of their wanted positions, keeping their
+        order.
+    """
+    columns = np.asarray(columns)
+    centers = np.asarray(centers, dtype=float)
+    heights = np.asarray(heights, dtype=float)
+    new = centers.copy()
+    if not len(centers):
+        return new
+    order = np.lexsort((centers, columns))
+    sorted_columns = columns[order]
+    sorted_heights = heights[order] + pad
+    # wanted bottom of every label
+    wanted = centers[order] - 0.5 * heights[order]
+    # bottom of the labels inside their cluster, before placing the cluster
+    stacked = np.empty(len(order))
+    starts = np.flatnonzero(
+        np.concatenate([[True], sorted_columns[1:] != sorted_columns[:-1]])
+    )
+    ends = np.append(starts[1:], len(order))
+    for start, end in zip(starts, ends):
+        # clusters as [first, last, bottom, height, sum of wanted - offset]
+        clusters = []
+        for k in range(start, end):
+            cluster = [k, k + 1, wanted[k], sorted_heights[k], wanted[k]]
+            while clusters and clusters[-1][2] + clusters[-1][3] > cluster[2]:
+                previous = clusters.pop()
+                size = cluster[1] - cluster[0]
+                previous[4] += cluster[4] - size * previous[3]
+                previous[1] = cluster[1]
+                previous[3] += cluster[3]
+                previous[2] = previous[4] / (previous[1] - previous[0])
+                cluster = previous
+            clusters.append(cluster)
+        for first, last, bottom, _, _ in clusters:
+            offsets = np.cumsum(sorted_heights[first:last]) - sorted_heights[first:last]
+            stacked[first:last] = bottom + offsets
+    new[order] = stacked + 0.5 * heights[order]
+    return new
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""
+Timing of the phases of a render.
+
+When ED.profile is set, ED.plot records the wall time and the number of
+artists added to the axes by every phase (layout, levels, labels, arrows,
+links and electron boxes) in a RenderStats, and ED.draw and ED.savefig add
+the time spent by the backend.
+
+@author: giacomo
+"""
+
+import time
+from contextlib import contextmanager
+
+
+class RenderStats:
+    """Wall time and artists of the phases of a render.
+
+    Example:
+        >>> diagram.profile = True
+        >>> diagram.plot()
+        >>> diagram.savefig("diagram.png")
+        >>> diagram.last_render_stats.as_dict()
+    """
+
+    def __init__(self):
+        # (name, seconds, artists) of every phase, in order
+        self.phases = []
+
+    @contextmanager
+    def phase(self, name, ax=None):
+        """Context manager timing a phase.
+
+        Args:
+            name (str): Name of the phase.
+            ax (matplotlib.axes.Axes, optional): Axes whose new children are
+                counted as the artists of the phase.
+        """
+        before = len(ax.get_children()) if ax is not None else 0
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            artists = len(ax.get_children()) - before if ax is not None else 0
+            self.phases.append((name, seconds, artists))
+
+    @property
+    def total_seconds(self):
+        """Wall time of all the phases."""
+        return sum(seconds for _, seconds, _ in self.phases)
+
+    def as_dict(self):
+        """Return the phases as a dictionary, e.g. for a metrics system.
+
+        Returns:
+            dict: {"phases": {name: {"seconds": s, "artists": n}},
+            "total_seconds": s}. The times of a phase repeated (e.g. two
+            calls of savefig) are summed.
+        """
+        phases = {}
+        for name, seconds, artists in self.phases:
+            phase = phases.setdefault(name, {"seconds": 0.0, "artists": 0})
+            phase["seconds"] += seconds
+            phase["artists"] += artists
+        return {"phases": phases, "total_seconds": self.total_seconds}
+
+    def __repr__(self):
+        lines = ["%-16s %10s %8s" % ("phase", "seconds", "artists")]
+        for name, seconds, artists in self.phases:
+            lines.append("%-16s %10.4f %8d" % (name, seconds, artists))
+        lines.append("%-16s %10.4f" % ("total", self.total_seconds))
+        return "\n".join(lines)
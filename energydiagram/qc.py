@@ -0,0 +1,361 @@
+# -*- coding: utf-8 -*-
+"""
+Energies of quantum chemistry output files.
+
+The final SCF or Gibbs free energy of Gaussian, ORCA and xTB outputs is
+printed at the end of the file, so the files are memory-mapped and searched
+backwards from the end in growing windows: a finished job is usually found
+in the last 64 KiB without reading the rest of the file. The files are
+parsed by a pool of processes and the energies are kept in an optional JSON
+cache keyed by path, modification time and size, so unchanged files are not
+read again.
+
+@author: giacomo
+"""
+
+import json
+import mmap
+import os
+import re
+import threading
+import warnings
+
+import numpy as np
+
+from .units import convert
+
+_NUMBER = rb"(-?\d+\.\d+)"
+
+# markers of the header of every program and patterns of its final energies
+PROGRAMS = {
+    "gaussian": {
+        "markers": (b"Entering Gaussian System", b"Gaussian, Inc."),
+        "scf": re.compile(rb"SCF Done:\s+E\([^)]*\)\s*=\s*" + _NUMBER),
+        "gibbs": re.compile(
+            rb"Sum of electronic and thermal Free Energies=\s*" + _NUMBER
+        ),
+    },
+    "orca": {
+        "markers": (b"O   R   C   A", b"ORCA"),
+        "scf": re.compile(rb"FINAL SINGLE POINT ENERGY\s+" + _NUMBER),
+        "gibbs": re.compile(rb"Final Gibbs free energy\s+\.\.\.\s+" + _NUMBER),
+    },
+    "xtb": {
+        "markers": (b"x T B", b"xtb version"),
+        "scf": re.compile(rb"TOTAL ENERGY\s+" + _NUMBER + rb"\s+Eh"),
+        "gibbs": re.compile(rb"TOTAL FREE ENERGY\s+" + _NUMBER + rb"\s+Eh"),
+    },
+}
+
+QUANTITIES = ("auto", "scf", "gibbs")
+
+
+class EnergyNotFound(ValueError):
+    """The energy asked for is not in an output file."""
+
+
+# bytes of the first window searched from the end of a file and of the head
+# searched for the program markers
+_WINDOW = 1 << 16
+# longest match of the patterns, the windows overlap by this much
+_OVERLAP = 512
+
+
+def _last_match(data, pattern):
+    """Return the last match of pattern in data, searching backwards."""
+    end = len(data)
+    size = _WINDOW
+    while True:
+        start = max(0, end - size)
+        match = None
+        for match in pattern.finditer(data, start, end):
+            pass
+        if match is not None or start == 0:
+            return match
+        # the region after start + overlap was already searched
+        end = start + _OVERLAP
+        size *= 4
+
+
+def detect_program(data):
+    """Return the program that wrote an output file, or None.
+
+    Args:
+        data (bytes or mmap.mmap): The content of the file.
+    """
+    head = data[:_WINDOW]
+    # ORCA prints its name in many outputs of the other programs
+    for name in ("gaussian", "xtb", "orca"):
+        if any(marker in head for marker in PROGRAMS[name]["markers"]):
+            return name
+    return None
+
+
+def parse_file(path, quantity="auto", program=None):
+    """Return the final energy of a quantum chemistry output file.
+
+    Args:
+        path (str): The output file of Gaussian, ORCA or xTB.
+        quantity (str, optional): "scf" for the final electronic energy,
+            "gibbs" for the Gibbs free energy of a frequency calculation or
+            "auto" for the Gibbs free energy when present, else the SCF
+            energy. Defaults to "auto".
+        program (str, optional): "gaussian", "orca" or "xtb". Defaults to
+            None, detected from the header of the file.
+
+    Returns:
+        float: The energy in Hartree.
+
+    Raises:
+        ValueError: If the program is unknown.
+        EnergyNotFound: If the energy is not found.
+    """
+    if quantity not in QUANTITIES:
+        raise ValueError("quantity must be one of %s" % ", ".join(QUANTITIES))
+    with open(path, "rb") as f:
+        try:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty file
+            data = b""
+        try:
+            name = program or detect_program(data)
+            if name not in PROGRAMS:
+                raise ValueError("Unknown program of %s" % path)
+            patterns = PROGRAMS[name]
+            wanted = ("gibbs", "scf") if quantity == "auto" else (quantity,)
+            for key in wanted:
+                match = _last_match(data, patterns[key])
+                if match is not None:
+                    return float(match.group(1))
+        finally:
+            if isinstance(data, mmap.mmap):
+                data.close()
+    raise EnergyNotFound("No %s energy found in %s" % (" or ".join(wanted), path))
+
+
+def _parse_job(job):
+    return parse_file(*job)
+
+
+def _probe_job(job):
+    # NaN for a file without the energy, so the set can fall back as a whole
+    try:
+        return parse_file(*job)
+    except EnergyNotFound:
+        return float("nan")
+
+
+class ParseCache:
+    """JSON file of the energies of parsed output files.
+
+    An entry is valid while the modification time and the size of its file
+    are unchanged. The Gibbs free energy of a file without one is stored as
+    NaN, so the files are searched once by parse_files with quantity "auto".
+
+    Args:
+        fname (str): The cache file, created by save if missing.
+    """
+
+    def __init__(self, fname):
+        self.fname = fname
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+        self._dirty = False
+        try:
+            with open(fname, encoding="utf-8") as f:
+                self._entries = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+    @staticmethod
+    def key(path, quantity, program):
+        """Return the cache key of a parse."""
+        return "%s|%s|%s" % (os.path.abspath(path), quantity, program or "")
+
+    def get(self, key, stat):
+        """Return the cached energy or None."""
+        entry = self._entries.get(key)
+        if entry is not None and entry[:2] == [stat.st_mtime_ns, stat.st_size]:
+            self.hits += 1
+            return entry[2]
+        self.misses += 1
+        return None
+
+    def put(self, key, stat, energy):
+        """Store the energy of a file."""
+        self._entries[key] = [stat.st_mtime_ns, stat.st_size, energy]
+        self._dirty = True
+
+    def save(self):
+        """Write the cache file if it changed."""
+        if not self._dirty:
+            return
+        temporary = "%s.%d.tmp" % (self.fname, threading.get_ident())
+        with open(temporary, "w", encoding="utf-8") as f:
+            json.dump(self._entries, f)
+        os.replace(temporary, self.fname)
+        self._dirty = False
+
+
+def parse_files(paths, quantity="auto", program=None, jobs=None, cache=None):
+    """Return the final energies of many output files.
+
+    Args:
+        paths (list): The output files.
+        quantity (str, optional): "auto", "scf" or "gibbs", see parse_file.
+            Defaults to "auto".
+        program (str, optional): The program of all the files. Defaults to
+            None, detected for every file.
+        jobs (int, optional): Number of processes, 1 parses in the calling
+            process. Defaults to the number of CPUs.
+        cache (str or ParseCache, optional): Cache of the energies, a file
+            name or a ParseCache. Defaults to None.
+
+    Returns:
+        numpy.ndarray: The energies in Hartree, in the order of paths.
+
+    Note:
+        With quantity "auto" the same quantity is used for all the files:
+        the Gibbs free energies if every file has one, else the SCF
+        energies, with a warning if only some files have a Gibbs free
+        energy. Energies of different quantities are not comparable.
+    """
+    paths = [os.fspath(path) for path in paths]
+    if isinstance(cache, (str, os.PathLike)):
+        cache = ParseCache(cache)
+    if quantity == "auto":
+        energies = _parse_files(paths, "gibbs", program, jobs, cache, _probe_job)
+        found = ~np.isnan(energies)
+        if found.all():
+            return energies
+        if found.any():
+            warnings.warn(
+                "Only %d of %d files have a Gibbs free energy, the SCF energies "
+                "are used for all of them" % (found.sum(), len(paths)),
+                stacklevel=2,
+            )
+        return _parse_files(paths, "scf", program, jobs, cache, _parse_job)
+    if quantity not in QUANTITIES:
+        raise ValueError("quantity must be one of %s" % ", ".join(QUANTITIES))
+    return _parse_files(paths, quantity, program, jobs, cache, _parse_job)
+
+
+def _parse_files(paths, quantity, program, jobs, cache, job):
+    energies = np.empty(len(paths))
+    todo = []
+    for i, path in enumerate(paths):
+        if cache is not None:
+            stat = os.stat(path)
+            key = cache.key(path, quantity, program)
+            energy = cache.get(key, stat)
+            if energy is not None:
+                energies[i] = energy
+                continue
+            todo.append((i, key, stat))
+        else:
+            todo.append((i, None, None))
+
+    work = [(paths[i], quantity, program) for i, _, _ in todo]
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+    jobs = min(jobs, len(work))
+    if jobs <= 1:
+        results = map(job, work)
+        _store(energies, todo, results, cache)
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+
+        chunksize = max(1, len(work) // (jobs * 4))
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            results = executor.map(job, work, chunksize=chunksize)
+            _store(energies, todo, results, cache)
+    if cache is not None:
+        cache.save()
+    return energies
+
+
+def _store(energies, todo, results, cache):
+    for (i, key, stat), energy in zip(todo, results):
+        energies[i] = energy
+        if cache is not None:
+            cache.put(key, stat, energy)
+
+
+def relative_energies(energies, unit="kcal/mol", reference="first"):
+    """Convert absolute energies in Hartree to relative energies.
+
+    Args:
+        energies (array-like): The energies in Hartree.
+        unit (str, optional): The unit of the result. Defaults to "kcal/mol".
+        reference (optional): "first" for the first energy, "min" for the
+            lowest, an int for the energy with that index, a float for an
+            energy in Hartree or None for absolute energies. Defaults to
+            "first".
+
+    Returns:
+        numpy.ndarray: The energies in unit.
+    """
+    energies = np.asarray(energies, dtype=float)
+    if reference is None:
+        zero = 0.0
+    elif isinstance(reference, str):
+        if reference == "first":
+            zero = energies[0] if len(energies) else 0.0
+        elif reference == "min":
+            zero = energies.min() if len(energies) else 0.0
+        else:
+            raise ValueError('reference must be "first", "min", a number or None')
+    elif isinstance(reference, (int, np.integer)):
+        zero = energies[reference]
+    else:
+        zero = float(reference)
+    return convert(energies - zero, "hartree", unit)
+
+
+def read_logs(
+    diagram,
+    paths,
+    quantity="auto",
+    unit="kcal/mol",
+    reference="first",
+    positions=None,
+    bottom_texts=None,
+    program=None,
+    jobs=None,
+    cache=None,
+    **kwargs,
+):
+    """Add a level for every output file to a diagram.
+
+    Args:
+        diagram (ED): The diagram.
+        paths (list): The output files, one per level.
+        quantity (str, optional): "auto", "scf" or "gibbs", see
+            parse_files.
+        unit (str, optional): The unit of the levels. Defaults to
+            "kcal/mol".
+        reference (optional): The zero of the energies, see
+            relative_energies. Defaults to "first".
+        positions (list, optional): Positions of the levels, see
+            ED.add_levels. Defaults to None.
+        bottom_texts (list, optional): Texts below the levels. Defaults to
+            the file names without extension.
+        program, jobs, cache: See parse_files.
+        **kwargs: Other arguments of ED.add_levels, e.g. colors.
+
+    Returns:
+        ED: The diagram.
+    """
+    paths = [os.fspath(path) for path in paths]
+    energies = parse_files(paths, quantity, program, jobs, cache)
+    if bottom_texts is None:
+        bottom_texts = [os.path.splitext(os.path.basename(path))[0] for path in paths]
+    diagram.add_levels(
+        relative_energies(energies, unit, reference),
+        positions=positions,
+        bottom_texts=bottom_texts,
+        **kwargs,
+    )
+    return diagram
@@ -0,0 +1,462 @@
+# -*- coding: utf-8 -*-
+"""
+Binary file format of the diagrams.
+
+The file starts with a fixed prefix (magic, version and length of the
+header) followed by a JSON header and by the arrays, each one aligned at 64
+bytes so that they can be used in place from a memory map:
+
+- the levels as typed columns: energies, positions, style ids, integral
+  flags and the ids of their top, bottom, left and right texts;
+- all the texts in a single deduplicated string table, stored as the UTF-8
+  bytes of the unique strings and their offsets, and the texts that are not
+  strings (e.g. numbers) as JSON values in the header, with negative ids;
+- the links, the arrows and the electron boxes as edge arrays, with their
+  matplotlib properties in deduplicated style tables in the header.
+
+When loading, the texts are decoded and the per-level lists of links and
+arrows are built only when they are accessed, so opening a huge diagram
+does not parse or copy the whole file.
+
+@author: giacomo
+"""
+
+import json
+import struct
+
+import numpy as np
+
+from .levels import LevelStore
+
+MAGIC = b"EDIAGRAM"
+VERSION = 2
+# magic, version, length of the header
+_PREFIX = struct.Struct("<8sIQ")
+_ALIGN = 64
+
+
+def _aligned(offset):
+    return -(-offset // _ALIGN) * _ALIGN
+
+
+def _encode(value):
+    # JSON value of a style property, keeping tuples (e.g. dash patterns)
+    if isinstance(value, tuple):
+        return {"__tuple__": [_encode(item) for item in value]}
+    if isinstance(value, list):
+        return [_encode(item) for item in value]
+    if isinstance(value, dict):
+        return {"__dict__": [[key, _encode(item)] for key, item in value.items()]}
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return [_encode(item) for item in value.tolist()]
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    raise TypeError("Cannot save the property value %r" % (value,))
+
+
+def _decode(value):
+    if isinstance(value, list):
+        return [_decode(item) for item in value]
+    if isinstance(value, dict):
+        if "__tuple__" in value:
+            return tuple(_decode(item) for item in value["__tuple__"])
+        return {key: _decode(item) for key, item in value["__dict__"]}
+    return value
+
+
+class _StringTable:
+    """Deduplicated strings, built when saving and decoded when loading.
+
+    The other values (e.g. numbers) keep their type: they are stored as JSON
+    values with the ids -2, -3, ...
+    """
+
+    def __init__(self, data=None, offsets=None, values=()):
+        self._data = data
+        self._offsets = offsets
+        self._ids = {}
+        self._strings = []
+        self._decoded = {}
+        self.values = [_decode(value) for value in values]
+        self._value_ids = {}
+
+    def intern(self, text):
+        """Return the id of text, -1 for None."""
+        if text is None:
+            return -1
+        if not isinstance(text, str):
+            value = _encode(text)
+            # 1, 1.0 and True are different texts
+            key = json.dumps(value)
+            value_id = self._value_ids.get(key)
+            if value_id is None:
+                value_id = -2 - len(self.values)
+                self.values.append(value)
+                self._value_ids[key] = value_id
+            return value_id
+        string_id = self._ids.get(text)
+        if string_id is None:
+            string_id = len(self._strings)
+            self._strings.append(text)
+            self._ids[text] = string_id
+        return string_id
+
+    def ids(self, texts):
+        return np.fromiter((self.intern(text) for text in texts), np.int32, len(texts))
+
+    def arrays(self):
+        encoded = [text.encode("utf-8") for text in self._strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(item) for item in encoded], out=offsets[1:])
+        data = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        return data, offsets
+
+    def get(self, string_id):
+        """Return the string with the given id, None for -1."""
+        if string_id < 0:
+            return None if string_id == -1 else self.values[-2 - string_id]
+        text = self._decoded.get(string_id)
+        if text is None:
+            start, end = self._offsets[string_id : string_id + 2]
+            text = self._data[start:end].tobytes().decode("utf-8")
+            self._decoded[string_id] = text
+        return text
+
+
+class LazyTexts:
+    """A list of texts decoded from a string table when they are read.
+
+    The texts added after loading and the texts changed are kept in plain
+    Python objects, the others are only an id in the mapped file.
+    """
+
+    def __init__(self, table, ids):
+        self._table = table
+        self._ids = ids
+        self._changed = {}
+        self._tail = []
+
+    def __len__(self):
+        return len(self._ids) + len(self._tail)
+
+    def _index(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("list index out of range")
+        return index
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        index = self._index(index)
+        n = len(self._ids)
+        if index >= n:
+            return self._tail[index - n]
+        if index in self._changed:
+            return self._changed[index]
+        return self._table.get(int(self._ids[index]))
+
+    def __setitem__(self, index, text):
+        index = self._index(index)
+        n = len(self._ids)
+        if index >= n:
+            self._tail[index - n] = text
+        else:
+            self._changed[index] = text
+
+    def __iter__(self):
+        get = self._table.get
+        changed = self._changed
+        for index, string_id in enumerate(self._ids.tolist()):
+            yield changed[index] if index in changed else get(string_id)
+        yield from self._tail
+
+    def append(self, text):
+        self._tail.append(text)
+
+    def extend(self, texts):
+        self._tail.extend(texts)
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+class LazyEdges:
+    """The per-level lists of links or arrows, built from the edge arrays
+    when a level is accessed.
+
+    Args:
+        size (int): Number of levels.
+        starts (numpy.ndarray): Sorted start level of every edge.
+        build (callable): Return the item of the edge with the given index.
+    """
+
+    def __init__(self, size, starts, build):
+        self._size = size
+        self._starts = starts
+        self._build = build
+        self._lists = {}
+
+    def __len__(self):
+        return self._size
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += self._size
+        if not 0 <= index < self._size:
+            raise IndexError("list index out of range")
+        edges = self._lists.get(index)
+        if edges is None:
+            first, last = np.searchsorted(self._starts, [index, index + 1])
+            edges = [self._build(k) for k in range(first, last)]
+            self._lists[index] = edges
+        return edges
+
+    def __setitem__(self, index, edges):
+        self._lists[index] = edges
+
+    def __iter__(self):
+        # the edges of every level, without caching the untouched levels
+        bounds = np.searchsorted(self._starts, np.arange(self._size + 1)).tolist()
+        for index in range(self._size):
+            edges = self._lists.get(index)
+            if edges is None:
+                edges = [
+                    self._build(k) for k in range(bounds[index], bounds[index + 1])
+                ]
+            yield edges
+
+    def append(self, edges):
+        self._lists[self._size] = edges
+        self._size += 1
+
+    def extend(self, lists):
+        for edges in lists:
+            self.append(edges)
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def __reduce__(self):
+        # the builder refers to the mapped file, pickle the plain lists
+        return list, (list(self),)
+
+
+def write_diagram(diagram, fname, parameters):
+    """Write a diagram in the binary format.
+
+    Args:
+        diagram (ED): The diagram.
+        fname (str or file-like object): The file, opened in binary mode if
+            it is a file object.
+        parameters (dict): The plot parameters, saved in the header.
+    """
+    levels = diagram._levels
+    strings = _StringTable()
+    link_styles = _StringTable()
+    arrow_styles = _StringTable()
+    n = len(levels)
+
+    link_start, link_end, link_style = [], [], []
+    for idx, links in enumerate(diagram.links):
+        for idy, kwargs in links:
+            link_start.append(idx)
+            link_end.append(idy)
+            link_style.append(link_styles.intern(json.dumps(_encode(kwargs))))
+    arrow_start, arrow_end, arrow_position, arrow_text, arrow_style = (
+        [],
+        [],
+        [],
+        [],
+        [],
+    )
+    for idx, arrows in enumerate(diagram.arrows):
+        for idy, position, text, kwargs in arrows:
+            arrow_start.append(idx)
+            arrow_end.append(idy)
+            arrow_position.append(strings.intern(position))
+            arrow_text.append(strings.intern(text))
+            arrow_style.append(arrow_styles.intern(json.dumps(_encode(kwargs))))
+    boxes = diagram.electons_boxes
+    columns = levels.stats.columns
+
+    arrays = {
+        "energies": np.asarray(levels.energies, dtype="<f8"),
+        "positions": np.asarray(levels.positions, dtype="<f8"),
+        "style_ids": np.asarray(levels.style_ids, dtype="<i4"),
+        "integral": np.asarray(levels.integral, dtype="|b1"),
+        "top_texts": strings.ids(levels.top_texts),
+        "bottom_texts": strings.ids(levels.bottom_texts),
+        "left_texts": strings.ids(levels.left_texts),
+        "right_texts": strings.ids(levels.right_texts),
+        "column_positions": np.fromiter(columns.keys(), "<f8", len(columns)),
+        "column_counts": np.fromiter(columns.values(), "<i8", len(columns)),
+        "link_start": np.asarray(link_start, dtype="<i8"),
+        "link_end": np.asarray(link_end, dtype="<i8"),
+        "link_style": np.asarray(link_style, dtype="<i4"),
+        "arrow_start": np.asarray(arrow_start, dtype="<i8"),
+        "arrow_end": np.asarray(arrow_end, dtype="<i8"),
+        "arrow_position": np.asarray(arrow_position, dtype="<i4"),
+        "arrow_text": np.asarray(arrow_text, dtype="<i4"),
+        "arrow_style": np.asarray(arrow_style, dtype="<i4"),
+        "box_level": np.asarray([box[0] for box in boxes], dtype="<i8"),
+        "box_count": np.asarray([box[1] for box in boxes], dtype="<i8"),
+        "box_electrons": np.asarray([box[2] for box in boxes], dtype="<i8"),
+        "box_side": np.asarray([box[3] for box in boxes], dtype="<f8"),
+        "box_spacing": np.asarray([box[4] for box in boxes], dtype="<f8"),
+    }
+    arrays["strings_data"], arrays["strings_offsets"] = strings.arrays()
+
+    layout = {}
+    offset = 0
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        arrays[name] = array
+        layout[name] = {
+            "dtype": array.dtype.str,
+            "shape": list(array.shape),
+            "offset": offset,
+        }
+        offset = _aligned(offset + array.nbytes)
+    header = {
+        "levels": n,
+        "energy_range": [levels.stats.min_energy, levels.stats.max_energy],
+        "styles": [_encode(style) for style in levels.styles],
+        "keys": [[_encode(key), level_id] for key, level_id in levels.keys.items()],
+        "values": strings.values,
+        "link_styles": [json.loads(style) for style in link_styles._strings],
+        "arrow_styles": [json.loads(style) for style in arrow_styles._strings],
+        "parameters": {key: _encode(value) for key, value in parameters.items()},
+        "arrays": layout,
+    }
+    header = json.dumps(header).encode("utf-8")
+
+    def write(f):
+        f.write(_PREFIX.pack(MAGIC, VERSION, len(header)))
+        f.write(header)
+        position = _PREFIX.size + len(header)
+        start = _aligned(position)
+        for name, array in arrays.items():
+            f.write(b"\0" * (start + layout[name]["offset"] - position))
+            f.write(array.tobytes())
+            position = start + layout[name]["offset"] + array.nbytes
+
+    if hasattr(fname, "write"):
+        write(fname)
+    else:
+        with open(fname, "wb") as f:
+            write(f)
+
+
+def read_diagram(cls, fname, mmap=True):
+    """Read a diagram written by write_diagram.
+
+    Args:
+        cls (type): The class of the diagram, ED or a subclass.
+        fname (str): The file.
+        mmap (bool, optional): Map the file in memory instead of reading it.
+            The arrays of the diagram are read-only views of the file until
+            levels are added. Defaults to True.
+
+    Returns:
+        ED: The diagram.
+    """
+    with open(fname, "rb") as f:
+        prefix = f.read(_PREFIX.size)
+        if len(prefix) < _PREFIX.size:
+            raise ValueError("%s is not an energy diagram file" % fname)
+        magic, version, header_size = _PREFIX.unpack(prefix)
+        if magic != MAGIC:
+            raise ValueError("%s is not an energy diagram file" % fname)
+        if version > VERSION:
+            raise ValueError(
+                "%s was written by a newer version (format %d)" % (fname, version)
+            )
+        header = json.loads(f.read(header_size).decode("utf-8"))
+        if not mmap:
+            f.seek(0)
+            buffer = np.frombuffer(f.read(), dtype=np.uint8)
+    if mmap:
+        # a plain ndarray view, the memmap stays open as its base
+        buffer = np.asarray(np.memmap(fname, dtype=np.uint8, mode="r"))
+    start = _aligned(_PREFIX.size + header_size)
+
+    def array(name):
+        spec = header["arrays"][name]
+        dtype = np.dtype(spec["dtype"])
+        count = int(np.prod(spec["shape"]))
+        offset = start + spec["offset"]
+        data = buffer[offset : offset + count * dtype.itemsize]
+        return data.view(dtype).reshape(spec["shape"])
+
+    strings = _StringTable(
+        array("strings_data"), array("strings_offsets"), header.get("values", ())
+    )
+    n = header["levels"]
+    levels = LevelStore.from_arrays(
+        array("energies"),
+        array("positions"),
+        array("style_ids"),
+        array("integral"),
+        LazyTexts(strings, array("top_texts")),
+        LazyTexts(strings, array("bottom_texts")),
+        LazyTexts(strings, array("left_texts")),
+        LazyTexts(strings, array("right_texts")),
+        [_decode(style) for style in header["styles"]],
+    )
+    levels.keys = {_decode(key): level_id for key, level_id in header.get("keys", [])}
+    stats = levels.stats
+    stats.min_energy, stats.max_energy = header["energy_range"]
+    stats.columns = dict(
+        zip(array("column_positions").tolist(), array("column_counts").tolist())
+    )
+
+    link_styles = [_decode(style) for style in header["link_styles"]]
+    link_end = array("link_end")
+    link_style = array("link_style")
+
+    def link(k):
+        return (int(link_end[k]), dict(link_styles[link_style[k]]))
+
+    arrow_styles = [_decode(style) for style in header["arrow_styles"]]
+    arrow_end = array("arrow_end")
+    arrow_position = array("arrow_position")
+    arrow_text = array("arrow_text")
+    arrow_style = array("arrow_style")
+
+    def arrow(k):
+        return (
+            int(arrow_end[k]),
+            strings.get(int(arrow_position[k])),
+            strings.get(int(arrow_text[k])),
+            dict(arrow_styles[arrow_style[k]]),
+        )
+
+    diagram = cls()
+    diagram._levels = levels
+    diagram.links = LazyEdges(n, array("link_start"), link)
+    diagram.arrows = LazyEdges(n, array("arrow_start"), arrow)
+    diagram.electons_boxes = [
+        tuple(box)
+        for box in zip(
+            array("box_level").tolist(),
+            array("box_count").tolist(),
+            array("box_electrons").tolist(),
+            array("box_side").tolist(),
+            array("box_spacing").tolist(),
+        )
+    ]
+    for name, value in header["parameters"].items():
+        setattr(diagram, name, _decode(value))
+    return diagram
@@ -0,0 +1,465 @@
+# -*- coding: utf-8 -*-
+"""
+Direct SVG output.
+
+Simple diagrams are made only of lines, Bezier curves, arrows and text, so
+they can be written as SVG markup directly from the geometry computed by
+ED, without the matplotlib artists, transforms and renderers. Lengths are
+in points as in the SVG files written by matplotlib. Math text (e.g.
+"$\\sigma$") is written as it is.
+
+@author: giacomo
+"""
+
+import math
+from xml.sax.saxutils import escape
+
+import numpy as np
+
+from .box_notation import orbital_boxes_vertices
+
+# matplotlib defaults
+FONT_SIZE = 10.0
+FONT_SCALINGS = {
+    "xx-small": 0.579,
+    "x-small": 0.694,
+    "small": 0.833,
+    "medium": 1.0,
+    "large": 1.2,
+    "x-large": 1.44,
+    "xx-large": 1.728,
+    "larger": 1.2,
+    "smaller": 0.833,
+}
+BASE_COLORS = {
+    "b": "#0000ff",
+    "g": "#008000",
+    "r": "#ff0000",
+    "c": "#00bfbf",
+    "m": "#bf00bf",
+    "y": "#bfbf00",
+    "k": "#000000",
+    "w": "#ffffff",
+}
+TABLEAU_COLORS = [
+    "#1f77b4",
+    "#ff7f0e",
+    "#2ca02c",
+    "#d62728",
+    "#9467bd",
+    "#8c564b",
+    "#e377c2",
+    "#7f7f7f",
+    "#bcbd22",
+    "#17becf",
+]
+TABLEAU_NAMES = [
+    "blue",
+    "orange",
+    "green",
+    "red",
+    "purple",
+    "brown",
+    "pink",
+    "gray",
+    "olive",
+    "cyan",
+]
+DASH_PATTERNS = {
+    "dashed": (3.7, 1.6),
+    "--": (3.7, 1.6),
+    "dashdot": (6.4, 1.6, 1.0, 1.6),
+    "-.": (6.4, 1.6, 1.0, 1.6),
+    "dotted": (1.0, 1.65),
+    ":": (1.0, 1.65),
+}
+ALIGNMENTS = {"center": "middle", "left": "start", "right": "end"}
+# shift of the baseline for the vertical alignments, in units of font size
+BASELINE_SHIFTS = {"bottom": -0.22, "top": 0.78, "center": 0.3, "baseline": 0.0}
+# margins around the axes
+MARGIN_LEFT = 70.0
+MARGIN_RIGHT = 40.0
+MARGIN_TOP = 30.0
+MARGIN_BOTTOM = 30.0
+
+
+def _num(value):
+    return ("%.3f" % value).rstrip("0").rstrip(".")
+
+
+def _color(color):
+    """Convert a matplotlib color to a SVG color."""
+    if color is None or (isinstance(color, str) and color.lower() == "none"):
+        return "none"
+    if isinstance(color, str):
+        if color in BASE_COLORS:
+            return BASE_COLORS[color]
+        if color[:1] == "C" and color[1:].isdigit():
+            return TABLEAU_COLORS[int(color[1:]) % len(TABLEAU_COLORS)]
+        if color.startswith("tab:") and color[4:] in TABLEAU_NAMES:
+            return TABLEAU_COLORS[TABLEAU_NAMES.index(color[4:])]
+        try:
+            # gray level
+            gray = int(round(float(color) * 255))
+            return "rgb(%d,%d,%d)" % (gray, gray, gray)
+        except ValueError:
+            return color
+    channels = [int(round(float(c) * 255)) for c in color[:3]]
+    return "rgb(%d,%d,%d)" % tuple(channels)
+
+
+def _opacity(color):
+    # alpha of a RGBA tuple
+    if not isinstance(color, str) and color is not None and len(color) == 4:
+        return float(color[3])
+    return None
+
+
+def _fontsize(size):
+    if size is None:
+        return FONT_SIZE
+    if isinstance(size, str):
+        return FONT_SIZE * FONT_SCALINGS.get(size, 1.0)
+    return float(size)
+
+
+def _stroke(color, linewidth=1.0, linestyle=None, fill="none"):
+    """Attributes for a stroked shape, dashes are scaled by the linewidth
+    as in matplotlib."""
+    attrs = 'fill="%s" stroke="%s" stroke-width="%s"' % (
+        fill,
+        _color(color),
+        _num(linewidth),
+    )
+    opacity = _opacity(color)
+    if opacity is not None:
+        attrs += ' stroke-opacity="%s"' % _num(opacity)
+    if isinstance(linestyle, tuple):
+        dashes = linestyle[1]
+    else:
+        dashes = DASH_PATTERNS.get(linestyle)
+    if dashes:
+        attrs += ' stroke-dasharray="%s"' % ",".join(
+            _num(d * linewidth) for d in dashes
+        )
+    return attrs
+
+
+def _nice_ticks(low, high, number=6):
+    raw = (high - low) / float(number)
+    if raw <= 0:
+        return [low]
+    magnitude = 10 ** math.floor(math.log10(raw))
+    for factor in (1, 2, 2.5, 5, 10):
+        step = factor * magnitude
+        if step >= raw:
+            break
+    first = math.ceil(low / step) * step
+    return list(np.arange(first, high + step * 1e-9, step))
+
+
+class _Frame:
+    """Transformation from data coordinates to SVG points."""
+
+    def __init__(self, xlim, ylim, aspect, width, max_height):
+        self.x0, x1 = xlim
+        y0, self.y1 = ylim
+        sx = width / (x1 - self.x0)
+        sy = max_height / (self.y1 - y0)
+        if aspect == "equal":
+            sx = sy = min(sx, sy)
+        else:
+            sy = min(sy, 0.75 * width / (self.y1 - y0))
+        self.sx = sx
+        self.sy = sy
+        self.width = (x1 - self.x0) * sx
+        self.height = (self.y1 - y0) * sy
+        self.ylim = ylim
+
+    def x(self, value):
+        return MARGIN_LEFT + (value - self.x0) * self.sx
+
+    def y(self, value):
+        return MARGIN_TOP + (self.y1 - value) * self.sy
+
+    def point(self, x, y):
+        return "%s %s" % (_num(self.x(x)), _num(self.y(y)))
+
+
+def _limits(low, high):
+    # data limits with the default matplotlib margins
+    pad = 0.05 * (high - low)
+    if pad == 0:
+        pad = 0.5
+    return low - pad, high + pad
+
+
+def diagram_svg(diagram, show_IDs=False, ylabel="Energy / kcal mol-1", width=460.0):
+    """Write the SVG markup of a diagram.
+
+    Args:
+        diagram (ED): The diagram, with its layout already computed.
+        show_IDs (bool, optional): Show the IDs of the levels.
+        ylabel (str, optional): The label of the energy axis.
+        width (float, optional): The maximum width of the axes in points.
+
+    Returns:
+        str: The SVG document.
+    """
+    d = diagram
+    step = d.dimension + d.space
+    energies = d.energies
+    starts = d.positions * step
+    frame = _Frame(
+        _limits(float(starts.min()), float((starts + d.dimension).max())),
+        _limits(float(energies.min()), float(energies.max())),
+        d.aspect,
+        width,
+        1.5 * width,
+    )
+    total_width = MARGIN_LEFT + frame.width + MARGIN_RIGHT
+    total_height = MARGIN_TOP + frame.height + MARGIN_BOTTOM
+    out = [
+        '<?xml version="1.0" encoding="utf-8" standalone="no"?>',
+        '<svg xmlns="http://www.w3.org/2000/svg" width="%spt" height="%spt" '
+        'viewBox="0 0 %s %s">'
+        % (
+            _num(total_width),
+            _num(total_height),
+            _num(total_width),
+            _num(total_height),
+        ),
+        '<g font-family="DejaVu Sans, Bitstream Vera Sans, Arial, sans-serif">',
+    ]
+    out.extend(_axis_markup(frame, ylabel))
+    out.extend(_levels_markup(d, frame, starts, energies))
+    out.extend(_links_markup(d, frame))
+    out.extend(_arrows_markup(d, frame))
+    out.extend(_boxes_markup(d, frame))
+    for style, xs, ys, texts in d._label_groups(show_IDs):
+        out.extend(_texts_markup(frame, style, xs, ys, texts))
+    out.append("</g>")
+    out.append("</svg>")
+    return "\n".join(out) + "\n"
+
+
+def _axis_markup(frame, ylabel):
+    left = MARGIN_LEFT
+    top = frame.y(frame.ylim[1])
+    bottom = frame.y(frame.ylim[0])
+    out = [
+        '<path d="M%s %sV%s" %s/>'
+        % (_num(left), _num(top), _num(bottom), _stroke("k", 0.8))
+    ]
+    ticks = []
+    labels = []
+    for value in _nice_ticks(*frame.ylim):
+        y = frame.y(value)
+        ticks.append("M%s %sh-3.5" % (_num(left), _num(y)))
+        labels.append(
+            '<text x="%s" y="%s">%s</text>'
+            % (_num(left - 7), _num(y + 0.3 * FONT_SIZE), "%g" % value)
+        )
+    out.append('<path d="%s" %s/>' % ("".join(ticks), _stroke("k", 0.8)))
+    out.append('<g font-size="%s" text-anchor="end">' % _num(FONT_SIZE))
+    out.extend(labels)
+    out.append("</g>")
+    if ylabel:
+        x = _num(left - 45)
+        y = _num(0.5 * (top + bottom))
+        out.append(
+            '<text x="%s" y="%s" font-size="%s" text-anchor="middle" '
+            'transform="rotate(-90 %s %s)">%s</text>'
+            % (x, y, _num(FONT_SIZE), x, y, escape(ylabel))
+        )
+    return out
+
+
+def _levels_markup(d, frame, starts, energies):
+    from .energydiagram import _split_level_style
+
+    paths = {}
+    for start, energy, kwargs in zip(starts, energies, d.level_kwargs):
+        color, linewidth, linestyle, _ = _split_level_style(kwargs)
+        key = (repr(color), linewidth, repr(linestyle))
+        if key not in paths:
+            if linewidth is None:
+                linewidth = 1.5
+            paths[key] = (_stroke(color or "k", linewidth, linestyle), [])
+        paths[key][1].append(
+            "M%sH%s" % (frame.point(start, energy), _num(frame.x(start + d.dimension)))
+        )
+    return ['<path d="%s" %s/>' % ("".join(p), attrs) for attrs, p in paths.values()]
+
+
+def _links_markup(d, frame):
+    from .energydiagram import _split_level_style
+
+    paths = {}
+    for idx, links in enumerate(d.links):
+        for idy, kwargs in links:
+            color, linewidth, linestyle, extra = _split_level_style(kwargs)
+            vertices = d._link_vertices(idx, idy, extra["line_order"])
+            command = {2: "L", 3: "Q", 4: "C"}[len(vertices)]
+            segment = "M%s%s%s" % (
+                frame.point(*vertices[0]),
+                command,
+                " ".join(frame.point(*v) for v in vertices[1:]),
+            )
+            key = (repr(color), linewidth, repr(linestyle))
+            if key not in paths:
+                paths[key] = (_stroke(color, linewidth, linestyle), [])
+            paths[key][1].append(segment)
+    return ['<path d="%s" %s/>' % ("".join(p), attrs) for attrs, p in paths.values()]
+
+
+def _arrow_head(x, tip, other, head, size):
+    """Path of an arrow head ("open", "filled" or "bar") at tip pointing
+    away from other, and whether it is filled."""
+    if head == "bar":
+        half = 0.5 * size
+        return "M%s %sh%s" % (_num(x - half), _num(tip), _num(2 * half)), False
+    direction = 1.0 if tip > other else -1.0
+    length = 0.4 * size
+    half = 0.2 * size
+    base = tip - direction * length
+    path = "M%s %sL%s %sL%s %s" % (
+        _num(x - half),
+        _num(base),
+        _num(x),
+        _num(tip),
+        _num(x + half),
+        _num(base),
+    )
+    if head == "filled":
+        return path + "Z", True
+    return path, False
+
+
+def _arrows_markup(d, frame):
+    from .energydiagram import _ARROW_HEADS, _arrow_styles
+
+    out = []
+    for idx, arrows in enumerate(d.arrows):
+        for idy, position, text, kwargs in arrows:
+            x_arrow, x_text, y1, y2, text, ha, bar, support = d._arrow_geometry(
+                idx, idy, position, text
+            )
+            arrowprops, bbox, line_kwargs = _arrow_styles(kwargs, bar)
+            color = arrowprops["color"]
+            scale = arrowprops["mutation_scale"]
+            # the other styles of matplotlib (e.g. "simple") have a head at B
+            ends = _ARROW_HEADS.get(arrowprops["arrowstyle"], (None, "filled"))
+            x = frame.x(x_arrow)
+            # as in annotate the arrow goes from y2 (A) to y1 (B), the ends
+            # are moved towards each other by shrinkA and shrinkB points
+            ya = frame.y(y2)
+            yb = frame.y(y1)
+            direction = 1.0 if yb >= ya else -1.0
+            ya += direction * arrowprops["shrinkA"]
+            yb -= direction * arrowprops["shrinkB"]
+            shaft = "M%s %sV%s" % (_num(x), _num(ya), _num(yb))
+            out.append(
+                '<path d="%s" %s/>'
+                % (shaft, _stroke(color, 1.0, arrowprops["linestyle"]))
+            )
+            heads = {False: [], True: []}
+            for head, tip, other in zip(ends, (ya, yb), (yb, ya)):
+                if head is not None:
+                    path, filled = _arrow_head(x, tip, other, head, scale)
+                    heads[filled].append(path)
+            for filled, paths in heads.items():
+                if paths:
+                    fill = _color(color) if filled else "none"
+                    out.append(
+                        '<path d="%s" %s/>'
+                        % ("".join(paths), _stroke(color, 1.0, fill=fill))
+                    )
+            # gap label in a rounded box
+            fontsize = FONT_SIZE
+            label = str(text)
+            text_width = 0.6 * fontsize * len(label)
+            pad = 0.3 * fontsize
+            xt = frame.x(x_text)
+            ym = frame.y(y1 - 0.5 * (y1 - y2))
+            left = {
+                "center": xt - 0.5 * text_width,
+                "left": xt,
+                "right": xt - text_width,
+            }[ha]
+            out.append(
+                '<rect x="%s" y="%s" width="%s" height="%s" rx="%s" %s/>'
+                % (
+                    _num(left - pad),
+                    _num(ym - 0.6 * fontsize - pad),
+                    _num(text_width + 2 * pad),
+                    _num(1.2 * fontsize + 2 * pad),
+                    _num(pad),
+                    _stroke(bbox["color"], 1.0, fill=_color(bbox["fc"])),
+                )
+            )
+            out.append(
+                '<text x="%s" y="%s" font-size="%s" text-anchor="%s">%s</text>'
+                % (
+                    _num(xt),
+                    _num(ym + BASELINE_SHIFTS["center"] * fontsize),
+                    _num(fontsize),
+                    ALIGNMENTS[ha],
+                    escape(label),
+                )
+            )
+            if support is not None:
+                line = "M%sH%s" % (
+                    frame.point(support[0], y2),
+                    _num(frame.x(support[1])),
+                )
+                out.append(
+                    '<path d="%s" %s/>'
+                    % (
+                        line,
+                        _stroke(line_kwargs["color"], 1.5, line_kwargs["linestyle"]),
+                    )
+                )
+    return out
+
+
+def _boxes_markup(d, frame):
+    boxes = d._electron_boxes_xy()
+    if not boxes:
+        return []
+    corners, spins = orbital_boxes_vertices(boxes)
+
+    def polygons(vertices):
+        return "".join(
+            "M" + "L".join(frame.point(x, y) for x, y in polygon) + "Z"
+            for polygon in vertices
+        )
+
+    out = ['<path d="%s" %s/>' % (polygons(corners), _stroke("k", 1.0, fill="#ffffff"))]
+    if len(spins):
+        # the last vertex of a spin closes the polygon
+        out.append(
+            '<path d="%s" %s/>'
+            % (polygons(spins[:, :-1]), _stroke("k", 0.1, fill="#000000"))
+        )
+    return out
+
+
+def _texts_markup(frame, style, xs, ys, texts):
+    fontsize = _fontsize(style.get("fontsize"))
+    shift = BASELINE_SHIFTS[style.get("verticalalignment", "baseline")] * fontsize
+    out = [
+        '<g fill="%s" font-size="%s" text-anchor="%s">'
+        % (
+            _color(style.get("color", "k")),
+            _num(fontsize),
+            ALIGNMENTS[style.get("horizontalalignment", "left")],
+        )
+    ]
+    for x, y, text in zip(xs, ys, texts):
+        out.append(
+            '<text x="%s" y="%s">%s</text>'
+            % (_num(frame.x(x)), _num(frame.y(y) + shift), escape(str(text)))
+        )
+    out.append("</g>")
+    return out
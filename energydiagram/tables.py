@@ -0,0 +1,326 @@
+# -*- coding: utf-8 -*-
+"""
+Ingestion of tables of levels, links and arrows.
+
+A table is a CSV file, a Parquet file (read with pyarrow), a pandas
+DataFrame or a dictionary of columns. The files are read in chunks of rows
+and every chunk of levels is added with a single call to ED.add_levels, so
+the whole file is never held as Python objects.
+
+@author: giacomo
+"""
+
+import csv
+import itertools
+import os
+
+import numpy as np
+
+# fields of a level and the default name of their column
+LEVEL_FIELDS = (
+    "energy",
+    "position",
+    "bottom_text",
+    "top_text",
+    "left_text",
+    "right_text",
+    "color",
+    "linewidth",
+    "key",
+)
+
+
+def _csv_chunks(fname, chunksize):
+    with open(fname, newline="", encoding="utf-8") as f:
+        reader = csv.reader(f, skipinitialspace=True)
+        header = next(reader, None)
+        if header is None:
+            return
+        header = [name.strip() for name in header]
+        width = len(header)
+        while True:
+            line = reader.line_num
+            # tuples of strings are untracked by the garbage collector at
+            # its first pass, the lists of the reader would be scanned again
+            # at every collection while the chunk is alive
+            rows = list(map(tuple, itertools.islice(reader, chunksize)))
+            if not rows:
+                return
+            if set(map(len, rows)) != {width}:
+                rows = _fill_rows(rows, width, fname, line)
+            yield dict(zip(header, zip(*rows)))
+
+
+def _fill_rows(rows, width, fname, line):
+    """Drop the blank lines and pad the short rows with empty cells, zip
+    would cut all the columns to the shortest row."""
+    filled = []
+    for number, row in enumerate(rows, line + 1):
+        if not row:
+            continue
+        if len(row) > width:
+            raise ValueError(
+                "Line %d of %s has %d cells, the header has %d"
+                % (number, fname, len(row), width)
+            )
+        filled.append(row + ("",) * (width - len(row)))
+    return filled
+
+
+def _parquet_chunks(fname, chunksize):
+    try:
+        import pyarrow.parquet as pq
+    except ImportError as err:
+        raise ImportError("Reading Parquet files requires pyarrow") from err
+    for batch in pq.ParquetFile(fname).iter_batches(batch_size=chunksize):
+        yield {
+            name: column.to_numpy(zero_copy_only=False)
+            for name, column in zip(batch.schema.names, batch.columns)
+        }
+
+
+def iter_chunks(table, chunksize=100000):
+    """Yield the table as dictionaries of columns of at most chunksize rows.
+
+    Args:
+        table: A CSV or Parquet (.parquet, .pq) file name, a pandas
+            DataFrame or a dictionary of columns.
+        chunksize (int, optional): Rows of a chunk read from a file.
+            Defaults to 100000.
+
+    Yields:
+        dict: Column name to sequence of values. The values of a CSV file
+        are strings.
+    """
+    if isinstance(table, (str, os.PathLike)):
+        extension = os.path.splitext(os.fspath(table))[1].lower()
+        if extension in (".parquet", ".pq"):
+            yield from _parquet_chunks(table, chunksize)
+        else:
+            yield from _csv_chunks(table, chunksize)
+    elif hasattr(table, "columns") and hasattr(table, "to_numpy"):
+        # a pandas DataFrame is already in memory
+        yield {str(name): table[name].to_numpy() for name in table.columns}
+    else:
+        yield dict(table)
+
+
+def _is_missing(value):
+    if value is None:
+        return True
+    if isinstance(value, str):
+        return not value.strip()
+    if isinstance(value, (float, np.floating)):
+        return np.isnan(value)
+    return False
+
+
+def _numbers(values):
+    """Convert a column to an integer array if possible, else to floats."""
+    values = np.asarray(values)
+    if values.dtype.kind in "iuf":
+        return values
+    try:
+        return values.astype(np.int64)
+    except (ValueError, OverflowError):
+        return values.astype(float)
+
+
+def _energies(values):
+    """Return the energies of a column as floats and whether every one was
+    written as an integer."""
+    values = np.asarray(values)
+    if values.dtype.kind in "iuf":
+        return values.astype(float), values.dtype.kind != "f"
+    if values.dtype.kind == "U":
+        integral = np.char.isdigit(np.char.lstrip(np.char.strip(values), "+-"))
+    else:
+        integral = np.array(
+            [isinstance(value, (int, np.integer)) for value in values], dtype=bool
+        )
+    return values.astype(float), integral
+
+
+def _values(values):
+    """Convert a column to a list of Python values, None for the missing
+    ones. Columns of strings are converted to integers or floats when all
+    their values are numbers."""
+    array = np.asarray(values)
+    if array.dtype.kind in "iub":
+        return array.tolist()
+    if array.dtype.kind == "f":
+        return [None if np.isnan(value) else value for value in array.tolist()]
+    if array.dtype.kind == "U":
+        missing = np.char.str_len(np.char.strip(array)) == 0
+    else:
+        missing = np.array([_is_missing(value) for value in array.tolist()], dtype=bool)
+    result = np.empty(len(array), dtype=object)
+    filled = array[~missing]
+    for kind in (np.int64, float):
+        try:
+            result[~missing] = filled.astype(kind).tolist()
+            break
+        except (TypeError, ValueError, OverflowError):
+            continue
+    else:
+        result[~missing] = filled.tolist()
+    return result.tolist()
+
+
+def _texts(values, default):
+    if isinstance(values, tuple):
+        # a column of a CSV file, the missing cells are empty strings
+        if default == "":
+            return values
+        return [value if value else default for value in values]
+    return [default if _is_missing(value) else value for value in values]
+
+
+def _positions(diagram, values):
+    """Positions of a chunk: numbers, "last" (or "l") for the position of
+    the previous level, or empty for the next position."""
+    if isinstance(values, tuple):
+        values = np.asarray(values)
+        new = values == ""
+        last = (values == "last") | (values == "l")
+    else:
+        values = np.asarray(values, dtype=object)
+        new = np.array([_is_missing(value) for value in values], dtype=bool)
+        last = np.isin(values, ["last", "l"])
+    # the position used by "last" and the empty cells, as add_level does
+    counter = diagram.pos_number + np.cumsum(new)
+    positions = counter.astype(float)
+    explicit = ~(new | last)
+    if explicit.any():
+        positions[explicit] = values[explicit].astype(float)
+    diagram.pos_number = int(counter[-1]) if len(counter) else diagram.pos_number
+    return positions
+
+
+def add_level_chunk(diagram, chunk, columns, **kwargs):
+    """Add the levels of a chunk of a table to a diagram.
+
+    Args:
+        diagram (ED): The diagram.
+        chunk (dict): The columns of the chunk.
+        columns (dict): Field of the level (see LEVEL_FIELDS) to column name,
+            the missing fields use the default texts and styles.
+        **kwargs: Properties shared by all the levels, e.g. linestyle.
+    """
+    energies, integral = _energies(chunk[columns["energy"]])
+    n = len(energies)
+    if not n:
+        return
+
+    def column(field):
+        name = columns.get(field)
+        return None if name is None else chunk[name]
+
+    positions = column("position")
+    if positions is not None:
+        positions = _positions(diagram, positions)
+    texts = {}
+    for field, default in (
+        ("bottom_text", ""),
+        ("top_text", None),
+        ("left_text", ""),
+        ("right_text", ""),
+    ):
+        values = column(field)
+        texts[field + "s"] = None if values is None else _texts(values, default)
+    colors = column("color")
+    colors = "k" if colors is None else _texts(colors, "k")
+    keys = column("key")
+    if keys is not None:
+        keys = _texts(keys, None)
+    linewidths = column("linewidth")
+    if linewidths is None:
+        linewidths = 2
+    else:
+        linewidths = np.asarray(_texts(linewidths, 2), dtype=float)
+    diagram.add_levels(
+        energies,
+        positions=positions,
+        colors=colors,
+        linewidths=linewidths,
+        integral=integral,
+        keys=keys,
+        **texts,
+        **kwargs,
+    )
+
+
+def _level_ids(diagram, values):
+    try:
+        return _numbers(values).astype(np.int64).tolist()
+    except ValueError:
+        # keys or bottom texts, maybe mixed with IDs
+        return [
+            diagram.level_id(int(value) if str(value).isdigit() else value)
+            for value in _values(values)
+        ]
+
+
+def add_edges(diagram, table, method, chunksize=100000):
+    """Add the links or the arrows of a table to a diagram.
+
+    Args:
+        diagram (ED): The diagram.
+        table: The edge table, see iter_chunks. The "start" and "end"
+            columns are the IDs, the keys or the bottom texts of the levels
+            (see ED.level_id), the other columns are passed
+            as keyword arguments to method, skipping the empty cells.
+        method (callable): ED.add_link or ED.add_arrow of the diagram.
+        chunksize (int, optional): Rows of a chunk read from a file.
+    """
+    for chunk in iter_chunks(table, chunksize):
+        starts = _level_ids(diagram, chunk.pop("start"))
+        ends = _level_ids(diagram, chunk.pop("end"))
+        names = list(chunk)
+        properties = [_values(chunk[name]) for name in names]
+        for row, (start, end) in enumerate(zip(starts, ends)):
+            kwargs = {}
+            for name, values in zip(names, properties):
+                if values[row] is not None:
+                    kwargs[name] = values[row]
+            method(start, end, **kwargs)
+
+
+def read_tables(
+    diagram, levels, links=None, arrows=None, columns=None, chunksize=100000, **kwargs
+):
+    """Add the levels, links and arrows of tables to a diagram.
+
+    Args:
+        diagram (ED): The diagram.
+        levels: The table of the levels, see iter_chunks.
+        links: The table of the links, see add_edges. Defaults to None.
+        arrows: The table of the arrows, see add_edges. Defaults to None.
+        columns (dict, optional): Field of the level to column name, by
+            default the columns named as the fields (see LEVEL_FIELDS) are
+            used when present.
+        chunksize (int, optional): Rows of a chunk read from a file.
+            Defaults to 100000.
+        **kwargs: Properties shared by all the levels, e.g. linestyle.
+
+    Returns:
+        ED: The diagram.
+    """
+    columns = dict(columns or {})
+    for chunk in iter_chunks(levels, chunksize):
+        mapping = {
+            field: columns.get(field, field)
+            for field in LEVEL_FIELDS
+            if columns.get(field, field) in chunk
+        }
+        if "energy" not in mapping:
+            raise KeyError(
+                "The table of the levels has no %r column"
+                % columns.get("energy", "energy")
+            )
+        add_level_chunk(diagram, chunk, mapping, **kwargs)
+    if links is not None:
+        add_edges(diagram, links, diagram.add_link, chunksize)
+    if arrows is not None:
+        add_edges(diagram, arrows, diagram.add_arrow, chunksize)
+    return diagram
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""
+Energy units.
+
+The conversion factors are relative to the Hartree (CODATA 2018) and the
+conversions work on scalars and NumPy arrays alike.
+
+@author: giacomo
+"""
+
+import numpy as np
+
+# value of one Hartree in every unit
+HARTREE = {
+    "hartree": 1.0,
+    "ev": 27.211386245988,
+    "kj/mol": 2625.4996394799,
+    "kcal/mol": 627.50947406,
+    "cm-1": 219474.6313632,
+}
+
+_ALIASES = {
+    "eh": "hartree",
+    "ha": "hartree",
+    "au": "hartree",
+    "a.u.": "hartree",
+    "kjmol": "kj/mol",
+    "kj mol-1": "kj/mol",
+    "kcalmol": "kcal/mol",
+    "kcal mol-1": "kcal/mol",
+    "wavenumber": "cm-1",
+}
+
+
+def normalize_unit(unit):
+    """Return the canonical name of an energy unit.
+
+    Args:
+        unit (str): A unit, e.g. "kcal/mol", "kJ/mol", "eV", "Eh".
+
+    Raises:
+        ValueError: If the unit is unknown.
+    """
+    name = unit.strip().lower()
+    name = _ALIASES.get(name, name)
+    if name not in HARTREE:
+        raise ValueError(
+            "Unknown energy unit %r, use one of: %s" % (unit, ", ".join(HARTREE))
+        )
+    return name
+
+
+def convert(values, from_unit, to_unit):
+    """Convert energies between units.
+
+    Args:
+        values (float or array-like): The energies.
+        from_unit (str): Their unit.
+        to_unit (str): The wanted unit.
+
+    Returns:
+        float or numpy.ndarray: The converted energies.
+    """
+    factor = HARTREE[normalize_unit(to_unit)] / HARTREE[normalize_unit(from_unit)]
+    if np.ndim(values):
+        return np.asarray(values, dtype=float) * factor
+    return float(values) * factor
+
+
+# label of every unit on the energy axis, as plain text and as math text
+LABELS = {
+    "hartree": ("Eh", "$E_h$"),
+    "ev": ("eV", "$eV$"),
+    "kj/mol": ("kJ mol-1", "$kJ$ $mol^{-1}$"),
+    "kcal/mol": ("kcal mol-1", "$kcal$ $mol^{-1}$"),
+    "cm-1": ("cm-1", "$cm^{-1}$"),
+}
+
+
+def axis_label(unit, math=True):
+    """Return the label of an energy axis, e.g. "Energy / $eV$".
+
+    Args:
+        unit (str): The energy unit.
+        math (bool, optional): Use matplotlib math text, else plain text.
+            Defaults to True.
+    """
+    return "Energy / " + LABELS[normalize_unit(unit)][1 if math else 0]
@@ -1,5 +1,18 @@
+import io
+import os
+import pickle
+import subprocess
+import sys
+import tempfile
 import unittest
-from energydiagram import ED
+from xml.etree import ElementTree
+
+import numpy as np
+
+from energydiagram import ED, EDGrid, RenderCache, render_many
+from energydiagram.box_notation import orbital_boxes_vertices
+from energydiagram.figures import FigurePool
+from energydiagram.placement import spread_labels
 
 class TestED(unittest.TestCase):
     def setUp(self):
@@ -33,5 +46,695 @@ class TestED(unittest.TestCase):
         except Exception as e:
             self.fail(f"plot() raised {e}")
 
+    def test_plot_levels_batched(self):
+        self.ed.add_level(0, color='r')
+        self.ed.add_level(10, linestyle='dashed')
+        self.ed.add_level(5, 'last', zorder=3)
+        self.ed.plot()
+        collections = self.ed.ax.collections
+        # two groups: default zorder and zorder=3
+        self.assertEqual(len(collections), 2)
+        self.assertEqual(sum(len(c.get_segments()) for c in collections), 3)
+        step = self.ed.dimension + self.ed.space
+        segments = [s for c in collections for s in c.get_segments()]
+        for segment, position, energy in zip(segments, [1, 2, 3], [0, 10, 5]):
+            np.testing.assert_allclose(
+                segment, [[position * step, energy],
+                          [position * step + self.ed.dimension, energy]])
+        np.testing.assert_allclose(collections[0].get_colors(), [[1, 0, 0, 1], [0, 0, 0, 1]])
+        self.assertIsNone(collections[0].get_linestyles()[0][1])
+        self.assertIsNotNone(collections[0].get_linestyles()[1][1])
+        self.assertEqual(collections[1].zorder, 3)
+
+    def test_plot_labels_skip_empty(self):
+        for energy in range(10):
+            self.ed.add_level(energy, 'L%d' % energy)
+        self.ed.plot()
+        # top and bottom texts only, one artist per style
+        self.assertEqual(len(self.ed.label_artists), 2)
+        self.assertEqual(sum(len(a) for a in self.ed.label_artists), 20)
+        self.ed.batch_rendering = False
+        self.ed.plot()
+        self.assertEqual(len(self.ed.label_artists), 20)
+
+    def test_orbital_boxes_vertices(self):
+        corners, spins = orbital_boxes_vertices(
+            [(0, 0, 3, 4, 1, 5), (10, 5, 2, 1, 0.5, 3)]
+        )
+        self.assertEqual(corners.shape, (5, 4, 2))
+        # 3 up and 1 down spin, then a single up spin
+        self.assertEqual(spins.shape, (5, 6, 2))
+        self.assertAlmostEqual(corners[0, 0, 0], -1.5)
+        self.assertAlmostEqual(corners[3, 0, 0], 9.5)
+
+    def test_plot_electronboxes_batched(self):
+        self.ed.add_level(0)
+        self.ed.add_level(10)
+        self.ed.add_electronbox(0, 3, 4)
+        self.ed.add_electronbox(1, 2, 2)
+        self.ed.plot()
+        self.assertEqual(len(self.ed.ax.patches), 1)
+        corners, spins = orbital_boxes_vertices(self.ed._electron_boxes_xy())
+        # 3 + 2 boxes, 3 up and 1 down spins, then 2 up spins
+        self.assertEqual((len(corners), len(spins)), (5, 6))
+        boxes = [c for c in self.ed.ax.collections if len(c.get_paths()) == 5]
+        self.assertEqual(len(boxes), 1)
+        for path, polygon in zip(boxes[0].get_paths(), corners):
+            np.testing.assert_allclose(path.vertices[:4], polygon)
+        np.testing.assert_allclose(self.ed.ax.patches[0].get_path().vertices,
+                                   spins.reshape(-1, 2))
+
+    def test_add_levels(self):
+        self.ed.add_level(0, 'Reactant')
+        self.ed.add_levels([5.5, -3], bottom_texts=['TS', 'Product'],
+                           colors=['r', 'k'])
+        self.assertEqual(list(self.ed.energies), [0, 5.5, -3])
+        self.assertEqual(list(self.ed.positions), [1, 2, 3])
+        self.assertEqual(self.ed.bottom_texts, ['Reactant', 'TS', 'Product'])
+        self.assertEqual(self.ed.top_texts, [0, 5.5, -3.0])
+        self.assertEqual(self.ed.level_kwargs[1]['color'], 'r')
+        # levels with the same style share it
+        self.assertEqual(len(self.ed._levels.styles), 2)
+        self.assertEqual(len(self.ed.links), 3)
+
+    def test_level_columns(self):
+        self.ed.add_level(0, 'A')
+        self.ed.add_level(10, 'B')
+        # the columns are changed with update_level or as a whole
+        with self.assertRaises(ValueError):
+            self.ed.energies[0] = 5
+        self.ed.energies = [1, 20]
+        self.assertEqual(list(self.ed.energies), [1, 20])
+        self.assertEqual(self.ed.top_texts, [1, 20])
+        self.assertEqual(self.ed._levels.stats.max_energy, 20)
+        self.ed.positions = [1, 1]
+        self.assertEqual(self.ed._levels.stats.unique_positions, 1)
+        self.ed.bottom_texts = ['C', 'D']
+        self.assertEqual(self.ed.level_id('D'), 1)
+        self.ed.top_texts = ['top', None]
+        self.assertEqual(self.ed.top_texts, ['top', 20])
+        with self.assertRaises(ValueError):
+            self.ed.left_texts = ['']
+
+    def test_auto_adjust_follows_new_levels(self):
+        self.ed.add_level(0)
+        self.ed.add_level(10)
+        self.ed.add_electronbox(1, 2, 3)
+        dimension = self.ed.dimension
+        self.ed.add_level(-10)
+        self.ed.add_level(20, position='last')
+        stats = self.ed._levels.stats
+        self.assertEqual(stats.energy_range, 30)
+        self.assertEqual(stats.unique_positions, 3)
+        self.ed.plot()
+        self.assertAlmostEqual(self.ed.dimension, dimension * 2)
+        # values set by the user are kept
+        self.ed.offset = 1
+        self.ed.plot()
+        self.assertEqual(self.ed.offset, 1)
+
+    def test_render_many(self):
+        self.ed.add_level(0)
+        self.ed.add_level(10)
+        self.ed.plot()
+        images = list(render_many([self.ed, self.ed], jobs=1))
+        self.assertEqual(len(images), 2)
+        self.assertTrue(images[0].startswith(b'\x89PNG'))
+        # the arguments are checked before iterating
+        with self.assertRaises(ValueError):
+            render_many([self.ed], names=['a', 'b'])
+        with tempfile.TemporaryDirectory() as out_dir:
+            paths = list(render_many([self.ed] * 3, out_dir, fmt='svg', jobs=2))
+            self.assertEqual([os.path.basename(p) for p in paths],
+                             ['diagram_00000.svg', 'diagram_00001.svg',
+                              'diagram_00002.svg'])
+            self.assertTrue(all(os.path.getsize(p) for p in paths))
+
+    def test_plot_without_pyplot(self):
+        import matplotlib.pyplot as plt
+        self.ed.add_level(0)
+        self.ed.add_level(10)
+        figures = plt.get_fignums()
+        self.ed.plot(pyplot=False)
+        self.assertEqual(plt.get_fignums(), figures)
+        self.assertIsNotNone(self.ed.fig.canvas)
+
+    def test_figure_pool(self):
+        self.ed.add_level(0, 'A')
+        self.ed.add_level(10, 'B')
+        pool = FigurePool()
+        first = pool.render(self.ed)
+        pool.render(self.ed, show_IDs=True)
+        self.assertEqual(pool.render(self.ed), first)
+        self.assertEqual(len(pool._idle), 1)
+        self.assertIsNone(self.ed.fig)
+
+    def assertRunsWithoutMatplotlib(self, statement):
+        code = ("import sys, energydiagram\n" + statement +
+                "\nsys.exit('matplotlib' in sys.modules)")
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        result = subprocess.run([sys.executable, '-c', code], cwd=root)
+        self.assertEqual(result.returncode, 0)
+
+    def test_import_does_not_load_matplotlib(self):
+        self.assertRunsWithoutMatplotlib("energydiagram.ED().add_level(0)")
+
+    def test_to_svg(self):
+        self.ed.add_level(0, 'A')
+        self.ed.add_level(10, 'B', linestyle='dashed')
+        self.ed.add_level(5, 'C', 'last')
+        self.ed.add_link(0, 1, line_order=3)
+        self.ed.add_arrow(0, 1)
+        self.ed.add_electronbox(0, 2, 3)
+        root = ElementTree.fromstring(self.ed.to_svg(show_IDs=True))
+        texts = [t.text for t in root.iter('{http://www.w3.org/2000/svg}text')]
+        for label in ['A', 'B', 'C', '0', '10', '5', '2']:
+            self.assertIn(label, texts)
+        svg = '{http://www.w3.org/2000/svg}'
+        paths = list(root.iter(svg + 'path'))
+        # the open heads of the default "<->" arrow
+        heads = [p for p in paths if p.get('stroke') == 'green' and 'L' in p.get('d')]
+        self.assertEqual(len(heads), 1)
+        self.assertEqual(heads[0].get('d').count('M'), 2)
+
+        diagram = ED()
+        diagram.add_level(0, 'A', linewidth=0)
+        diagram.add_level(10, 'B')
+        diagram.add_arrow(0, 1, arrowstyle='-|>')
+        paths = list(ElementTree.fromstring(diagram.to_svg()).iter(svg + 'path'))
+        self.assertIn('0', [p.get('stroke-width') for p in paths])
+        heads = [p for p in paths if p.get('fill') == 'green']
+        self.assertEqual(len(heads), 1)
+        self.assertEqual(heads[0].get('d').count('M'), 1)
+        self.assertTrue(heads[0].get('d').endswith('Z'))
+        self.assertRunsWithoutMatplotlib(
+            "d = energydiagram.ED(); d.add_level(0); d.add_level(1); "
+            "d.add_link(0, 1); d.add_arrow(0, 1); d.to_svg()")
+
+    def test_content_hash(self):
+        self.ed.add_level(0, 'A')
+        self.ed.add_level(10, 'B')
+        other = ED()
+        other.add_level(0, 'A')
+        other.add_level(10, 'B')
+        self.assertEqual(self.ed.content_hash('png'), other.content_hash('png'))
+        self.assertNotEqual(self.ed.content_hash('png'),
+                            self.ed.content_hash('svg'))
+        other.add_link(0, 1)
+        self.assertNotEqual(self.ed.content_hash(), other.content_hash())
+        # the order of the keyword arguments does not matter
+        first, second = ED(), ED()
+        first.add_level(0, 'A', color='r', linestyle='--', zorder=3)
+        second.add_level(0, 'A', zorder=3, linestyle='--', color='r')
+        for diagram in (first, second):
+            diagram.add_level(10, 'B')
+        first.add_link(0, 1, color='r', linewidth=2)
+        second.add_link(0, 1, linewidth=2, color='r')
+        first.add_arrow(0, 1, color='r', linestyle='-')
+        second.add_arrow(0, 1, linestyle='-', color='r')
+        self.assertEqual(first.content_hash(), second.content_hash())
+
+    def test_render_cache(self):
+        self.ed.add_level(0, 'A')
+        self.ed.add_level(10, 'B')
+        with tempfile.TemporaryDirectory() as directory:
+            cache = RenderCache(maxsize=1, directory=directory, max_bytes=10**7)
+            first = cache.render(self.ed)
+            self.assertEqual(cache.render(self.ed), first)
+            cache.render(self.ed, fmt='svg')
+            # evicted from memory, served from disk
+            self.assertEqual(cache.render(self.ed), first)
+            self.assertEqual((cache.hits, cache.disk_hits, cache.misses),
+                             (2, 1, 2))
+            # the other files of the directory are not cache entries
+            notes = os.path.join(directory, 'notes.txt')
+            with open(notes, 'w') as f:
+                f.write('keep me')
+            self.assertEqual(RenderCache(directory=directory).stats['disk_bytes'],
+                             cache.stats['disk_bytes'])
+            cache.max_bytes = 1
+            cache.put('f' * 64, 'png', b'content')
+            self.assertLessEqual(cache.stats['disk_bytes'], 1)
+            self.assertTrue(os.path.exists(notes))
+            cache.clear()
+            self.assertEqual(os.listdir(directory), ['notes.txt'])
+            with self.assertRaises(ValueError):
+                cache.put('../notes', 'txt', b'content')
+
+    def test_spread_labels(self):
+        centers = spread_labels([0, 0, 0, 1], [0, 0.5, 5, 0], [1, 1, 1, 1])
+        self.assertEqual(list(centers), [-0.25, 0.75, 5, 0])
+
+    def test_avoid_label_overlap(self):
+        self.ed.avoid_label_overlap = True
+        self.ed.add_level(0, 'A')
+        self.ed.add_level(0.2, 'B', 'last')
+        self.ed.add_level(10, 'C')
+        self.ed.plot()
+        bottom = [a for a in self.ed.label_artists if 'A' in a.get_texts()][0]
+        y = bottom.get_offsets()[:, 1]
+        self.assertGreater(abs(y[1] - y[0]), 0.2)
+
+    def test_plot_links_batched(self):
+        for energy in range(6):
+            self.ed.add_level(energy)
+        for start in range(5):
+            self.ed.add_link(start, start + 1)
+            self.ed.add_link(start, start + 1, line_order=2 + start % 2)
+        self.ed.add_link(0, 5, color='r')
+        self.ed.plot()
+        artists = self.ed.plot_links()
+        # black straight, black curves and red straight
+        self.assertEqual(len(artists), 3)
+        self.assertEqual(len(artists[0].get_segments()), 5)
+        for start, segment in enumerate(artists[0].get_segments()):
+            np.testing.assert_allclose(segment, self.ed._link_vertices(start, start + 1, 1))
+        codes = artists[1].get_path().codes
+        self.assertEqual(list(codes).count(1), 5)
+        np.testing.assert_allclose(artists[1].get_path().vertices[:3],
+                                   self.ed._link_vertices(0, 1, 2))
+        np.testing.assert_allclose(artists[2].get_segments()[0], self.ed._link_vertices(0, 5, 1))
+        np.testing.assert_allclose(artists[2].get_colors(), [[1, 0, 0, 1]])
+
+    def test_plot_arrows_batched(self):
+        for energy in (0, 10, 0.5, 5):
+            self.ed.add_level(energy)
+        self.ed.add_arrow(0, 1)
+        self.ed.add_arrow(1, 3, position='right')
+        self.ed.add_arrow(0, 2, color='r')
+        self.ed.plot()
+        artists = self.ed.plot_arrows()
+        # for green and red: shafts, heads, labels and supports
+        # plus the bar and the label on the right of the green arrow
+        self.assertEqual(len(artists), 12)
+        self.assertEqual(len(artists[0].get_segments()), 2)
+        for segment, (idx, idy, position) in zip(artists[0].get_segments(),
+                                                 [(0, 1, 'center'), (1, 3, 'right')]):
+            x, _, y1, y2 = self.ed._arrow_geometry(idx, idy, position, None)[:4]
+            np.testing.assert_allclose(segment, [[x, y1], [x, y2]])
+        from matplotlib.colors import to_rgba
+        np.testing.assert_allclose(artists[0].get_colors()[0], to_rgba('green'))
+        labels = [text for a in artists if hasattr(a, 'get_texts') for text in a.get_texts()]
+        self.assertEqual(sorted(labels), ['-0.5', '-10', '5'])
+        self.assertEqual(len(self.ed.ax.texts), 0)
+
+    def test_level_of_detail(self):
+        n = 200
+        self.ed.add_levels(range(n), positions=range(n),
+                           bottom_texts=['L%d' % i for i in range(n)])
+        self.ed.level_of_detail = True
+        self.ed.plot(pyplot=False)
+        levels = self.ed.ax.collections[0]
+        labels = self.ed.label_artists[-1]
+        # zoomed out: every level is shown and the labels are hidden
+        self.assertEqual(len(levels.get_segments()), n)
+        self.assertEqual(len(labels), 0)
+        step = self.ed.dimension + self.ed.space
+        self.ed.ax.set_xlim(10 * step, 13 * step)
+        self.ed.ax.set_ylim(0, n)
+        self.assertLess(len(levels.get_segments()), 10)
+        self.assertIn('L11', labels.get_texts())
+        self.assertNotIn('L100', labels.get_texts())
+
+    def test_profile(self):
+        self.ed.add_level(0)
+        self.ed.add_level(10)
+        self.ed.add_link(0, 1)
+        self.ed.plot(pyplot=False)
+        self.assertIsNone(self.ed.last_render_stats)
+        reports = []
+        self.ed.profile = reports.append
+        self.ed.plot(pyplot=False)
+        self.ed.savefig(io.BytesIO(), format='png')
+        stats = self.ed.last_render_stats
+        self.assertEqual(reports, [stats, stats])
+        phases = stats.as_dict()['phases']
+        for name in ('setup', 'auto_adjust', 'levels', 'labels', 'links',
+                     'savefig'):
+            self.assertIn(name, phases)
+        self.assertEqual(phases['levels']['artists'], 1)
+        self.assertEqual(phases['links']['artists'], 1)
+        self.assertGreater(phases['savefig']['seconds'], 0)
+
+    def test_save_load(self):
+        self.ed.add_level(0, 'Reactant')
+        self.ed.add_level(10.5, 'TS', top_text='top', linestyle=(0, (5, 2)))
+        self.ed.add_level(-3, 'Product', 'last', right_text='P')
+        self.ed.add_link(0, 1, line_order=2)
+        self.ed.add_arrow(1, 2, position='right', color='r')
+        self.ed.add_electronbox(2, 2, 3)
+        self.ed.offset = 1
+        with tempfile.TemporaryDirectory() as directory:
+            fname = os.path.join(directory, 'diagram.ed')
+            self.ed.save(fname)
+            for mmap in (True, False):
+                loaded = ED.load(fname, mmap=mmap)
+                self.assertEqual(loaded.content_hash(), self.ed.content_hash())
+                self.assertEqual(loaded.arrows[1],
+                                 [(2, 'right', None, {'color': 'r'})])
+                self.assertEqual(loaded.level_kwargs[1]['linestyle'], (0, (5, 2)))
+                self.assertEqual(loaded.offset, 1)
+            loaded.add_level(5, 'New')
+            loaded.add_link(3, 0)
+            # the texts that are not strings keep their type
+            numbers = ED()
+            numbers.add_level(0, 1, top_text=2.5, right_text=True)
+            numbers.add_level(1, '1')
+            numbers.add_arrow(0, 1, text=3)
+            numbers_fname = os.path.join(directory, 'numbers.ed')
+            numbers.save(numbers_fname)
+            loaded_numbers = ED.load(numbers_fname)
+            self.assertEqual(loaded_numbers.bottom_texts, [1, '1'])
+            self.assertIsInstance(loaded_numbers.bottom_texts[0], int)
+            self.assertIsInstance(loaded_numbers.top_texts[0], float)
+            self.assertIs(loaded_numbers.right_texts[0], True)
+            self.assertEqual(loaded_numbers.arrows[0], [(1, 'center', 3, {})])
+            self.assertEqual(loaded_numbers.content_hash(), numbers.content_hash())
+            self.assertEqual(loaded.bottom_texts[-2:], ['Product', 'New'])
+            self.assertEqual(len(loaded.links), 4)
+            copy = pickle.loads(pickle.dumps(ED.load(fname)))
+            self.assertEqual(copy.content_hash(), self.ed.content_hash())
+
+    def test_from_table(self):
+        self.ed.add_level(0, 'Reactant')
+        self.ed.add_level(10.5, 'TS', color='r')
+        self.ed.add_level(-3, 'Product', 'last', top_text='P')
+        self.ed.add_link(0, 1, line_order=2)
+        self.ed.add_arrow(0, 2, position='right')
+        with tempfile.TemporaryDirectory() as directory:
+            levels = os.path.join(directory, 'levels.csv')
+            links = os.path.join(directory, 'links.csv')
+            with open(levels, 'w') as f:
+                f.write('E,position,name,top_text,color\n'
+                        '0,,Reactant,,\n'
+                        '10.5,,TS,,r\n'
+                        '-3,last,Product,P,\n')
+            with open(links, 'w') as f:
+                f.write('start,end,line_order\n0,1,2\n')
+            arrows = {'start': [0], 'end': [2], 'position': ['right']}
+            diagram = ED.from_table(levels, links, arrows, chunksize=2,
+                                    columns={'energy': 'E', 'bottom_text': 'name'})
+        self.assertEqual(diagram.content_hash(), self.ed.content_hash())
+
+    def test_from_table_ragged_rows(self):
+        with tempfile.TemporaryDirectory() as directory:
+            levels = os.path.join(directory, 'levels.csv')
+            with open(levels, 'w') as f:
+                f.write('energy,bottom_text\n1,a\n2\n\n3,c\n')
+            # the missing cells are empty
+            diagram = ED.from_table(levels)
+            self.assertEqual(list(diagram.energies), [1, 2, 3])
+            self.assertEqual(diagram.bottom_texts, ['a', '', 'c'])
+            with open(levels, 'w') as f:
+                f.write('energy,bottom_text\n1,a\n2,b,extra\n')
+            with self.assertRaisesRegex(ValueError, 'Line 3 '):
+                ED.from_table(levels)
+
+    def test_level_names(self):
+        self.ed.add_level(0, 'Reactant')
+        self.ed.add_level(10, 'TS', key='TS1')
+        self.ed.add_level(12, 'TS', 'Reactant', key='TS2')
+        self.ed.add_level(-5, 'Product')
+        self.ed.add_link('Reactant', 'TS1')
+        self.ed.add_arrow('TS2', 'Product')
+        self.ed.add_electronbox('Product', 2, 3)
+        self.assertEqual(self.ed.links[0][0][0], 1)
+        self.assertEqual(self.ed.arrows[2][0][0], 3)
+        self.assertEqual(self.ed.electons_boxes[0][0], 3)
+        self.assertEqual(self.ed.column('Reactant'), [0, 2])
+        self.assertEqual(self.ed.column(), [3])
+        with self.assertRaises(KeyError):
+            self.ed.level_id('TS')
+        with self.assertRaises(ValueError):
+            self.ed.add_level(1, key='TS1')
+        with tempfile.TemporaryDirectory() as directory:
+            fname = os.path.join(directory, 'diagram.ed')
+            self.ed.save(fname)
+            self.assertEqual(ED.load(fname).level_id('TS2'), 2)
+
+    def test_from_logs(self):
+        from energydiagram.qc import ParseCache
+        outputs = {
+            'reactant.log': ' Entering Gaussian System\n'
+                            ' SCF Done:  E(RB3LYP) =  -100.500000000     A.U.\n'
+                            + ' ' * 200000 + '\n'
+                            ' Sum of electronic and thermal Free Energies=  -100.000000\n',
+            'ts.out': '* O   R   C   A *\n'
+                      'FINAL SINGLE POINT ENERGY      -99.990000000000\n',
+            'product.out': '|  x T B  |\n'
+                           '| TOTAL ENERGY   -100.020000000000 Eh   |\n',
+        }
+        with tempfile.TemporaryDirectory() as directory:
+            paths = []
+            for name, content in outputs.items():
+                paths.append(os.path.join(directory, name))
+                with open(paths[-1], 'w') as f:
+                    f.write(content)
+            cache = os.path.join(directory, 'energies.json')
+            # only the reactant has a Gibbs free energy, the SCF energies of
+            # all the files are compared
+            with self.assertWarns(UserWarning):
+                diagram = ED.from_logs(paths, jobs=1, cache=cache)
+            self.assertEqual(diagram.bottom_texts, ['reactant', 'ts', 'product'])
+            for energy, expected in zip(diagram.energies, [0, 320.029832, 301.204548]):
+                self.assertAlmostEqual(energy, expected, places=5)
+            parsed = ParseCache(cache)
+            scf = ED.from_logs(paths, quantity='scf', unit='eV', reference=None,
+                               jobs=1, cache=parsed)
+            self.assertAlmostEqual(scf.energies[0], -100.5 * 27.211386245988)
+            with self.assertWarns(UserWarning):
+                ED.from_logs(paths, jobs=1, cache=parsed)
+            self.assertEqual((parsed.hits, parsed.misses), (9, 0))
+            gibbs = ED.from_logs(paths[:1], quantity='auto', reference=None,
+                                 unit='hartree', jobs=1)
+            self.assertAlmostEqual(gibbs.energies[0], -100.0)
+            with self.assertRaises(ValueError):
+                ED.from_logs(paths, quantity='gibbs', jobs=1)
+
+    def test_update_level_refresh(self):
+        self.ed.add_level(0, 'Reactant')
+        self.ed.add_level(10, 'TS')
+        self.ed.add_level(-5, 'Product')
+        self.ed.add_link(0, 1)
+        self.ed.add_arrow(0, 2)
+        with self.assertRaises(RuntimeError):
+            self.ed.refresh()
+        self.ed.plot(pyplot=False)
+        self.ed.fig.canvas.draw()
+        lines = [artist for artist in self.ed.ax.collections if len(artist.get_segments()) == 3]
+        self.assertTrue(lines)
+        self.ed.update_level('TS', energy=12, color='r')
+        self.ed.refresh()
+        self.assertEqual(self.ed.energies[1], 12)
+        self.assertTrue(all(artist.axes is self.ed.ax for artist in lines))
+        texts = [text for artist in self.ed.label_artists for text in artist.get_texts()]
+        self.assertIn('12', texts)
+        self.assertNotIn('10', texts)
+        self.ed.update_level(2, energy=-8)
+        self.ed.refresh(blit=False)
+        texts = [text for artist in self.ed.label_artists for text in artist.get_texts()]
+        self.assertIn('-8', texts)
+        self.assertLessEqual(self.ed.ax.get_ylim()[0], -8)
+        self.ed.fig.savefig(io.BytesIO(), format='png')
+
+    def test_animate(self):
+        from PIL import Image
+        self.ed.add_level(0, 'Reactant')
+        self.ed.add_level(10, 'TS')
+        self.ed.add_level(-5, 'Product')
+        self.ed.add_link(0, 1)
+        self.ed.add_arrow(0, 2)
+        frames = [[0, 10 + i, -5 - i] for i in range(5)]
+        with self.assertRaises(ValueError):
+            self.ed.animate([[0, 1]])
+        with tempfile.TemporaryDirectory() as directory:
+            fname = os.path.join(directory, 'profile.gif')
+            self.assertEqual(self.ed.animate(frames, fname, fps=10), fname)
+            with Image.open(fname) as gif:
+                self.assertEqual(gif.n_frames, 5)
+                self.assertEqual(gif.size, tuple(self.ed.fig.canvas.get_width_height()))
+        # the figure shows the last frame, the diagram keeps its levels
+        self.assertLessEqual(self.ed.ax.get_ylim()[0], -9)
+        self.assertGreaterEqual(self.ed.ax.get_ylim()[1], 14)
+        texts = [text for artist in self.ed.label_artists for text in artist.get_texts()]
+        self.assertIn('14', texts)
+        self.assertEqual(list(self.ed.energies), [0, 10, -5])
+        self.assertEqual(self.ed.top_texts, [0, 10, -5])
+        stats = self.ed._levels.stats
+        self.assertEqual((stats.min_energy, stats.max_energy), (-5, 10))
+
+        class FailingStream:
+            def write(self, rgba):
+                raise ValueError('disk full')
+
+            def close(self):
+                raise OSError('incomplete file')
+
+        from unittest import mock
+        with mock.patch('energydiagram.animation.open_stream', return_value=FailingStream()):
+            with self.assertRaisesRegex(ValueError, 'disk full'):
+                self.ed.animate(frames, 'profile.gif')
+
+    def test_auto_layout(self):
+        from energydiagram.layout import layered_positions, longest_path_layers
+        self.assertEqual(list(longest_path_layers(5, [0, 1, 2, 3, 0], [1, 2, 0, 4, 3])),
+                         [0, 1, 2, 1, 2])
+        self.assertEqual(list(layered_positions([0, 1, 2], [0, 0], [1, 2])), [1, 2, 2])
+        self.assertEqual(list(layered_positions([0, 1, 2], [0, 0], [1, 2], gap=5)), [1, 2, 3])
+        for energy, name in [(0, 'R'), (10, 'TS1'), (-5, 'I'), (12, 'TS2'), (-10, 'P')]:
+            self.ed.add_level(energy, name, 'last')
+        self.ed.add_link('R', 'TS1')
+        self.ed.add_link('TS1', 'I')
+        self.ed.add_link('I', 'TS2')
+        self.ed.add_link('TS2', 'P')
+        self.ed.add_arrow('P', 'R')
+        self.ed.auto_layout(gap=0)
+        self.assertEqual(list(self.ed.positions), [1, 2, 3, 4, 5])
+        self.assertEqual(self.ed.pos_number, 5)
+        self.ed.plot(pyplot=False)
+
+    def test_grid(self):
+        diagrams = []
+        for shift in (0, 10):
+            diagram = ED()
+            diagram.add_level(0, 'R')
+            diagram.add_level(20 + shift, 'TS')
+            diagram.add_level(-5, 'P', color='b')
+            diagram.add_link('R', 'TS')
+            diagram.add_arrow('R', 'P')
+            diagrams.append(diagram)
+        diagrams[1].add_level(-8, 'P2')
+        with self.assertRaises(ValueError):
+            EDGrid(diagrams, titles=['a'])
+        grid = EDGrid(diagrams, titles=['gas', 'water'])
+        self.assertAlmostEqual(grid.shared_layout()['offset'], 38 * 0.02)
+        grid.plot(pyplot=False)
+        self.assertEqual(len(grid.axes), 2)
+        self.assertEqual(grid.axes[0].get_ylim(), grid.axes[1].get_ylim())
+        self.assertEqual(grid.axes[0].get_xlim(), grid.axes[1].get_xlim())
+        self.assertEqual(grid.panels[0].dimension, grid.panels[1].dimension)
+        # the diagrams of the caller keep their own layout and figure
+        self.assertEqual(diagrams[0].dimension, 'auto')
+        self.assertIsNone(diagrams[0].ax)
+        diagrams[0].plot(pyplot=False)
+        self.assertNotEqual(diagrams[0].dimension, grid.panels[0].dimension)
+        self.assertGreaterEqual(grid.axes[0].get_ylim()[1], 30)
+        grid.plot(overlay=True, pyplot=False)
+        merged = grid.overlay
+        self.assertEqual(grid.panels, [])
+        self.assertEqual(merged.dimension, grid.shared_layout()['dimension'])
+        self.assertEqual(list(merged.energies), [0, 20, -5, 0, 30, -5, -8])
+        self.assertEqual(merged.links[3], [(4, {'line_order': 1, 'color': 'C1', 'ls': 'dashed', 'lw': 1.0})])
+        self.assertEqual(merged.bottom_texts, ['R', 'TS', 'P', '', '', '', ''])
+        self.assertEqual(merged.level_kwargs[2]['color'], 'C0')
+        self.assertEqual(len(grid.axes[0].get_legend().get_texts()), 2)
+        grid.fig.savefig(io.BytesIO(), format='png')
+
+    def test_set_units(self):
+        self.ed.add_level(0, 'Reactant')
+        self.ed.add_level(10, 'TS')
+        self.ed.add_levels([-0.01], bottom_texts=['Product'], unit='hartree')
+        self.assertAlmostEqual(self.ed.energies[2], -6.2750947406)
+        self.ed.add_arrow('Reactant', 'TS')
+        self.ed.round_energies_at_digit = 1
+        self.assertEqual(self.ed.top_texts[:2], [0, 10])
+        self.ed.set_units('kJ/mol', reference='TS')
+        factor = 2625.4996394799 / 627.50947406
+        self.assertAlmostEqual(self.ed.energies[0], -10 * factor)
+        self.assertEqual(self.ed.energies[1], 0)
+        self.assertEqual(self.ed.top_texts[:2], [-41.8, 0.0])
+        self.ed.plot(pyplot=False)
+        self.assertEqual(self.ed.ax.get_ylabel(), 'Energy / $kJ$ $mol^{-1}$')
+        texts = [text for artist in self.ed.label_artists for text in artist.get_texts()]
+        self.assertIn('-68.1', texts)
+        gaps = [artist for artist in self.ed.ax.artists
+                if artist not in self.ed.label_artists and hasattr(artist, 'get_texts')]
+        self.assertEqual(gaps[0].get_texts(), ['-41.8'])
+        self.ed.set_units('eV', reference='min')
+        self.assertEqual(self.ed.energies.min(), 0)
+        # a number is a level, an energy is given as reference_energy
+        with self.assertRaises(TypeError):
+            self.ed.set_units('eV', reference=0.0)
+        self.ed.set_units('eV', reference=1)
+        self.assertEqual(self.ed.energies[1], 0)
+        self.ed.set_units('eV', reference_energy=-1.0)
+        self.assertEqual(self.ed.energies[1], 1)
+        self.ed.refresh(blit=False)
+        self.assertEqual(self.ed.ax.get_ylabel(), 'Energy / $eV$')
+        self.assertIn('Energy / eV', self.ed.to_svg())
+
+    def test_pickle_keeps_auto_layout(self):
+        self.ed.add_level(0, 'Reactant')
+        self.ed.add_level(5, 'TS')
+        self.ed.add_electronbox(0, 2, 3)
+        copy = pickle.loads(pickle.dumps(self.ed))
+        self.ed.add_level(-60, 'Product')
+        copy.add_level(-60, 'Product')
+        self.ed.plot(pyplot=False)
+        copy.plot(pyplot=False)
+        for name in ('dimension', 'space', 'offset'):
+            self.assertEqual(getattr(copy, name), getattr(self.ed, name))
+        self.assertAlmostEqual(self.ed.offset, 65 * 0.02)
+        self.ed.dimension = 3
+        copy = pickle.loads(pickle.dumps(self.ed))
+        copy.add_level(100, 'P2')
+        copy.plot(pyplot=False)
+        self.assertEqual(copy.dimension, 3)
+        self.assertEqual(copy._plot_parameters()['space'], 'auto')
+
+    def test_arrow_styles_batched(self):
+        from matplotlib.text import Annotation
+        for energy in (0, 10, 4):
+            self.ed.add_level(energy)
+        self.ed.add_arrow(0, 1, arrowstyle='->')
+        self.ed.add_arrow(1, 2, arrowstyle='-')
+        self.ed.add_arrow(0, 2, shrinkA=5)
+        self.ed.plot(pyplot=False)
+        heads = [line for line in self.ed.ax.lines if line.get_marker() not in ('None', None)]
+        # '->' has a single head on the start level, '-' none
+        self.assertEqual(len(heads), 1)
+        self.assertEqual(list(heads[0].get_ydata()), [0])
+        # shrinking is drawn by annotate
+        annotations = [text for text in self.ed.ax.texts if isinstance(text, Annotation)]
+        self.assertEqual(len(annotations), 1)
+        self.assertEqual(annotations[0].arrowprops['shrinkA'], 5)
+
+    def test_add_level_matches_add_levels(self):
+        other = ED()
+        for energy, color in ((0, 'k'), (1.5, 'r'), (-3, 'k')):
+            self.ed.add_level(energy, 'L', top_text=None, color=color)
+        other.add_levels([0, 1.5, -3], bottom_texts=['L'] * 3, colors=['k', 'r', 'k'])
+        self.ed.add_level(0.001, 'H', unit='hartree', linestyle='--')
+        other.add_levels([0.001], bottom_texts=['H'], unit='hartree', linestyle='--')
+        self.assertEqual(list(self.ed.energies), list(other.energies))
+        self.assertEqual(self.ed.top_texts, other.top_texts)
+        self.assertEqual(self.ed.level_kwargs, other.level_kwargs)
+        self.assertEqual(len(self.ed._levels.styles), 3)
+        self.assertEqual(self.ed._levels.stats.columns, {1.0: 1, 2.0: 1, 3.0: 1, 4.0: 1})
+
+    def test_pool_render_keeps_plotted_state(self):
+        self.ed.add_level(0, 'Reactant')
+        self.ed.add_level(10, 'TS')
+        self.ed.plot(pyplot=False)
+        fig, ax = self.ed.fig, self.ed.ax
+        content = FigurePool().render(self.ed)
+        self.assertTrue(content.startswith(b'\x89PNG'))
+        RenderCache().render(self.ed)
+        self.assertIs(self.ed.fig, fig)
+        self.assertIs(self.ed.ax, ax)
+        self.ed.update_level('TS', energy=12)
+        self.ed.refresh(blit=False)
+        texts = [text for artist in self.ed.label_artists for text in artist.get_texts()]
+        self.assertIn('12', texts)
+
+    def test_render_cache_overwrite_counted_once(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = RenderCache(directory=directory)
+            cache.put('a' * 64, 'png', b'12345')
+            cache.put('a' * 64, 'png', b'123')
+            self.assertEqual(cache.stats['disk_bytes'], 3)
+            cache.put('b' * 64, 'png', b'12')
+            self.assertEqual(cache.stats['disk_bytes'], 5)
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file